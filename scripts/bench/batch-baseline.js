@@ -0,0 +1,57 @@
+/**
+ * Line-join $batch encoder the byte-exact encoder (srv/lib/batch-encoder.js)
+ * replaced: every line is rebuilt and joined as a string on each call.
+ * Kept as the reference for scripts/bench/batch-encoder.js and
+ * test/batch-encoder.test.js; the output must stay byte-identical.
+ */
+const { buildFilter } = require('../../srv/lib/batch-payload');
+
+const HOST = 's4-sb4:44380';
+
+function joinMerge(fields, batch, changeset) {
+  const mergeBody = JSON.stringify({
+    RequirementSegment: fields.RequirementSegment,
+    Plant: fields.Plant,
+    StorageLocation: fields.StorageLocation,
+    RFM_SD_ApplJobAction: '01',
+    InternalComment: 'Mass Field Update from Joule',
+    SalesOrdItemIsSelected: 'X',
+    SalesOrdItemsAreSelected: 'X'
+  });
+  return [
+    `--${batch}`, `Content-Type: multipart/mixed; boundary=${changeset}`, '', `--${changeset}`,
+    'Content-Type: application/http', 'Content-Transfer-Encoding: binary', '',
+    'MERGE C_RFM_MaSaDoEditSlsOrdItm(SalesOrder=\'100001681\',SalesOrderItem=\'000010\')?sap-client=200 HTTP/1.1',
+    `Host: ${HOST}`, 'Content-Type: application/json', `Content-Length: ${Buffer.byteLength(mergeBody)}`,
+    'Accept: application/json', '', mergeBody, `--${changeset}--`, ''
+  ];
+}
+
+function joinGet(filters, batch) {
+  return [
+    `--${batch}`, 'Content-Type: application/http', 'Content-Transfer-Encoding: binary', '',
+    `GET C_RFM_MaSaDoEditSlsOrdItm?$top=1&sap-client=200&$filter=${buildFilter(filters)} HTTP/1.1`,
+    `Host: ${HOST}`, 'Accept: application/json', '', ''
+  ];
+}
+
+/**
+ * One MERGE changeset plus GET selection per entry, like buildBulkBatchPayload
+ * @param {Object[]} entries - [{ filters, fieldsToUpdate }]
+ * @param {string} boundary - Batch boundary, e.g. 'batch_Test01'
+ * @returns {Buffer} Body
+ */
+function joinBatchPayload(entries, boundary) {
+  const id = boundary.replace(/^batch_/, '');
+  return Buffer.from([
+    ...entries.flatMap(({ filters, fieldsToUpdate }, i) => [
+      ...joinMerge(fieldsToUpdate, boundary, `changeset_${id}_${i + 1}`),
+      ...joinGet(filters, boundary)
+    ]),
+    `--${boundary}--`
+  ].join('\r\n'));
+}
+
+module.exports = {
+  joinBatchPayload
+};
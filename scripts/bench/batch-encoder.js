@@ -0,0 +1,57 @@
+/**
+ * Microbenchmark for the $batch encoder
+ * Compares buildBatchPayload / buildBulkBatchPayload (static template
+ * segments built once, one UTF-8 encode per call) with the previous
+ * line-join implementation (scripts/bench/batch-baseline.js).
+ * Both sides do the same per-call work around the encoding: one random
+ * batch boundary and the payload_build metric.
+ *
+ * Usage: npm run bench:batch [-- <iterations>]
+ */
+const { buildBatchPayload, buildBulkBatchPayload } = require('../../srv/lib/batch-payload');
+const { newBoundary } = require('../../srv/lib/batch-encoder');
+const { observeStage } = require('../../srv/lib/metrics');
+const { joinBatchPayload } = require('./batch-baseline');
+
+const ITERATIONS = Number(process.argv[2]) || 100000;
+
+const filters = { materialStartsWith: 'MAT', plant: '1000', salesOrg: '1710', creationDate: '2025-01-01' };
+const fields = { RequirementSegment: 'SEGMENT-A', Plant: '1000', StorageLocation: '0001' };
+const bulk = Array.from({ length: 10 }, (_, i) => ({
+  filters: { ...filters, plant: String(1000 + i) },
+  fieldsToUpdate: { ...fields, Plant: String(1000 + i) }
+}));
+
+function baselinePayload(entries) {
+  const start = process.hrtime.bigint();
+  const body = joinBatchPayload(entries, newBoundary('batch'));
+  observeStage('payload_build', start);
+  return body;
+}
+
+const baseline = {
+  single: () => baselinePayload([{ filters, fieldsToUpdate: fields }]),
+  bulk: () => baselinePayload(bulk)
+};
+
+const encoder = {
+  single: () => buildBatchPayload(filters, fields).body,
+  bulk: () => buildBulkBatchPayload(bulk).body
+};
+
+function measure(fn) {
+  for (let i = 0; i < 1000; i++) fn(); // warm-up
+  const start = process.hrtime.bigint();
+  let bytes = 0;
+  for (let i = 0; i < ITERATIONS; i++) bytes += fn().length;
+  const ns = Number(process.hrtime.bigint() - start);
+  return { opsPerSec: Math.round(ITERATIONS / (ns / 1e9)), usPerOp: (ns / ITERATIONS / 1000).toFixed(2), bytesPerOp: bytes / ITERATIONS };
+}
+
+const rows = [];
+for (const scenario of ['single', 'bulk']) {
+  rows.push({ scenario, implementation: 'line join', ...measure(baseline[scenario]) });
+  rows.push({ scenario, implementation: 'encoder', ...measure(encoder[scenario]) });
+}
+console.log(`${ITERATIONS} iterations per row`);
+console.table(rows);
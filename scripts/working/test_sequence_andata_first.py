@@ -140,6 +140,25 @@ def ritorno(token):
     
     return result
 
+def wait_for_job(token, job_id):
+    """Attende il completamento del job (long-poll lato servizio)"""
+    print(f"\nAttendo il completamento del job {job_id}...")
+    response = requests.post(
+        f"{SERVICE_URL}/waitForMassChange",
+        headers={
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        },
+        json={"jobID": job_id, "timeoutSeconds": 60}
+    )
+    response.raise_for_status()
+    result = response.json()
+    
+    print(f"Esito: {result.get('status')} | Job: {result.get('jobStatus')} | "
+          f"{result.get('elapsedMs')} ms, {result.get('polls')} poll")
+    
+    return result
+
 def main():
     print(f"\n{'#'*60}")
     print(f"# TEST SEQUENCE: READ -> ANDATA -> READ -> RITORNO -> READ")
@@ -156,18 +175,16 @@ def main():
     time.sleep(2)
     
     # 2. ANDATA (142A -> 140A)
-    andata(token)
-    print("\nAttendo 5 secondi per il completamento del job...")
-    time.sleep(5)
+    job = andata(token)
+    wait_for_job(token, job.get('ID'))
     
     # 3. READ dopo ANDATA (dovrebbe trovare ordine in 140A)
     read_orders(token, "140A")
     time.sleep(2)
     
     # 4. RITORNO (140A -> 142A)
-    ritorno(token)
-    print("\nAttendo 5 secondi per il completamento del job...")
-    time.sleep(5)
+    job = ritorno(token)
+    wait_for_job(token, job.get('ID'))
     
     # 5. READ finale (dovrebbe trovare ordine in 142A)
     read_orders(token, "142A")
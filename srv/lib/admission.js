@@ -0,0 +1,139 @@
+const cds = require('@sap/cds');
+
+/**
+ * Admission control toward each S/4HANA backend
+ * At most maxConcurrent requests run against a backend at once, further
+ * requests wait in a bounded FIFO queue. When the queue is full, or a request
+ * waited longer than queueTimeout, it fails fast with an OverloadError that
+ * carries the HTTP status and Retry-After value to send back.
+ *
+ * Configured via cds.s4.admission:
+ * - maxConcurrent : requests running against one backend
+ * - maxQueue      : requests waiting for a slot
+ * - queueTimeout  : max wait for a slot
+ * - retryAfter    : seconds suggested to callers that were rejected
+ */
+
+const DEFAULTS = {
+  maxConcurrent: 8,
+  maxQueue: 32,
+  queueTimeout: 10000,
+  retryAfter: 5
+};
+
+function config() {
+  return { ...DEFAULTS, ...cds.env.s4?.admission };
+}
+
+/**
+ * Request rejected by admission control
+ */
+class OverloadError extends Error {
+  constructor(backend, reason, status) {
+    const { retryAfter } = config();
+    super(`S/4HANA backend ${backend} is overloaded (${reason}), retry after ${retryAfter}s`);
+    this.name = 'OverloadError';
+    this.status = status;
+    this.retryAfter = retryAfter;
+  }
+}
+
+class Limiter {
+  constructor(name) {
+    this.name = name;
+    this.active = 0;
+    this.waiting = []; // [{ resolve, reject, enqueuedAt, timer }]
+    this.stats = { admitted: 0, queued: 0, dequeued: 0, rejected: 0, timedOut: 0, queueTimeTotalMs: 0, queueTimeMaxMs: 0 };
+  }
+
+  acquire() {
+    const { maxConcurrent, maxQueue, queueTimeout } = config();
+    if (this.active < maxConcurrent && !this.waiting.length) {
+      this.active++;
+      this.stats.admitted++;
+      return Promise.resolve();
+    }
+    if (this.waiting.length >= maxQueue) {
+      this.stats.rejected++;
+      return Promise.reject(new OverloadError(this.name, 'queue full', 503));
+    }
+
+    this.stats.queued++;
+    return new Promise((resolve, reject) => {
+      const waiter = { resolve, reject, enqueuedAt: Date.now() };
+      waiter.timer = setTimeout(() => {
+        this.waiting.splice(this.waiting.indexOf(waiter), 1);
+        this.stats.timedOut++;
+        reject(new OverloadError(this.name, 'queue timeout', 503));
+      }, queueTimeout);
+      this.waiting.push(waiter);
+    });
+  }
+
+  release() {
+    const next = this.waiting.shift();
+    if (!next) {
+      this.active--;
+      return;
+    }
+    // Hand the slot over directly, active stays the same
+    clearTimeout(next.timer);
+    const waited = Date.now() - next.enqueuedAt;
+    this.stats.admitted++;
+    this.stats.dequeued++;
+    this.stats.queueTimeTotalMs += waited;
+    this.stats.queueTimeMaxMs = Math.max(this.stats.queueTimeMaxMs, waited);
+    next.resolve();
+  }
+
+  async run(fn) {
+    await this.acquire();
+    try {
+      return await fn();
+    } finally {
+      this.release();
+    }
+  }
+}
+
+const limiters = new Map(); // backend -> Limiter
+
+function limiterFor(backend) {
+  if (!limiters.has(backend)) limiters.set(backend, new Limiter(backend));
+  return limiters.get(backend);
+}
+
+/**
+ * Runs fn once the backend has a free slot
+ * @param {string} backend - Backend name, e.g. the destination name
+ * @param {Function} fn - async () => result
+ * @returns {Promise<*>} Result of fn
+ * @throws {OverloadError} When the queue is full or the wait timed out
+ */
+function withAdmission(backend, fn) {
+  return limiterFor(backend).run(fn);
+}
+
+/**
+ * Admission counters per backend
+ * @returns {Object[]}
+ */
+function getAdmissionStats() {
+  const { maxConcurrent, maxQueue, queueTimeout } = config();
+  return [...limiters.values()].map(limiter => ({
+    backend: limiter.name,
+    maxConcurrent,
+    maxQueue,
+    queueTimeout,
+    active: limiter.active,
+    waiting: limiter.waiting.length,
+    ...limiter.stats,
+    queueTimeAvgMs: limiter.stats.dequeued ? Math.round(limiter.stats.queueTimeTotalMs / limiter.stats.dequeued) : 0
+  }));
+}
+
+module.exports = {
+  OverloadError,
+  withAdmission,
+  getAdmissionStats
+};
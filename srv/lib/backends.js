@@ -0,0 +1,280 @@
+const cds = require('@sap/cds');
+const { executeHttpRequest } = require('@sap-cloud-sdk/http-client');
+const { executeWithDestination } = require('./destination-cache');
+const { agentConfig, getAgents } = require('./connection-pool');
+const { isCircuitOpen } = require('./resilience');
+const { logger } = require('./logger');
+
+const LOG = logger('backends');
+
+/**
+ * Registry of the S/4HANA systems serving RFM_MANAGE_SALES_ORDERS_SRV
+ * Every backend has its own connection pool, CSRF session, admission limiter
+ * and circuit breaker (all keyed by the backend name), plus a latency EWMA
+ * of its responses. Actions pass an explicit `target` or are routed by
+ * routeBackend(): among the backends serving the role ('read' or 'write')
+ * and whose circuit is not open, one is picked at random with probability
+ * proportional to weight / (latency EWMA x (1 + requests in flight)).
+ * Backends with weight 0 are standbys, used only when no weighted backend
+ * is healthy. Routed reads assume the backends of the role hold the same data.
+ *
+ * Configured via cds.s4.backends (package.json or env), one entry per name:
+ * - destination        : BTP destination name (OnPremise via Cloud Connector), or
+ * - url                : base URL for direct calls, with username / password for basic auth
+ * - rejectUnauthorized : false to accept self-signed certificates (direct calls)
+ * - host               : Host header inside the $batch parts, defaults to the url's host
+ * - servicePath        : path of the OData service
+ * - roles              : action kinds routed to it, ['read', 'write']; [] = explicit target / probes only
+ * - weight             : share of the routed traffic, 0 = standby
+ * - pool               : overrides of cds.s4.pool for its connection pool
+ * - label              : name shown by testS4Endpoints
+ * and cds.s4.routing:
+ * - default        : backend used when nothing is routed (metadata, warm-up)
+ * - ewmaAlpha      : weight of the newest sample in the latency EWMA
+ * - initialLatency : ms assumed for a backend before its first response
+ *
+ * Credentials of direct backends never go into package.json: set them in the
+ * environment (cds_s4_backends_<name>_username / cds_s4_backends_<name>_password,
+ * e.g. with cf set-env) or move the system behind a BTP destination.
+ * A direct backend with a username but no password is rejected at registration.
+ */
+
+const SERVICE_PATH = '/sap/opu/odata/sap/RFM_MANAGE_SALES_ORDERS_SRV';
+
+const DEFAULT_BACKENDS = {
+  S4HANA_PCE_SSO: { destination: 'S4HANA_PCE_SSO', host: 's4-sb4:44380', roles: ['read', 'write'], weight: 1 }
+};
+
+const DEFAULTS = {
+  default: 'S4HANA_PCE_SSO',
+  ewmaAlpha: 0.3,
+  initialLatency: 500
+};
+
+const states = new Map(); // backend name -> { ewmaMs, inFlight, calls, failures, lastError }
+let backends;             // backend name -> backend, built on first use
+
+function config() {
+  return { ...DEFAULTS, ...cds.env.s4?.routing };
+}
+
+function createBackend(name, definition) {
+  if (!definition.destination && !definition.url) {
+    throw new Error(`Backend ${name} needs a destination or a url (cds.s4.backends)`);
+  }
+  if (definition.url && definition.username && !definition.password) {
+    throw new Error(`Backend ${name} has a username but no password (set cds_s4_backends_${name}_password)`);
+  }
+  const host = definition.host || (definition.url ? new URL(definition.url).host : undefined);
+  return {
+    name,
+    label: definition.label || `${name} (${host || definition.destination})`,
+    destination: definition.destination,
+    url: definition.url?.replace(/\/$/, ''),
+    username: definition.username,
+    password: definition.password,
+    rejectUnauthorized: definition.rejectUnauthorized,
+    host,
+    servicePath: definition.servicePath || SERVICE_PATH,
+    roles: definition.roles || ['read', 'write'],
+    weight: definition.weight ?? 1,
+    pool: definition.pool
+  };
+}
+
+function registry() {
+  if (!backends) {
+    const definitions = cds.env.s4?.backends || DEFAULT_BACKENDS;
+    backends = new Map(Object.entries(definitions).map(([name, definition]) => [name, createBackend(name, definition)]));
+    LOG.info('Backends registered', () => ({
+      backends: [...backends.values()].map(({ name, roles, weight }) => ({ name, roles, weight }))
+    }));
+  }
+  return backends;
+}
+
+function stateOf(backend) {
+  if (!states.has(backend.name)) {
+    states.set(backend.name, { ewmaMs: null, inFlight: 0, calls: 0, failures: 0, lastError: null });
+  }
+  return states.get(backend.name);
+}
+
+/**
+ * All registered backends
+ * @returns {Object[]}
+ */
+function listBackends() {
+  return [...registry().values()];
+}
+
+/**
+ * @param {string} name - Backend name
+ * @returns {Object} Backend
+ * @throws {Error} status 400 for an unknown name
+ */
+function getBackend(name) {
+  const backend = registry().get(name);
+  if (!backend) {
+    throw Object.assign(new Error(`Unknown backend: ${name} (known: ${[...registry().keys()].join(', ')})`), { status: 400 });
+  }
+  return backend;
+}
+
+/**
+ * Backend for calls that are not routed (metadata, warm-up)
+ * @returns {Object} Backend
+ */
+function defaultBackend() {
+  return getBackend(config().default);
+}
+
+function pick(candidates, weightOf) {
+  const { initialLatency } = config();
+  const scores = candidates.map(backend => {
+    const { ewmaMs, inFlight } = stateOf(backend);
+    return weightOf(backend) / (Math.max(ewmaMs ?? initialLatency, 1) * (1 + inFlight));
+  });
+  let point = Math.random() * scores.reduce((sum, score) => sum + score, 0);
+  for (let i = 0; i < candidates.length; i++) {
+    point -= scores[i];
+    if (point < 0) return candidates[i];
+  }
+  return candidates[candidates.length - 1];
+}
+
+/**
+ * Chooses the backend of a call
+ * @param {Object} options - { target } explicit backend name, { role } 'read' or 'write'
+ * @returns {Object} Backend
+ */
+function routeBackend({ target, role } = {}) {
+  if (target) return getBackend(target);
+
+  const candidates = listBackends().filter(backend => backend.roles.includes(role));
+  if (!candidates.length) return defaultBackend();
+
+  // All circuits open: pick anyway, the breaker fails fast with Retry-After
+  const healthy = candidates.filter(backend => !isCircuitOpen(backend.name));
+  const usable = healthy.length ? healthy : candidates;
+  const weighted = usable.filter(backend => backend.weight > 0);
+  return weighted.length ? pick(weighted, backend => backend.weight) : pick(usable, () => 1);
+}
+
+/**
+ * Basic auth header of a direct backend
+ * @param {Object} backend
+ * @returns {Object} { Authorization } or {}
+ */
+function authHeaders({ username, password }) {
+  return username
+    ? { 'Authorization': 'Basic ' + Buffer.from(`${username}:${password}`).toString('base64') }
+    : {};
+}
+
+function directDestination(backend) {
+  return {
+    name: backend.name,
+    url: backend.url,
+    authentication: backend.username ? 'BasicAuthentication' : 'NoAuthentication',
+    username: backend.username,
+    password: backend.password,
+    isTrustingAllCertificates: backend.rejectUnauthorized === false
+  };
+}
+
+function observe(state, start, error) {
+  const ms = Number(process.hrtime.bigint() - start) / 1e6;
+  state.calls++;
+  // Any HTTP response is a latency sample; 5xx and missing responses count as failures
+  if (!error || error.response) {
+    const { ewmaAlpha } = config();
+    state.ewmaMs = state.ewmaMs === null ? ms : ewmaAlpha * ms + (1 - ewmaAlpha) * state.ewmaMs;
+  }
+  if (error && !(error.response?.status < 500)) {
+    state.failures++;
+    state.lastError = error.message;
+  }
+}
+
+/**
+ * executeHttpRequest against a backend, through its destination or directly
+ * Direct calls go through the backend's keep-alive pool; destination calls
+ * through the destination's keep-alive pool toward the connectivity proxy.
+ * Updates the backend's latency EWMA and failure counters
+ * @param {Object} backend - Backend from the registry
+ * @param {Object} requestConfig - Request config for executeHttpRequest, url relative to the backend
+ * @param {Object} options - Options for executeHttpRequest
+ * @returns {Promise<Object>} HTTP response
+ */
+async function executeOn(backend, requestConfig, options) {
+  const state = stateOf(backend);
+  const start = process.hrtime.bigint();
+  state.inFlight++;
+  try {
+    const response = backend.destination
+      ? await executeWithDestination(backend.destination, requestConfig, options)
+      : await executeHttpRequest(directDestination(backend), { ...requestConfig, ...agentConfig(backend) }, options);
+    observe(state, start);
+    return response;
+  } catch (error) {
+    observe(state, start, error);
+    throw error;
+  } finally {
+    state.inFlight--;
+  }
+}
+
+/**
+ * Probe definitions of all backends for probeBackends (latency-probe.js)
+ * @returns {Object[]}
+ */
+function probeTargets() {
+  return listBackends().map(backend => (backend.destination
+    ? {
+      endpoint: backend.label,
+      destination: backend.destination,
+      path: `${backend.servicePath}/?sap-client=200`,
+      headers: { 'Accept': 'application/json' }
+    }
+    : {
+      endpoint: backend.label,
+      url: `${backend.url}${backend.servicePath}/?sap-client=200`,
+      headers: { ...authHeaders(backend), 'Accept': 'application/json' },
+      rejectUnauthorized: backend.rejectUnauthorized,
+      agents: getAgents(backend)
+    }));
+}
+
+/**
+ * Routing state per backend
+ * @returns {Object[]}
+ */
+function getBackendStats() {
+  return listBackends().map(backend => {
+    const { ewmaMs, inFlight, calls, failures, lastError } = stateOf(backend);
+    return {
+      name: backend.name,
+      kind: backend.destination ? 'destination' : 'direct',
+      host: backend.host || null,
+      roles: backend.roles,
+      weight: backend.weight,
+      health: isCircuitOpen(backend.name) ? 'DOWN' : 'UP',
+      ewmaMs: ewmaMs === null ? null : Math.round(ewmaMs * 100) / 100,
+      inFlight,
+      calls,
+      failures,
+      lastError
+    };
+  });
+}
+
+module.exports = {
+  listBackends,
+  getBackend,
+  defaultBackend,
+  routeBackend,
+  executeOn,
+  probeTargets,
+  getBackendStats
+};
@@ -0,0 +1,170 @@
+const { randomUUID } = require('crypto');
+
+/**
+ * Byte-exact encoder for OData V2 $batch multipart bodies
+ * The static segments of the multipart template are built once at load time;
+ * per call only boundaries, request lines, Content-Length and bodies are
+ * spliced in and the result is encoded to UTF-8 in a single pass. (Splicing
+ * pre-encoded Buffer segments was measured slower for payloads of this size,
+ * see scripts/bench/batch-encoder.js.)
+ * Content-Length values count UTF-8 bytes, so non-ASCII field values are safe.
+ * Change set boundaries are derived from the batch boundary plus an index,
+ * so a payload costs a single random UUID.
+ *
+ * Layout (CRLF line endings), identical to the Postman template S/4HANA was
+ * validated against:
+ *   --<batch>                                  request part
+ *   Content-Type: application/http
+ *   Content-Transfer-Encoding: binary
+ *
+ *   GET <url> HTTP/1.1
+ *   Host: <host>
+ *   Accept: application/json
+ *
+ *   <body>
+ *   --<batch>                                  change set part
+ *   Content-Type: multipart/mixed; boundary=<changeset>
+ *
+ *   --<changeset>
+ *   ...request as above, with Content-Type / Content-Length when it has a body...
+ *   --<changeset>--
+ *
+ *   --<batch>--
+ */
+
+// Default Host header value (internal S/4HANA hostname from Destination),
+// other backends pass their own host to encodeBatch
+const HOST = 's4-sb4:44380';
+
+const CRLF = '\r\n';
+const DASHES = '--';
+const PART_HEADERS = 'Content-Type: application/http\r\nContent-Transfer-Encoding: binary\r\n\r\n';
+const CHANGESET_HEADER = 'Content-Type: multipart/mixed; boundary=';
+const protocolAndHost = host => ` HTTP/1.1\r\nHost: ${host}\r\n`;
+const PROTOCOL_AND_HOST = protocolAndHost(HOST);
+const JSON_CONTENT_HEADERS = 'Content-Type: application/json\r\nContent-Length: ';
+const ACCEPT_AND_BLANK = 'Accept: application/json\r\n\r\n';
+
+const methodPrefixes = new Map(); // 'MERGE' -> 'MERGE '
+
+function methodPrefix(method) {
+  const key = method.toUpperCase();
+  if (!methodPrefixes.has(key)) methodPrefixes.set(key, `${key} `);
+  return methodPrefixes.get(key);
+}
+
+/**
+ * Encoded $batch body with its boundary
+ */
+class BatchPayload {
+  constructor(body, boundary) {
+    this.body = body;
+    this.boundary = boundary;
+  }
+
+  /** Content-Type header value for the $batch request */
+  get contentType() {
+    return `multipart/mixed; boundary=${this.boundary}`;
+  }
+
+  /** Body size in bytes */
+  get length() {
+    return this.body.length;
+  }
+
+  toString() {
+    return this.body.toString('utf8');
+  }
+}
+
+/**
+ * Accumulates the body as one string; encoded to UTF-8 in a single pass
+ */
+class Chunks {
+  constructor() {
+    this.text = '';
+  }
+
+  push(...chunks) {
+    for (const chunk of chunks) this.text += chunk;
+  }
+
+  toBuffer() {
+    return Buffer.from(this.text);
+  }
+}
+
+/**
+ * Unique multipart boundary
+ * @param {string} prefix - e.g. 'batch' or 'changeset'
+ * @returns {string} e.g. 'batch_1b4e28ba-2fa1-11d2-883f-0016d3cca427'
+ */
+function newBoundary(prefix) {
+  return `${prefix}_${randomUUID()}`;
+}
+
+function encodeRequest(chunks, { method, url, body }, hostLine) {
+  chunks.push(PART_HEADERS, methodPrefix(method), url, hostLine);
+
+  let text = '';
+  if (body !== undefined && body !== null) {
+    text = typeof body === 'string' ? body : JSON.stringify(body);
+    chunks.push(JSON_CONTENT_HEADERS, String(Buffer.byteLength(text)), CRLF);
+  }
+  chunks.push(ACCEPT_AND_BLANK, text, CRLF);
+}
+
+/**
+ * Boundary of the n-th change set of a batch
+ * Never starts with the batch boundary, so its delimiter lines cannot be
+ * mistaken for batch delimiters.
+ * @param {string} batchBoundary - e.g. 'batch_1b4e28ba-...'
+ * @param {number} index - 1-based change set index
+ * @returns {string} e.g. 'changeset_1b4e28ba-..._1'
+ */
+function changesetBoundary(batchBoundary, index) {
+  return `changeset_${batchBoundary.replace(/^batch_/, '')}_${index}`;
+}
+
+function encodeChangeset(chunks, { changeset }, boundary, hostLine) {
+  const delimiter = `--${boundary}`;
+  chunks.push(CHANGESET_HEADER, boundary, CRLF, CRLF);
+  for (const request of changeset) {
+    chunks.push(delimiter, CRLF);
+    encodeRequest(chunks, request, hostLine);
+  }
+  chunks.push(delimiter, DASHES, CRLF, CRLF);
+}
+
+/**
+ * Encodes a $batch body
+ * @param {Object[]} parts - In order; each is a request { method, url, body }
+ *                           or a change set { changeset: [requests], boundary }, its
+ *                           boundary derived from the batch boundary when omitted.
+ *                           body may be an object (sent as JSON) or a string.
+ * @param {Object} options - { boundary } to override the generated batch boundary,
+ *                           { host } for the Host header of the parts (default HOST)
+ * @returns {BatchPayload}
+ */
+function encodeBatch(parts, { boundary = newBoundary('batch'), host = HOST } = {}) {
+  const delimiter = `--${boundary}`;
+  const chunks = new Chunks();
+  const hostLine = host === HOST ? PROTOCOL_AND_HOST : protocolAndHost(host);
+  let changesets = 0;
+
+  for (const part of parts) {
+    chunks.push(delimiter, CRLF);
+    if (part.changeset) encodeChangeset(chunks, part, part.boundary || changesetBoundary(boundary, ++changesets), hostLine);
+    else encodeRequest(chunks, part, hostLine);
+  }
+  chunks.push(delimiter, DASHES);
+
+  return new BatchPayload(chunks.toBuffer(), boundary);
+}
+
+module.exports = {
+  HOST,
+  BatchPayload,
+  newBoundary,
+  encodeBatch
+};
@@ -0,0 +1,127 @@
+const { encodeBatch } = require('./batch-encoder');
+const { observeStage } = require('./metrics');
+
+// Entity set holding the sales order items, target of the MERGE and the GET selection
+const ENTITY_SET = 'C_RFM_MaSaDoEditSlsOrdItm';
+
+/**
+ * Builds batch OData multipart payload following exact Postman template
+ * Based on working Python payload - includes Host and Content-Length headers
+ * 
+ * Architecture (from meeting):
+ * - MERGE with "phantom order" (100001681) defines WHAT to change (fields)
+ * - GET with dynamic filters defines WHICH orders to change
+ * - S/4HANA combines both to execute mass update
+ * 
+ * @param {Object} filters - Selection criteria for orders
+ * @param {Object} fields - Fields to update (null to skip MERGE, only GET)
+ * @param {Object} query - GET query options { top, skip, skiptoken, select, inlinecount }, defaults to $top=1 for mass changes
+ * @param {Object} options - { host } Host header of the target backend, defaults to the encoder's HOST
+ * @returns {BatchPayload} Encoded payload with its unique boundary
+ */
+function buildBatchPayload(filters, fields, query = { top: 1 }, { host } = {}) {
+  const start = process.hrtime.bigint();
+  
+  const parts = [];
+  
+  // Add MERGE changeset only if fields are provided
+  if (fields) {
+    parts.push(mergeChangeset(fields));
+  }
+  
+  // Always add GET part
+  parts.push(getPart(buildFilter(filters), buildQueryOptions(query)));
+
+  const payload = encodeBatch(parts, { host });
+  observeStage('payload_build', start);
+  return payload;
+}
+
+/**
+ * Builds one $batch payload carrying several mass changes
+ * Each entry becomes its own MERGE changeset followed by its GET selection,
+ * so the response holds exactly two parts per entry, in entry order.
+ * 
+ * @param {Object[]} entries - [{ filters, fieldsToUpdate }]
+ * @param {Object} options - { host } Host header of the target backend
+ * @returns {BatchPayload} Encoded payload with its unique boundary
+ */
+function buildBulkBatchPayload(entries, { host } = {}) {
+  const start = process.hrtime.bigint();
+  const payload = encodeBatch(entries.flatMap(({ filters, fieldsToUpdate }) => [
+    mergeChangeset(fieldsToUpdate),
+    getPart(buildFilter(filters), buildQueryOptions({ top: 1 }))
+  ]), { host });
+  observeStage('payload_build', start);
+  return payload;
+}
+
+/**
+ * MERGE changeset on the phantom order
+ * @param {Object} fields - Fields to update
+ * @returns {Object} Changeset part for encodeBatch
+ */
+function mergeChangeset(fields) {
+  return {
+    changeset: [{
+      method: 'MERGE',
+      url: `${ENTITY_SET}(SalesOrder='100001681',SalesOrderItem='000010')?sap-client=200`,
+      body: {
+        "RequirementSegment": fields.RequirementSegment,
+        "Plant": fields.Plant,
+        "StorageLocation": fields.StorageLocation,
+        "RFM_SD_ApplJobAction": "01",
+        "InternalComment": "Mass Field Update from Joule",
+        "SalesOrdItemIsSelected": "X",
+        "SalesOrdItemsAreSelected": "X"
+      }
+    }]
+  };
+}
+
+/**
+ * GET selection part
+ * @param {string} getFilter - Encoded $filter
+ * @param {string} getOptions - Encoded query options
+ * @returns {Object} Request part for encodeBatch
+ */
+function getPart(getFilter, getOptions) {
+  return {
+    method: 'GET',
+    url: `${ENTITY_SET}?${getOptions}&sap-client=200&$filter=${getFilter}`
+  };
+}
+
+/**
+ * Builds the URL-encoded $filter expression for the order selection
+ * @param {Object} filters - Selection criteria for orders
+ * @returns {string} Encoded filter
+ */
+function buildFilter(filters) {
+  const material = filters.materialStartsWith;
+  const plant = filters.plant;
+  const salesOrg = filters.salesOrg;
+  const date = filters.creationDate;
+  return `startswith(Material,%27${material}%27)%20and%20Plant%20eq%20%27${plant}%27%20and%20SalesDocumentDate%20eq%20datetime%27${date}T00%3a00%3a00%27%20and%20SalesOrganization%20eq%20%27${salesOrg}%27`;
+}
+
+/**
+ * Builds the paging and projection query options for the GET part
+ * @param {Object} query - { top, skip, skiptoken, select, inlinecount }, inlinecount adds the total as __count
+ * @returns {string} e.g. '$top=100&$skip=200&$select=SalesOrder,Plant'
+ */
+function buildQueryOptions({ top, skip, skiptoken, select, inlinecount } = {}) {
+  const options = [`$top=${top}`];
+  if (skip) options.push(`$skip=${skip}`);
+  if (inlinecount) options.push('$inlinecount=allpages');
+  if (skiptoken) options.push(`$skiptoken=${encodeURIComponent(skiptoken)}`);
+  if (select?.length) options.push(`$select=${select.join(',')}`);
+  return options.join('&');
+}
+
+module.exports = {
+  ENTITY_SET,
+  buildBatchPayload,
+  buildBulkBatchPayload,
+  buildFilter
+};
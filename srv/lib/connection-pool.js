@@ -0,0 +1,247 @@
+const cds = require('@sap/cds');
+const http = require('http');
+const https = require('https');
+const tls = require('tls');
+
+/**
+ * Keep-alive connection pools for the S/4HANA backends, one per backend
+ * Sockets to the backend are reused instead of paying a new TCP+TLS handshake
+ * per request. Direct backends of the registry (see backends.js) get their own
+ * pool, so a slow system cannot starve the sockets of the others; a backend's
+ * `pool` settings override cds.s4.pool.
+ * Destinations behind the connectivity proxy (OnPremise) get a pool of
+ * sockets toward the proxy, built from the resolved destination's
+ * proxyConfiguration (see destination-cache.js): plain HTTP requests are sent
+ * to the proxy in absolute form, HTTPS targets are tunnelled with CONNECT.
+ * The proxy headers are renewed with every destination refresh. Other
+ * destinations keep the agent the SDK builds from them (certificates,
+ * trust settings).
+ *
+ * Configured via cds.s4.pool (package.json or CDS_S4_POOL_* env vars):
+ * - enabled           : false to fall back to the SDK default agents
+ * - maxSockets        : max concurrent sockets per host
+ * - maxFreeSockets    : max idle sockets kept open per host
+ * - keepAliveMsecs    : TCP keep-alive initial delay for open sockets
+ * - freeSocketTimeout : idle time after which a free socket is closed
+ */
+
+const DEFAULTS = {
+  enabled: true,
+  maxSockets: 50,
+  maxFreeSockets: 10,
+  keepAliveMsecs: 1000,
+  freeSocketTimeout: 30000
+};
+
+const DEFAULT_POOL = 'default';
+
+const pools = new Map();      // backend name -> { httpAgent, httpsAgent }
+const proxyPools = new Map(); // destination name -> { proxy, httpAgent, httpsAgent }
+
+function config() {
+  return { ...DEFAULTS, ...cds.env.s4?.pool };
+}
+
+function poolConfig(backend) {
+  return { ...config(), ...backend?.pool };
+}
+
+function agentOptions({ maxSockets, maxFreeSockets, keepAliveMsecs, freeSocketTimeout }) {
+  return {
+    keepAlive: true,
+    keepAliveMsecs,
+    maxSockets,
+    maxFreeSockets,
+    timeout: freeSocketTimeout, // applied to idle sockets, which are destroyed on timeout
+    scheduling: 'lifo'          // reuse the most recently used socket, let the others expire
+  };
+}
+
+function createAgents(backend) {
+  const options = agentOptions(poolConfig(backend));
+  return {
+    httpAgent: new http.Agent(options),
+    // Backends with self-signed certificates (direct calls only)
+    httpsAgent: new https.Agent({ ...options, ...(backend?.rejectUnauthorized === false && { rejectUnauthorized: false }) })
+  };
+}
+
+/**
+ * Returns the pooled agents of a backend, created on first use
+ * @param {Object} backend - Registry entry { name, pool, rejectUnauthorized }, omitted for the default pool
+ * @returns {{httpAgent: http.Agent, httpsAgent: https.Agent}}
+ */
+function getAgents(backend) {
+  const name = backend?.name || DEFAULT_POOL;
+  if (!pools.has(name)) pools.set(name, createAgents(backend));
+  return pools.get(name);
+}
+
+/**
+ * Whether direct calls to a backend go through its pool
+ * Destination backends are pooled per destination, see proxyAgentConfig.
+ * @param {Object} backend - Registry entry, omitted for the default pool
+ * @returns {boolean}
+ */
+function isPooled(backend) {
+  return poolConfig(backend).enabled && !backend?.destination;
+}
+
+/**
+ * Request config fragment for executeHttpRequest
+ * Spread it into the request config to route the call through the backend's pool
+ * @param {Object} backend - Registry entry, omitted for the default pool
+ * @returns {Object} { httpAgent, httpsAgent }, or {} for destination backends (see proxyAgentConfig) and when pooling is disabled
+ */
+function agentConfig(backend) {
+  return isPooled(backend) ? getAgents(backend) : {};
+}
+
+/**
+ * Sends plain HTTP requests through an HTTP forward proxy
+ * The request line carries the absolute URL and the proxy headers are set on
+ * every request, so the pooled sockets to the proxy serve any target.
+ */
+class ForwardProxyAgent extends http.Agent {
+  constructor(proxy, options) {
+    super(options);
+    this.proxy = proxy;
+  }
+
+  addRequest(req, options) {
+    req.path = new URL(req.path, `http://${options.host}:${options.port}`).href;
+    for (const [name, value] of Object.entries(this.proxy.headers)) req.setHeader(name, value);
+    super.addRequest(req, { ...options, host: this.proxy.host, port: this.proxy.port });
+  }
+}
+
+/**
+ * Tunnels HTTPS requests through an HTTP proxy with CONNECT
+ * Each pooled socket is a TLS session to the target inside its own tunnel.
+ */
+class TunnelProxyAgent extends https.Agent {
+  constructor(proxy, options) {
+    super(options);
+    this.proxy = proxy;
+  }
+
+  createConnection(options, callback) {
+    const target = `${options.host}:${options.port}`;
+    const connect = http.request({
+      host: this.proxy.host,
+      port: this.proxy.port,
+      method: 'CONNECT',
+      path: target,
+      headers: { Host: target, ...this.proxy.headers },
+      agent: false
+    });
+    connect.once('connect', (res, socket) => {
+      if (res.statusCode !== 200) {
+        socket.destroy();
+        callback(Object.assign(new Error(`Proxy CONNECT to ${target} failed with HTTP ${res.statusCode}`), { status: 502 }));
+        return;
+      }
+      callback(null, tls.connect({ ...options, socket, servername: options.servername || options.host }));
+    });
+    connect.once('error', callback);
+    connect.end();
+  }
+}
+
+function createProxyAgents(proxy, destination) {
+  const options = agentOptions(config());
+  return {
+    proxy,
+    httpAgent: new ForwardProxyAgent(proxy, options),
+    httpsAgent: new TunnelProxyAgent(proxy, {
+      ...options,
+      ...(destination.isTrustingAllCertificates && { rejectUnauthorized: false })
+    })
+  };
+}
+
+/**
+ * Pooled agents toward the connectivity proxy of a resolved destination
+ * The agents of a destination are kept while its proxy host and port stay
+ * the same; the proxy headers (token) are replaced with the given ones.
+ * @param {string} destinationName - BTP destination name
+ * @param {Object} destination - Destination returned by getDestination
+ * @returns {Object} { httpAgent, httpsAgent }, or {} when the SDK's agent must be kept
+ */
+function proxyAgentConfig(destinationName, destination) {
+  const { proxyConfiguration } = destination;
+  const keepSdkAgent = !config().enabled || !proxyConfiguration
+    || (proxyConfiguration.protocol && proxyConfiguration.protocol !== 'http')
+    || destination.keyStoreName || destination.certificates?.length;
+  if (keepSdkAgent) {
+    proxyPools.delete(destinationName);
+    return {};
+  }
+
+  const { host, port, headers = {} } = proxyConfiguration;
+  let pool = proxyPools.get(destinationName);
+  if (!pool || pool.proxy.host !== host || String(pool.proxy.port) !== String(port)) {
+    // Sockets of a replaced pool close once idle, running requests finish on them
+    pool = createProxyAgents({ host, port, headers }, destination);
+    proxyPools.set(destinationName, pool);
+  }
+  pool.proxy.headers = { ...headers };
+  return { httpAgent: pool.httpAgent, httpsAgent: pool.httpsAgent };
+}
+
+function countSockets(map) {
+  return Object.values(map).reduce((sum, list) => sum + list.length, 0);
+}
+
+function agentStats(agent) {
+  if (!agent) return { hosts: 0, activeSockets: 0, freeSockets: 0, pendingRequests: 0 };
+  return {
+    hosts: new Set([...Object.keys(agent.sockets), ...Object.keys(agent.freeSockets)]).size,
+    activeSockets: countSockets(agent.sockets),
+    freeSockets: countSockets(agent.freeSockets),
+    pendingRequests: countSockets(agent.requests)
+  };
+}
+
+/**
+ * Snapshot of pool usage, used to size maxSockets / maxFreeSockets
+ * Destination backends report their proxy pool once the destination is resolved.
+ * @param {Object} backend - Registry entry, omitted for the default pool
+ * @returns {Object} Pool configuration and per-protocol socket counts
+ */
+function getPoolStats(backend) {
+  const proxied = backend?.destination ? proxyPools.get(backend.destination) : undefined;
+  const { maxSockets, maxFreeSockets, keepAliveMsecs, freeSocketTimeout } = backend?.destination ? config() : poolConfig(backend);
+  const { httpAgent, httpsAgent } = backend?.destination ? proxied || {} : getAgents(backend);
+  return {
+    backend: backend?.name || DEFAULT_POOL,
+    enabled: backend?.destination ? Boolean(proxied) : isPooled(backend),
+    proxy: proxied ? `${proxied.proxy.host}:${proxied.proxy.port}` : null,
+    maxSockets,
+    maxFreeSockets,
+    keepAliveMsecs,
+    freeSocketTimeout,
+    http: agentStats(httpAgent),
+    https: agentStats(httpsAgent)
+  };
+}
+
+/**
+ * Closes all pooled sockets of all backends (used on shutdown)
+ */
+function destroyAgents() {
+  for (const { httpAgent, httpsAgent } of [...pools.values(), ...proxyPools.values()]) {
+    httpAgent.destroy();
+    httpsAgent.destroy();
+  }
+  pools.clear();
+  proxyPools.clear();
+}
+
+module.exports = {
+  agentConfig,
+  proxyAgentConfig,
+  getAgents,
+  getPoolStats,
+  destroyAgents
+};
@@ -0,0 +1,146 @@
+const cds = require('@sap/cds');
+const { resilienceFor } = require('./resilience');
+const { timeStage } = require('./metrics');
+const { traceHeaders } = require('./tracing');
+const { getStore } = require('./shared-store');
+const { getBackend, executeOn } = require('./backends');
+const { logger } = require('./logger');
+
+const LOG = logger('csrf');
+
+/**
+ * CSRF token and session cookie cache for the S/4HANA backends (see backends.js)
+ * One token per backend, reused by every action until it expires or S/4 rejects it.
+ * Tokens live in the shared store (namespace 'csrf'), so with a shared
+ * backend all instances reuse one session instead of fetching their own.
+ */
+
+const DEFAULT_TTL = 10 * 60 * 1000; // 10 minutes, below the default ABAP session timeout
+
+const inFlight = new Map(); // backend name -> Promise of a running fetch
+
+function ttl() {
+  return cds.env.s4?.csrf?.ttl ?? DEFAULT_TTL;
+}
+
+/**
+ * Reduces Set-Cookie headers to a Cookie header value (name=value pairs only)
+ * @param {string[]|string} setCookie - Set-Cookie response header(s)
+ * @returns {string} Cookie header value
+ */
+function toCookieHeader(setCookie) {
+  if (!setCookie) return '';
+  const list = Array.isArray(setCookie) ? setCookie : [setCookie];
+  return list.map(c => c.split(';')[0].trim()).filter(Boolean).join('; ');
+}
+
+/**
+ * Fetches a fresh CSRF token and session cookies from the service root
+ * @param {string} backendName - Backend name
+ * @returns {Promise<Object>} Cache entry { token, cookie, expires }
+ */
+async function fetchCsrfToken(backendName) {
+  LOG.debug('Fetching CSRF token', { backend: backendName });
+  const backend = getBackend(backendName);
+  const response = await timeStage('csrf_fetch', () => executeOn(
+    backend,
+    {
+      method: 'get',
+      url: `${backend.servicePath}/`,
+      headers: {
+        'X-CSRF-Token': 'Fetch',
+        'Accept': 'application/json',
+        ...traceHeaders()
+      }
+    },
+    resilienceFor(backendName, 'csrf')
+  ));
+
+  const token = response.headers['x-csrf-token'];
+  if (!token) {
+    LOG.error('No CSRF token in headers', () => ({ headers: Object.keys(response.headers) }));
+    throw new Error('CSRF token not returned by S/4HANA');
+  }
+
+  return {
+    token,
+    cookie: toCookieHeader(response.headers['set-cookie']),
+    expires: Date.now() + ttl()
+  };
+}
+
+/**
+ * Returns a valid CSRF token for the backend, fetching it at most once
+ * even when many requests arrive together (single-flight)
+ * @param {string} backendName - Backend name
+ * @returns {Promise<Object>} Cache entry { token, cookie, expires }
+ */
+async function getCsrfToken(backendName) {
+  const cached = await getStore().get('csrf', backendName);
+  if (cached && cached.expires > Date.now()) return cached;
+
+  if (!inFlight.has(backendName)) {
+    const pending = fetchCsrfToken(backendName)
+      .then(async entry => {
+        await getStore().set('csrf', backendName, entry, entry.expires - Date.now());
+        return entry;
+      })
+      .finally(() => inFlight.delete(backendName));
+    inFlight.set(backendName, pending);
+  }
+  return inFlight.get(backendName);
+}
+
+/**
+ * Drops the cached token, but only if it is still the one that was rejected
+ * (a concurrent request may already have replaced it)
+ * @param {string} backendName - Backend name
+ * @param {string} token - Token that S/4HANA rejected
+ */
+async function invalidateCsrfToken(backendName, token) {
+  const cached = await getStore().get('csrf', backendName);
+  if (cached && (!token || cached.token === token)) await getStore().delete('csrf', backendName);
+}
+
+/**
+ * Checks whether an HTTP error is S/4HANA rejecting the CSRF token
+ * @param {Error} error - Error thrown by executeHttpRequest
+ * @returns {boolean}
+ */
+function isCsrfFailure(error) {
+  const response = error?.response;
+  if (!response || response.status !== 403) return false;
+  const header = String(response.headers?.['x-csrf-token'] || '');
+  if (/required/i.test(header)) return true;
+  // Streamed responses (responseType 'stream') cannot be inspected without consuming them
+  if (typeof response.data?.pipe === 'function') return false;
+  const body = typeof response.data === 'string' ? response.data : JSON.stringify(response.data || '');
+  return body.includes('CSRF token validation failed');
+}
+
+/**
+ * Runs a request with a cached CSRF token; on CSRF rejection refetches
+ * the token and retries exactly once
+ * @param {string} backendName - Backend name
+ * @param {Function} send - async (csrf) => response, csrf = { token, cookie }
+ * @returns {Promise<*>} Result of send
+ */
+async function withCsrfToken(backendName, send) {
+  const csrf = await getCsrfToken(backendName);
+  try {
+    return await send(csrf);
+  } catch (error) {
+    if (!isCsrfFailure(error)) throw error;
+    LOG.info('Token rejected by S/4HANA, refetching and retrying once', { backend: backendName });
+    await invalidateCsrfToken(backendName, csrf.token);
+    return send(await getCsrfToken(backendName));
+  }
+}
+
+module.exports = {
+  getCsrfToken,
+  invalidateCsrfToken,
+  isCsrfFailure,
+  withCsrfToken,
+  toCookieHeader
+};
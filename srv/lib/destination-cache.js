@@ -0,0 +1,154 @@
+const cds = require('@sap/cds');
+const { getDestination } = require('@sap-cloud-sdk/connectivity');
+const { executeHttpRequest } = require('@sap-cloud-sdk/http-client');
+const { logger } = require('./logger');
+const { timeStage } = require('./metrics');
+const { proxyAgentConfig } = require('./connection-pool');
+
+const LOG = logger('destination');
+
+/**
+ * In-memory cache of resolved BTP destinations
+ * The resolved destination carries the auth settings and, for OnPremise
+ * destinations, the connectivity proxy configuration incl. its token.
+ * Next to it the entry holds the keep-alive agents toward that proxy (see
+ * proxyAgentConfig in connection-pool.js), which every call through the
+ * destination uses. Entries are refreshed in the background shortly before they expire and
+ * dropped when S/4HANA answers 401.
+ *
+ * Configured via cds.s4.destination:
+ * - ttl          : upper bound for an entry's lifetime
+ * - refreshAhead : how long before expiry the background refresh starts
+ */
+
+const DEFAULTS = {
+  ttl: 5 * 60 * 1000,
+  refreshAhead: 60 * 1000
+};
+
+const entries = new Map();  // destinationName -> { destination, agents, expires, timer }
+const inFlight = new Map(); // destinationName -> Promise of a running lookup
+
+function config() {
+  return { ...DEFAULTS, ...cds.env.s4?.destination };
+}
+
+/**
+ * Reads the exp claim of a (Bearer) JWT without verifying it
+ * @param {string} value - Header value or raw token
+ * @returns {number|undefined} Expiry in ms since epoch
+ */
+function jwtExpiry(value) {
+  if (!value) return undefined;
+  const payload = String(value).replace(/^Bearer\s+/i, '').split('.')[1];
+  if (!payload) return undefined;
+  try {
+    const { exp } = JSON.parse(Buffer.from(payload, 'base64url').toString('utf8'));
+    return exp ? exp * 1000 : undefined;
+  } catch {
+    return undefined;
+  }
+}
+
+/**
+ * Earliest expiry of the tokens held by a resolved destination, capped by ttl
+ * @param {Object} destination - Destination returned by getDestination
+ * @returns {number} Expiry in ms since epoch
+ */
+function expiryOf(destination) {
+  const now = Date.now();
+  const expiries = [now + config().ttl];
+  for (const authToken of destination.authTokens || []) {
+    if (authToken.expiresIn) expiries.push(now + Number(authToken.expiresIn) * 1000);
+  }
+  const proxyHeaders = destination.proxyConfiguration?.headers || {};
+  const proxyExpiry = jwtExpiry(proxyHeaders['Proxy-Authorization'] || proxyHeaders['proxy-authorization']);
+  if (proxyExpiry) expiries.push(proxyExpiry);
+  return Math.min(...expiries);
+}
+
+function scheduleRefresh(destinationName, entry) {
+  const delay = Math.max(entry.expires - config().refreshAhead - Date.now(), 0);
+  entry.timer = setTimeout(() => {
+    lookup(destinationName).catch(err => {
+      // Keep serving the current entry until it expires, the next call retries the lookup
+      LOG.warn('Background refresh failed', { destination: destinationName, message: err.message });
+    });
+  }, delay);
+  entry.timer.unref();
+}
+
+function lookup(destinationName) {
+  if (inFlight.has(destinationName)) return inFlight.get(destinationName);
+
+  const pending = timeStage('destination_resolve', () => getDestination({ destinationName, useCache: false }))
+    .then(destination => {
+      if (!destination) throw new Error(`Destination ${destinationName} not found`);
+      invalidateDestination(destinationName);
+      const entry = { destination, agents: proxyAgentConfig(destinationName, destination), expires: expiryOf(destination) };
+      scheduleRefresh(destinationName, entry);
+      entries.set(destinationName, entry);
+      LOG.debug('Destination resolved', () => ({ destination: destinationName, validUntil: new Date(entry.expires).toISOString() }));
+      return entry;
+    })
+    .finally(() => inFlight.delete(destinationName));
+  inFlight.set(destinationName, pending);
+  return pending;
+}
+
+function resolveEntry(destinationName) {
+  const entry = entries.get(destinationName);
+  if (entry && entry.expires > Date.now()) return Promise.resolve(entry);
+  return lookup(destinationName);
+}
+
+/**
+ * Returns the resolved destination, looking it up only when not cached
+ * @param {string} destinationName - BTP destination name
+ * @returns {Promise<Object>} Resolved destination
+ */
+async function resolveDestination(destinationName) {
+  return (await resolveEntry(destinationName)).destination;
+}
+
+/**
+ * Drops a cached destination and its pending background refresh
+ * @param {string} destinationName - BTP destination name
+ */
+function invalidateDestination(destinationName) {
+  const entry = entries.get(destinationName);
+  if (!entry) return;
+  clearTimeout(entry.timer);
+  entries.delete(destinationName);
+}
+
+async function execute(destinationName, requestConfig, options) {
+  const { destination, agents } = await resolveEntry(destinationName);
+  return executeHttpRequest(destination, { ...requestConfig, ...agents }, options);
+}
+
+/**
+ * executeHttpRequest against a cached destination, through its keep-alive
+ * proxy agents; on 401 the destination is resolved again and the request is
+ * retried once
+ * @param {string} destinationName - BTP destination name
+ * @param {Object} requestConfig - Request config for executeHttpRequest
+ * @param {Object} options - Options for executeHttpRequest
+ * @returns {Promise<Object>} HTTP response
+ */
+async function executeWithDestination(destinationName, requestConfig, options) {
+  try {
+    return await execute(destinationName, requestConfig, options);
+  } catch (error) {
+    if (error?.response?.status !== 401) throw error;
+    LOG.info('401 from S/4HANA, resolving destination again', { destination: destinationName });
+    invalidateDestination(destinationName);
+    return execute(destinationName, requestConfig, options);
+  }
+}
+
+module.exports = {
+  resolveDestination,
+  invalidateDestination,
+  executeWithDestination
+};
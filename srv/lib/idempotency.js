@@ -0,0 +1,213 @@
+const cds = require('@sap/cds');
+const crypto = require('crypto');
+const { normalizeFilters, selectionOf, overlaps } = require('./read-cache');
+const { getStore } = require('./shared-store');
+const { logger } = require('./logger');
+
+const LOG = logger('idempotency');
+
+/**
+ * Idempotent mass change actions
+ * A retried scheduleMassChange / reverseMassChange returns the outcome of the
+ * first call (the same job ID) instead of queueing another S/4HANA job.
+ * The key is the caller's idempotencyKey parameter or Idempotency-Key header;
+ * without one it is derived from the normalized filters and fields. A derived
+ * key only catches retries: identical calls are deduplicated while the first
+ * call's job is still QUEUED or SENT, or within `window` of the first call.
+ * Once another mass change over an overlapping selection has been queued,
+ * derived outcomes of that selection are dropped, so repeating a change
+ * after reverting it (ANDATA, RITORNO, ANDATA) runs it again.
+ * Duplicates arriving while the first call runs wait for its outcome. The
+ * running claim is a lease of waitTimeout: if the instance holding it
+ * crashed, the key is taken over by the next call once the lease expired.
+ * Failed calls (thrown, status ERROR, or a job that ended FAILED) are
+ * forgotten, so they can be retried.
+ *
+ * Records live in the shared store (namespace 'idempotency'); with a shared
+ * backend, retries landing on another instance are deduplicated as well.
+ *
+ * Configured via cds.s4.idempotency:
+ * - enabled      : deduplicate at all
+ * - window       : ms after the first call in which identical calls count as retries (derived keys)
+ * - ttl          : ms an outcome is kept
+ * - waitTimeout  : ms a duplicate waits for a call running on another instance,
+ *                  and lease of the running claim
+ * - pollInterval : ms between checks while waiting for another instance
+ */
+
+const DEFAULTS = {
+  enabled: true,
+  window: 15000,
+  ttl: 24 * 60 * 60 * 1000,
+  waitTimeout: 30000,
+  pollInterval: 250
+};
+
+const NAMESPACE = 'idempotency';
+const JobStatus = 'masschange.JobStatus';
+const PENDING = ['QUEUED', 'SENT'];
+
+const running = new Map(); // key -> Promise of the call running in this process
+
+function config() {
+  return { ...DEFAULTS, ...cds.env.s4?.idempotency };
+}
+
+/**
+ * Hash of what the call would change: exact selection, fields to update and target backend
+ * @param {Object} data - Action parameters { filters, fieldsToUpdate, target }
+ * @returns {string} Fingerprint
+ */
+function fingerprint({ filters, fieldsToUpdate, target }) {
+  const fields = Object.entries(fieldsToUpdate || {})
+    .filter(([, value]) => value !== undefined && value !== null)
+    .map(([name, value]) => [name, String(value).trim()])
+    .sort(([a], [b]) => a.localeCompare(b));
+  return crypto.createHash('sha1')
+    .update(JSON.stringify([selectionOf(filters || {}), fields, target || null]))
+    .digest('hex');
+}
+
+function requestKey(req) {
+  const key = req.data.idempotencyKey || req.http?.req?.headers?.['idempotency-key'];
+  const hash = fingerprint(req.data);
+  const filters = normalizeFilters(req.data.filters || {});
+  return key
+    ? { key: `${req.event}:key:${key}`, hash, filters, derived: false }
+    : { key: `${req.event}:auto:${hash}`, hash, filters, derived: true };
+}
+
+const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+
+/**
+ * Current status of the job queued by a stored outcome
+ * @param {Object} result - Stored OperationStatus
+ * @returns {Promise<string|undefined>}
+ */
+async function jobStatusOf(result) {
+  if (!result?.ID) return undefined;
+  const { SELECT } = cds.ql;
+  // Own transaction: the request's connection must stay free for enqueueJob
+  const job = await cds.tx(tx => tx.run(SELECT.one.from(JobStatus, result.ID).columns('status')));
+  return job?.status;
+}
+
+/**
+ * Whether a stored outcome still answers a duplicate call
+ * Outcomes whose job failed never do; derived keys only while the job is
+ * pending or within `window` of the first call.
+ * @param {Object} entry - Key of the duplicate call
+ * @param {Object} record - Stored outcome
+ * @returns {Promise<boolean>}
+ */
+async function replayable(entry, record) {
+  const status = await jobStatusOf(record.result);
+  if (status === 'FAILED') return false;
+  if (!entry.derived) return true;
+  return PENDING.includes(status) || Date.now() - record.storedAt <= config().window;
+}
+
+/**
+ * Drops derived outcomes of other mass changes over an overlapping selection
+ * Their repetition is a new change, not a retry.
+ * @param {Object} entry - Key of the call that was just queued
+ */
+async function releaseOverlapping({ key, filters }) {
+  const records = await getStore().entries(NAMESPACE);
+  await Promise.all(records
+    .filter(([other, record]) => other !== key && record.derived && record.status === 'DONE' && overlaps(filters, record.filters))
+    .map(([other]) => getStore().delete(NAMESPACE, other)));
+}
+
+/**
+ * Waits until another instance has stored the outcome of the key
+ * @returns {Promise<Object|undefined>} Record, undefined if it disappeared (the call failed or its lease expired)
+ */
+async function awaitOutcome(key) {
+  const { waitTimeout, pollInterval } = config();
+  // The claim was taken before this call arrived, so its lease ends before the deadline
+  const deadline = Date.now() + waitTimeout + pollInterval;
+  while (Date.now() < deadline) {
+    const record = await getStore().get(NAMESPACE, key);
+    if (!record || record.status === 'DONE') return record;
+    await sleep(pollInterval);
+  }
+  throw Object.assign(new Error('A call with the same idempotency key is still running'), { status: 409 });
+}
+
+async function execute(entry, next) {
+  const { key, hash, filters, derived } = entry;
+  try {
+    const result = await next();
+    if (result?.status === 'ERROR') {
+      await getStore().delete(NAMESPACE, key);
+    } else {
+      await getStore().set(NAMESPACE, key, { status: 'DONE', hash, filters, derived, storedAt: Date.now(), result }, config().ttl);
+      await releaseOverlapping(entry)
+        .catch(err => LOG.warn('Could not release overlapping idempotency keys', { key, message: err.message }));
+    }
+    return result;
+  } catch (error) {
+    await getStore().delete(NAMESPACE, key)
+      .catch(err => LOG.warn('Could not release idempotency key', { key, message: err.message }));
+    throw error;
+  }
+}
+
+async function claim(entry, next) {
+  const { key, hash } = entry;
+  for (;;) {
+    if (await getStore().add(NAMESPACE, key, { status: 'RUNNING', hash }, config().waitTimeout)) return execute(entry, next);
+
+    const record = await getStore().get(NAMESPACE, key);
+    if (record && record.hash !== hash) {
+      throw Object.assign(new Error('Idempotency key was already used with different parameters'), { status: 422 });
+    }
+    const outcome = record?.status === 'DONE' ? record : await awaitOutcome(key);
+    if (outcome && !await replayable(entry, outcome)) {
+      LOG.info('Stored outcome no longer applies, running the call again', { key, ID: outcome.result?.ID });
+      await getStore().delete(NAMESPACE, key);
+      continue;
+    }
+    if (outcome) {
+      LOG.info('Returning stored outcome of a duplicate call', { key });
+      return { ...outcome.result, replayed: true };
+    }
+    // The first call failed meanwhile, run this one
+  }
+}
+
+/**
+ * Runs an action handler at most once per idempotency key
+ * Registered with this.on() before the action handlers, like traceRequest.
+ * @param {Object} req - CAP request
+ * @param {Function} next - Remaining handlers
+ * @returns {Promise<*>} Outcome of the first call with this key
+ */
+async function idempotentRequest(req, next) {
+  if (!config().enabled) return next();
+
+  const entry = requestKey(req);
+  let call = running.get(entry.key);
+  if (call) {
+    LOG.info('Waiting for a running duplicate call', { key: entry.key });
+    call = call.then(result => ({ ...result, replayed: true }));
+  } else {
+    call = claim(entry, next).finally(() => running.delete(entry.key));
+    running.set(entry.key, call);
+  }
+
+  try {
+    const result = await call;
+    if (result?.replayed) req.http?.res?.set('Idempotent-Replayed', 'true');
+    return result;
+  } catch (error) {
+    if (error.status === 409 || error.status === 422) return req.reject(error.status, error.message);
+    throw error;
+  }
+}
+
+module.exports = {
+  fingerprint,
+  idempotentRequest
+};
@@ -0,0 +1,129 @@
+const cds = require('@sap/cds');
+const { OverloadError } = require('./admission');
+const { logger } = require('./logger');
+const { currentTrace, runInTrace, span } = require('./tracing');
+const { INSERT, UPDATE } = cds.ql;
+
+const LOG = logger('jobs');
+
+/**
+ * In-process background queue for mass change jobs
+ * The action returns as soon as the job is recorded as QUEUED; the S/4HANA
+ * call runs afterwards and its progress is written to masschange.JobStatus:
+ *   QUEUED -> SENT -> ACCEPTED | FAILED
+ * The job runs in the trace of the request that queued it, so its spans and
+ * the correlation ID sent to S/4HANA belong to that request.
+ *
+ * When maxQueue jobs are already waiting, further jobs are rejected with an
+ * OverloadError (503 + Retry-After) instead of piling up in memory.
+ *
+ * Configured via cds.s4.jobs:
+ * - concurrency : jobs sent to S/4HANA at the same time
+ * - maxQueue    : jobs waiting to be sent
+ */
+
+const DEFAULTS = {
+  concurrency: 2,
+  maxQueue: 32
+};
+
+const JobStatus = 'masschange.JobStatus';
+
+const queue = [];
+let running = 0;
+
+function config() {
+  return { ...DEFAULTS, ...cds.env.s4?.jobs };
+}
+
+/**
+ * Writes job fields in their own transaction, independent of any request
+ * @param {string} ID - Job ID
+ * @param {Object} data - Fields to update
+ */
+function saveJob(ID, data) {
+  return cds.tx(tx => tx.run(UPDATE(JobStatus, ID).with(data)));
+}
+
+async function execute({ ID, run, queuedAt, trace }) {
+  return runInTrace(trace, () => span('job', () => executeJob({ ID, run, queuedAt })));
+}
+
+async function executeJob({ ID, run, queuedAt }) {
+  const sentAt = Date.now();
+  try {
+    await saveJob(ID, {
+      status: 'SENT',
+      sentAt: new Date(sentAt).toISOString(),
+      queueTimeMs: sentAt - queuedAt
+    });
+
+    // run() resolves to { failed, httpStatus, message, summary }
+    const outcome = await run();
+    await saveJob(ID, {
+      status: outcome.failed ? 'FAILED' : 'ACCEPTED',
+      finishedAt: new Date().toISOString(),
+      durationMs: Date.now() - sentAt,
+      httpStatus: outcome.httpStatus,
+      message: String(outcome.message || '').substring(0, 1000),
+      responseSummary: JSON.stringify(outcome.summary || [])
+    });
+  } catch (error) {
+    LOG.error('Job failed', { ID, message: error.message });
+    await saveJob(ID, {
+      status: 'FAILED',
+      finishedAt: new Date().toISOString(),
+      durationMs: Date.now() - sentAt,
+      httpStatus: error.response?.status || null,
+      message: String(error.message || 'Unknown error').substring(0, 1000)
+    }).catch(err => LOG.error('Could not record job failure', { ID, message: err.message }));
+  }
+}
+
+function drain() {
+  while (running < config().concurrency && queue.length) {
+    const job = queue.shift();
+    running++;
+    execute(job).finally(() => {
+      running--;
+      drain();
+    });
+  }
+}
+
+/**
+ * Records a job as QUEUED and schedules it for background execution
+ * @param {Object} job - { action, jobName, filters, fieldsToUpdate, backend }, backend = name of the target system
+ * @param {Function} run - async () => { failed, httpStatus, message, summary }
+ * @returns {Promise<string>} Job ID
+ * @throws {OverloadError} When maxQueue jobs are already waiting
+ */
+async function enqueueJob({ action, jobName, filters, fieldsToUpdate, backend }, run) {
+  if (queue.length >= config().maxQueue) {
+    LOG.warn('Job queue full, rejecting job', { action, backend, queued: queue.length });
+    throw new OverloadError(backend, 'job queue full', 503);
+  }
+  const ID = cds.utils.uuid();
+  const queuedAt = Date.now();
+  const trace = currentTrace();
+  await cds.tx(tx => tx.run(INSERT.into(JobStatus).entries({
+    ID,
+    action,
+    jobName,
+    backend,
+    correlationId: trace?.correlationId,
+    status: 'QUEUED',
+    filters: JSON.stringify(filters),
+    fieldsToUpdate: JSON.stringify(fieldsToUpdate),
+    queuedAt: new Date(queuedAt).toISOString()
+  })));
+
+  queue.push({ ID, run, queuedAt, trace });
+  // Start outside the current request, so the handler can return immediately
+  setImmediate(drain);
+  return ID;
+}
+
+module.exports = {
+  enqueueJob
+};
@@ -0,0 +1,143 @@
+const cds = require('@sap/cds');
+const { SELECT } = cds.ql;
+const { readOrderPages } = require('./order-reader');
+const { invalidateOverlapping } = require('./read-cache');
+
+/**
+ * Waits for a mass change to take effect in S/4HANA
+ * The queued job is watched until S/4HANA accepted the $batch, then the
+ * source selection is polled until no order in it still differs from the
+ * job's fieldsToUpdate (orders whose update moved them out of the selection
+ * count as done). Without a job, the selection is polled until it is empty.
+ * Polling starts fast and backs off, and the wait is bounded by a deadline.
+ * On completion, cached reads of the selection are dropped once more, as
+ * reads between acceptance and completion may have seen the old values.
+ *
+ * Configured via cds.s4.watch:
+ * - initialInterval : first polling interval
+ * - maxInterval     : upper bound for the polling interval
+ * - backoff         : interval multiplier per poll
+ * - defaultTimeout  : deadline when the caller gives none
+ * - maxTimeout      : upper bound for caller deadlines
+ * - pageSize        : orders read per request while checking the selection
+ */
+
+const DEFAULTS = {
+  initialInterval: 500,
+  maxInterval: 5000,
+  backoff: 1.5,
+  defaultTimeout: 60000,
+  maxTimeout: 120000,
+  pageSize: 500
+};
+
+const JobStatus = 'masschange.JobStatus';
+
+function config() {
+  return { ...DEFAULTS, ...cds.env.s4?.watch };
+}
+
+const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+
+/**
+ * Polls check() with growing intervals until it returns a truthy value or the deadline passes
+ * @param {Function} check - async () => result, falsy to keep polling
+ * @param {number} deadline - Absolute deadline in ms since epoch
+ * @param {Object} state - { polls } counter, shared across phases
+ * @returns {Promise<*>} Result of check, or undefined on timeout
+ */
+async function pollUntil(check, deadline, state) {
+  const { initialInterval, maxInterval, backoff } = config();
+  let interval = initialInterval;
+  for (;;) {
+    state.polls++;
+    const result = await check();
+    if (result) return result;
+    const remaining = deadline - Date.now();
+    if (remaining <= 0) return undefined;
+    await sleep(Math.min(interval, remaining));
+    interval = Math.min(interval * backoff, maxInterval);
+  }
+}
+
+/**
+ * Values the job sets, as compared with what S/4HANA returns
+ * @param {Object} fieldsToUpdate - Fields of the job
+ * @returns {Object} Property name -> trimmed, upper-case value
+ */
+function expectedValues(fieldsToUpdate) {
+  return Object.fromEntries(Object.entries(fieldsToUpdate || {})
+    .filter(([, value]) => value !== undefined && value !== null && value !== '')
+    .map(([name, value]) => [name, String(value).trim().toUpperCase()]));
+}
+
+/**
+ * Whether no order of the selection still differs from the expected values
+ * Reads the selection page by page (bypassing the read cache) and stops at the
+ * first order that is not updated yet. Without expected values, any order counts.
+ * @param {Object} selection - Filters of the mass change
+ * @param {Object} expected - Result of expectedValues
+ * @param {string} target - Backend that received the job
+ * @returns {Promise<boolean>}
+ */
+async function selectionSettled(selection, expected, target) {
+  const names = Object.keys(expected);
+  const pending = order => !names.length || names.some(name => String(order[name] ?? '').trim().toUpperCase() !== expected[name]);
+  const select = ['SalesOrder', 'SalesOrderItem', ...names];
+  for await (const orders of readOrderPages(selection, { pageSize: config().pageSize, select, target })) {
+    if (orders.some(pending)) return false;
+  }
+  return true;
+}
+
+/**
+ * Waits until a mass change job is done and its selection shows the new values
+ * @param {Object} options - { jobID, filters, timeoutMs }; filters default to the job's filters
+ * @returns {Promise<Object>} { jobID, status, jobStatus, ordersRemaining, polls, elapsedMs }
+ * @throws {Error} status 404 for an unknown job, 400 without jobID and filters
+ */
+async function waitForMassChange({ jobID, filters, timeoutMs }) {
+  const { defaultTimeout, maxTimeout } = config();
+  const started = Date.now();
+  const deadline = started + Math.min(timeoutMs || defaultTimeout, maxTimeout);
+  const state = { polls: 0 };
+  const result = (status, extra) => ({
+    jobID: jobID || null,
+    status,
+    polls: state.polls,
+    elapsedMs: Date.now() - started,
+    ...extra
+  });
+
+  // 1. Wait until S/4HANA accepted (or rejected) the job's $batch
+  let job;
+  if (jobID) {
+    job = await pollUntil(async () => {
+      // Own short transaction per poll: holding the request's connection for the
+      // whole wait would block the job's saveJob() on a single-connection database
+      const row = await cds.tx(tx => tx.run(SELECT.one.from(JobStatus, jobID)));
+      if (!row) throw Object.assign(new Error(`Job ${jobID} not found`), { status: 404 });
+      return ['ACCEPTED', 'FAILED'].includes(row.status) && row;
+    }, deadline, state);
+    if (!job) return result('TIMEOUT', { jobStatus: null, ordersRemaining: null });
+    if (job.status === 'FAILED') return result('FAILED', { jobStatus: job.status, ordersRemaining: null });
+  }
+
+  // 2. Wait until every order of the source selection shows the job's values,
+  // read on the backend that received the job
+  const selection = filters || (job && JSON.parse(job.filters));
+  if (!selection) throw Object.assign(new Error('Either jobID or filters is required'), { status: 400 });
+  const expected = expectedValues(job?.fieldsToUpdate && JSON.parse(job.fieldsToUpdate));
+
+  const done = await pollUntil(() => selectionSettled(selection, expected, job?.backend), deadline, state);
+  if (done) invalidateOverlapping(selection, { settled: true });
+
+  return result(done ? 'COMPLETED' : 'TIMEOUT', {
+    jobStatus: job?.status || null,
+    ordersRemaining: !done
+  });
+}
+
+module.exports = {
+  waitForMassChange
+};
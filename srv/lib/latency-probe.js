@@ -0,0 +1,180 @@
+const cds = require('@sap/cds');
+const http = require('http');
+const https = require('https');
+const { timeout } = require('@sap-cloud-sdk/resilience');
+const { resolveDestination, executeWithDestination } = require('./destination-cache');
+const { getAgents } = require('./connection-pool');
+
+/**
+ * Latency probes toward the S/4HANA backends
+ * All backends are probed concurrently; each gets `samples` sequential GETs
+ * of a cheap resource (the OData service document), so later samples reuse
+ * pooled connections the way real traffic does. Per backend the connect,
+ * time-to-first-byte and total latencies are reported as percentiles.
+ *
+ * A backend is either (see probeTargets in backends.js)
+ * - { endpoint, destination, path, headers }              called through the BTP destination
+ * - { endpoint, url, headers, rejectUnauthorized, agents } called directly
+ * agents are the direct backend's pooled { httpAgent, httpsAgent }, default pool
+ * if omitted; destination calls use the destination's pool toward the
+ * connectivity proxy (see destination-cache.js).
+ * Connect times are only measurable for direct backends and only for samples
+ * that opened a new socket; destination calls go through the SDK and the
+ * connectivity proxy.
+ *
+ * Configured via cds.s4.probe:
+ * - samples    : default requests per backend
+ * - maxSamples : upper bound for caller-provided sample counts
+ * - timeout    : per request
+ */
+
+const DEFAULTS = {
+  samples: 5,
+  maxSamples: 50,
+  timeout: 10000
+};
+
+const PREVIEW_LENGTH = 200;
+
+function config() {
+  return { ...DEFAULTS, ...cds.env.s4?.probe };
+}
+
+function elapsedSince(start) {
+  return Number(process.hrtime.bigint() - start) / 1e6;
+}
+
+/**
+ * Nearest-rank percentile of ascending values
+ * @param {number[]} sorted - Ascending values
+ * @param {number} p - Percentile 0..100
+ * @returns {number|null}
+ */
+function percentile(sorted, p) {
+  if (!sorted.length) return null;
+  const rank = Math.max(Math.ceil((p / 100) * sorted.length), 1);
+  return Math.round(sorted[rank - 1] * 100) / 100;
+}
+
+function summarize(values) {
+  const sorted = values.filter(v => v !== null && v !== undefined).sort((a, b) => a - b);
+  return { p50: percentile(sorted, 50), p95: percentile(sorted, 95), max: percentile(sorted, 100) };
+}
+
+/**
+ * Reads a response stream, keeping only its size and a short preview
+ */
+function drain(stream, onEnd) {
+  let bytes = 0;
+  let preview = '';
+  stream.on('data', chunk => {
+    bytes += chunk.length;
+    if (preview.length < PREVIEW_LENGTH) preview += chunk.toString('utf8', 0, PREVIEW_LENGTH);
+  });
+  stream.on('end', () => onEnd({ bytes, preview: preview.substring(0, PREVIEW_LENGTH) }));
+}
+
+function sampleDirect({ url, headers, rejectUnauthorized, agents = getAgents() }, timeoutMs) {
+  return new Promise((resolve, reject) => {
+    const secure = url.startsWith('https:');
+    const start = process.hrtime.bigint();
+    let connectMs = null;
+    let reused = false;
+
+    const req = (secure ? https : http).request(url, {
+      method: 'GET',
+      headers,
+      agent: secure ? agents.httpsAgent : agents.httpAgent,
+      ...(rejectUnauthorized === false && { rejectUnauthorized: false })
+    }, res => {
+      const ttfbMs = elapsedSince(start);
+      drain(res, ({ bytes, preview }) => {
+        const sample = { statusCode: res.statusCode, connectMs, ttfbMs, totalMs: elapsedSince(start), reused, bytes, preview };
+        if (res.statusCode >= 400) reject(Object.assign(new Error(`HTTP ${res.statusCode}: ${preview}`), { response: { status: res.statusCode } }));
+        else resolve(sample);
+      });
+    });
+
+    req.on('socket', socket => {
+      if (!socket.connecting) {
+        reused = true;
+        return;
+      }
+      socket.once(secure ? 'secureConnect' : 'connect', () => { connectMs = elapsedSince(start); });
+    });
+    req.setTimeout(timeoutMs, () => req.destroy(new Error(`Request timeout after ${timeoutMs}ms`)));
+    req.on('error', reject);
+    req.end();
+  });
+}
+
+async function sampleDestination({ destination, path, headers }, timeoutMs) {
+  await resolveDestination(destination); // keep the destination lookup out of the measurement
+  const start = process.hrtime.bigint();
+  const response = await executeWithDestination(
+    destination,
+    { method: 'get', url: path, headers, responseType: 'stream' },
+    { middleware: [timeout(timeoutMs)] }
+  );
+  const ttfbMs = elapsedSince(start);
+  return new Promise((resolve, reject) => {
+    response.data.on('error', reject);
+    drain(response.data, ({ bytes, preview }) => resolve({
+      statusCode: response.status, connectMs: null, ttfbMs, totalMs: elapsedSince(start), reused: null, bytes, preview
+    }));
+  });
+}
+
+async function probeBackend(backend, samples, timeoutMs) {
+  const sample = backend.destination ? sampleDestination : sampleDirect;
+  const ok = [];
+  const errors = [];
+  for (let i = 0; i < samples; i++) {
+    try {
+      ok.push(await sample(backend, timeoutMs));
+    } catch (error) {
+      errors.push(error);
+    }
+  }
+
+  const last = ok[ok.length - 1];
+  const connect = summarize(ok.map(s => s.connectMs));
+  const ttfb = summarize(ok.map(s => s.ttfbMs));
+  const total = summarize(ok.map(s => s.totalMs));
+  return {
+    endpoint: backend.endpoint,
+    status: !errors.length ? 'SUCCESS' : ok.length ? 'DEGRADED' : 'FAILED',
+    statusCode: last?.statusCode ?? errors[errors.length - 1]?.response?.status ?? null,
+    samples,
+    failures: errors.length,
+    reusedSockets: backend.destination ? null : ok.filter(s => s.reused).length,
+    connectP50Ms: connect.p50,
+    connectP95Ms: connect.p95,
+    ttfbP50Ms: ttfb.p50,
+    ttfbP95Ms: ttfb.p95,
+    ttfbMaxMs: ttfb.max,
+    totalP50Ms: total.p50,
+    totalP95Ms: total.p95,
+    totalMaxMs: total.max,
+    contentLength: last?.bytes ?? null,
+    preview: last?.preview ?? null,
+    error: errors.length ? errors[errors.length - 1].message : null
+  };
+}
+
+/**
+ * Probes all backends concurrently
+ * @param {Object[]} backends - See module description
+ * @param {Object} options - { samples } requests per backend
+ * @returns {Promise<Object[]>} One latency summary per backend, in input order
+ */
+function probeBackends(backends, { samples } = {}) {
+  const settings = config();
+  const count = Math.min(Math.max(Math.trunc(Number(samples) || settings.samples), 1), settings.maxSamples);
+  return Promise.all(backends.map(backend => probeBackend(backend, count, settings.timeout)));
+}
+
+module.exports = {
+  percentile,
+  probeBackends
+};
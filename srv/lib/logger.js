@@ -0,0 +1,106 @@
+const cds = require('@sap/cds');
+
+/**
+ * Structured, leveled logging for the S/4HANA handlers on top of cds.log
+ * - Fields may be passed as a function; it is only called when the level is enabled
+ * - Bodies are truncated before they are serialized
+ * - info/debug output can be sampled per action, warn/error are always logged
+ *
+ * Configured via cds.s4.logging:
+ * - maxBodyLength : characters kept of logged bodies
+ * - sampling      : { <action>: rate 0..1, default: rate } for info/debug output
+ * Levels are set the CAP way, e.g. cds.log.levels['mass-change'] = 'debug'.
+ */
+
+const DEFAULTS = {
+  maxBodyLength: 500,
+  sampling: { default: 1 }
+};
+
+function config() {
+  const logging = cds.env.s4?.logging || {};
+  return { ...DEFAULTS, ...logging, sampling: { ...DEFAULTS.sampling, ...logging.sampling } };
+}
+
+/**
+ * Short preview of a body, truncated before it is serialized
+ * @param {*} value - String, Buffer, stream or JSON-serializable value
+ * @param {number} max - Max characters, defaults to cds.s4.logging.maxBodyLength
+ * @returns {string} Preview
+ */
+function preview(value, max = config().maxBodyLength) {
+  if (value === undefined || value === null) return '';
+  if (typeof value.pipe === 'function') return '[stream]';
+
+  let text;
+  if (typeof value === 'string') text = value.length > max ? value.substring(0, max) : value;
+  else if (Buffer.isBuffer(value)) text = value.subarray(0, max).toString('utf8');
+  else {
+    // Cap long strings inside objects first, so a huge body is never stringified in full
+    text = JSON.stringify(value, (key, v) => (typeof v === 'string' && v.length > max ? v.substring(0, max) : v));
+  }
+
+  const length = typeof value === 'string' || Buffer.isBuffer(value) ? value.length : text.length;
+  return length > max ? `${text.substring(0, max)}...[${length} chars]` : text;
+}
+
+/**
+ * Fields describing a failed S/4HANA call
+ * @param {Error} error - Error, possibly with an HTTP response
+ * @returns {Object} { message, status, body }
+ */
+function errorFields(error) {
+  return {
+    message: error.message,
+    ...(error.response && {
+      status: error.response.status,
+      body: preview(error.response.data)
+    })
+  };
+}
+
+class Logger {
+  constructor(component, sampled = true) {
+    this.component = component;
+    this.LOG = cds.log(component);
+    this.sampled = sampled;
+  }
+
+  /**
+   * Logger for one request of an action, with the action's sampling decision applied
+   * @param {string} action - Action name, key in cds.s4.logging.sampling
+   * @returns {Logger}
+   */
+  forAction(action) {
+    const { sampling } = config();
+    const rate = sampling[action] ?? sampling.default;
+    return new Logger(this.component, rate >= 1 || Math.random() < rate);
+  }
+
+  write(level, message, fields) {
+    if (!this.LOG[`_${level}`]) return;
+    if ((level === 'info' || level === 'debug') && !this.sampled) return;
+    const data = typeof fields === 'function' ? fields() : fields;
+    if (data === undefined) this.LOG[level](message);
+    else this.LOG[level](message, data);
+  }
+
+  error(message, fields) { this.write('error', message, fields); }
+  warn(message, fields) { this.write('warn', message, fields); }
+  info(message, fields) { this.write('info', message, fields); }
+  debug(message, fields) { this.write('debug', message, fields); }
+}
+
+/**
+ * @param {string} component - cds.log id, e.g. 'mass-change'
+ * @returns {Logger}
+ */
+function logger(component) {
+  return new Logger(component);
+}
+
+module.exports = {
+  logger,
+  preview,
+  errorFields
+};
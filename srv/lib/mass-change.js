@@ -0,0 +1,154 @@
+const cds = require('@sap/cds');
+const { postBatch } = require('./s4-client');
+const { ENTITY_SET, buildBulkBatchPayload } = require('./batch-payload');
+const { validateProperties } = require('./metadata');
+const { parseBatchResponse } = require('./multipart-parser');
+const { invalidateOverlapping } = require('./read-cache');
+const { routeBackend } = require('./backends');
+const { logger, errorFields } = require('./logger');
+
+const LOG = logger('bulk');
+
+/**
+ * Bulk mass changes: many filter/field pairs packed into few $batch requests
+ *
+ * Configured via cds.s4.bulk:
+ * - maxEntriesPerBatch : changesets (with their GET selection) per $batch request
+ */
+
+const DEFAULTS = {
+  maxEntriesPerBatch: 10
+};
+
+function config() {
+  return { ...DEFAULTS, ...cds.env.s4?.bulk };
+}
+
+function partMessage(part) {
+  return part.data?.error?.message?.value || part.statusText || `HTTP ${part.status}`;
+}
+
+/**
+ * Sends one $batch for a chunk of entries and maps the response parts back
+ * Each entry produces two parts: its changeset response, then its GET response
+ * @param {Object[]} chunk - [{ index, filters, fieldsToUpdate }]
+ * @param {string} target - Backend name, routed when omitted
+ * @returns {Promise<Object[]>} Entry statuses
+ */
+async function sendChunk(chunk, target) {
+  try {
+    const backend = routeBackend({ target, role: 'write' });
+    const batchResponse = await postBatch(buildBulkBatchPayload(chunk, { host: backend.host }), { backend });
+    const parts = [];
+    for await (const part of parseBatchResponse(batchResponse.data, batchResponse.headers['content-type'])) {
+      parts.push(part);
+    }
+
+    return chunk.map(({ index, filters }, i) => {
+      const failed = [parts[2 * i], parts[2 * i + 1]].find(part => !part || part.status >= 400);
+      if (failed) {
+        return {
+          index,
+          status: 'ERROR',
+          httpStatus: failed?.status || null,
+          message: failed ? partMessage(failed) : 'No response part returned by S/4HANA'
+        };
+      }
+      invalidateOverlapping(filters);
+      return {
+        index,
+        status: 'JOB_SCHEDULED',
+        httpStatus: parts[2 * i].status,
+        message: 'Job scheduled successfully.'
+      };
+    });
+  } catch (error) {
+    LOG.error('Batch request failed', () => errorFields(error));
+    return chunk.map(({ index }) => ({
+      index,
+      status: 'ERROR',
+      httpStatus: error.response?.status || null,
+      message: `Failed to schedule job: ${error.message || 'Unknown error'}`
+    }));
+  }
+}
+
+/**
+ * Summarizes a mass change $batch response by its part statuses
+ * @param {Object} batchResponse - Response of postBatch
+ * @returns {Promise<Object>} { failed, httpStatus, message, summary }
+ */
+async function summarizeBatchResponse(batchResponse) {
+  const summary = [];
+  for await (const part of parseBatchResponse(batchResponse.data, batchResponse.headers['content-type'])) {
+    summary.push({
+      status: part.status,
+      changeset: part.changeset,
+      ...(part.status >= 400 && { message: partMessage(part) })
+    });
+  }
+
+  const failed = summary.find(part => part.status >= 400);
+  return {
+    failed: Boolean(failed),
+    httpStatus: failed ? failed.status : batchResponse.status,
+    message: failed ? `S/4HANA rejected the request: ${failed.message}` : 'Batch accepted by S/4HANA',
+    summary
+  };
+}
+
+/**
+ * Schedules a list of mass changes with as few $batch requests as allowed
+ * @param {Object[]} entries - [{ filters, fieldsToUpdate }]
+ * @param {Object} options - { target } backend name, each $batch is routed when omitted
+ * @returns {Promise<{batches: number, results: Object[]}>} Status per entry, in input order
+ */
+async function runBulkMassChange(entries, { target } = {}) {
+  const results = [];
+  const valid = [];
+  for (const [index, entry] of entries.entries()) {
+    if (!entry?.filters || !entry?.fieldsToUpdate) {
+      results.push({
+        index,
+        status: 'ERROR',
+        httpStatus: null,
+        message: 'Missing required parameters: filters or fieldsToUpdate'
+      });
+      continue;
+    }
+    // Checked against the cached $metadata, invalid entries are not sent
+    const problems = await validateProperties(ENTITY_SET, entry.fieldsToUpdate);
+    if (problems.length) {
+      results.push({
+        index,
+        status: 'ERROR',
+        httpStatus: null,
+        message: `Invalid fieldsToUpdate: ${problems.join('; ')}`
+      });
+      continue;
+    }
+    valid.push({ index, filters: entry.filters, fieldsToUpdate: entry.fieldsToUpdate });
+  }
+
+  const { maxEntriesPerBatch } = config();
+  const chunks = [];
+  for (let i = 0; i < valid.length; i += maxEntriesPerBatch) {
+    chunks.push(valid.slice(i, i + maxEntriesPerBatch));
+  }
+
+  // Chunks go out one after the other, S/4 processes each $batch in one work process
+  for (const chunk of chunks) {
+    LOG.info('Sending batch', { massChanges: chunk.length });
+    results.push(...await sendChunk(chunk, target));
+  }
+
+  return {
+    batches: chunks.length,
+    results: results.sort((a, b) => a.index - b.index)
+  };
+}
+
+module.exports = {
+  runBulkMassChange,
+  summarizeBatchResponse
+};
@@ -0,0 +1,201 @@
+const cds = require('@sap/cds');
+const fs = require('fs/promises');
+const path = require('path');
+const { getFromService } = require('./s4-client');
+const { defaultBackend } = require('./backends');
+const { logger } = require('./logger');
+
+const LOG = logger('metadata');
+
+/**
+ * Cached $metadata of RFM_MANAGE_SALES_ORDERS_SRV, parsed into a compact EDM model
+ * The model is kept in memory and on disk. Once older than maxAge it is
+ * revalidated with If-None-Match / If-Modified-Since, so an unchanged
+ * document costs a 304 instead of a full download. If S/4HANA cannot be
+ * reached the last known model keeps being served.
+ * It is read from the default backend (cds.s4.routing.default); all
+ * registered backends are expected to expose the same service version.
+ *
+ * Model: {
+ *   namespace,
+ *   entitySets:  { <set>: <type> },
+ *   entityTypes: { <type>: { keys: [...], properties: { <name>: { type, maxLength, nullable } } } }
+ * }
+ *
+ * Configured via cds.s4.metadata:
+ * - maxAge : how long the model is used without asking S/4HANA
+ * - dir    : directory for the on-disk copy, empty to keep it in memory only
+ */
+
+const DEFAULTS = {
+  maxAge: 10 * 60 * 1000,
+  dir: '/tmp/s4-metadata'
+};
+
+const METADATA_PATH = '/$metadata?sap-client=200';
+
+let entry;         // { model, etag, lastModified, bytes, checkedAt, source }
+let diskLoaded = false;
+let inFlight;      // Promise of a running revalidation
+
+function config() {
+  return { ...DEFAULTS, ...cds.env.s4?.metadata };
+}
+
+function attributes(text) {
+  const result = {};
+  for (const [, name, value] of text.matchAll(/([\w:.-]+)="([^"]*)"/g)) result[name] = value;
+  return result;
+}
+
+/**
+ * Parses an OData V2 EDMX document into the compact model
+ * Only what validation needs is kept: entity sets, keys and property facets.
+ * @param {string} xml - $metadata document
+ * @returns {Object} Model
+ */
+function parseEdmx(xml) {
+  const schema = /<Schema\b([^>]*)>/.exec(xml);
+  const model = { namespace: schema ? attributes(schema[1]).Namespace : undefined, entitySets: {}, entityTypes: {} };
+
+  for (const [, head, body] of xml.matchAll(/<EntityType\b([^>]*)>([\s\S]*?)<\/EntityType>/g)) {
+    const properties = {};
+    for (const [, attrs] of body.matchAll(/<Property\b([^>]*?)\/?>/g)) {
+      const { Name, Type, MaxLength, Nullable } = attributes(attrs);
+      properties[Name] = {
+        type: Type,
+        ...(MaxLength && MaxLength !== 'Max' && { maxLength: Number(MaxLength) }),
+        ...(Nullable === 'false' && { nullable: false })
+      };
+    }
+    const keys = [...body.matchAll(/<PropertyRef\b([^>]*?)\/?>/g)].map(([, attrs]) => attributes(attrs).Name);
+    model.entityTypes[attributes(head).Name] = { keys, properties };
+  }
+
+  for (const [, attrs] of xml.matchAll(/<EntitySet\b([^>]*?)\/?>/g)) {
+    const { Name, EntityType } = attributes(attrs);
+    model.entitySets[Name] = EntityType.split('.').pop();
+  }
+  return model;
+}
+
+function cacheFile() {
+  const { dir } = config();
+  return dir ? path.join(dir, `${defaultBackend().name}.json`) : undefined;
+}
+
+async function loadFromDisk() {
+  diskLoaded = true;
+  const file = cacheFile();
+  if (!file) return;
+  try {
+    entry = { ...JSON.parse(await fs.readFile(file, 'utf8')), source: 'disk' };
+    LOG.debug('Metadata loaded from disk', () => ({ file, etag: entry.etag }));
+  } catch (err) {
+    if (err.code !== 'ENOENT') LOG.warn('Could not read cached metadata', { file, message: err.message });
+  }
+}
+
+function saveToDisk() {
+  const file = cacheFile();
+  if (!file) return;
+  const { source, ...persisted } = entry;
+  fs.mkdir(path.dirname(file), { recursive: true })
+    .then(() => fs.writeFile(file, JSON.stringify(persisted)))
+    .catch(err => LOG.warn('Could not write cached metadata', { file, message: err.message }));
+}
+
+async function revalidate() {
+  const headers = {
+    'Accept': 'application/xml',
+    ...(entry?.etag && { 'If-None-Match': entry.etag }),
+    ...(entry?.lastModified && { 'If-Modified-Since': entry.lastModified })
+  };
+
+  let response;
+  try {
+    response = await getFromService(METADATA_PATH, headers);
+  } catch (error) {
+    if (error.response?.status !== 304 || !entry) throw error;
+    response = error.response; // axios treats 304 as an error
+  }
+
+  if (response.status === 304 && entry) {
+    entry = { ...entry, checkedAt: Date.now(), source: 'not-modified' };
+  } else {
+    const xml = String(response.data);
+    entry = {
+      model: parseEdmx(xml),
+      etag: response.headers?.etag,
+      lastModified: response.headers?.['last-modified'],
+      bytes: Buffer.byteLength(xml),
+      checkedAt: Date.now(),
+      source: 'downloaded'
+    };
+    LOG.info('Metadata downloaded', () => ({ bytes: entry.bytes, etag: entry.etag, entityTypes: Object.keys(entry.model.entityTypes).length }));
+  }
+  saveToDisk();
+  return entry;
+}
+
+/**
+ * Returns the cached metadata, revalidating it when older than maxAge
+ * @param {Object} options - { revalidate: true } to ask S/4HANA regardless of age
+ * @returns {Promise<Object>} { model, etag, lastModified, bytes, checkedAt, source },
+ *   source = 'memory' | 'disk' | 'not-modified' | 'downloaded' | 'stale'
+ */
+async function getMetadata({ revalidate: force = false } = {}) {
+  if (!diskLoaded) await loadFromDisk();
+  if (!force && entry && Date.now() - entry.checkedAt < config().maxAge) {
+    return entry.source === 'disk' ? entry : { ...entry, source: 'memory' };
+  }
+
+  if (!inFlight) {
+    inFlight = revalidate().finally(() => { inFlight = undefined; });
+  }
+  try {
+    return await inFlight;
+  } catch (error) {
+    if (!entry) throw error;
+    LOG.warn('Metadata revalidation failed, using cached model', { message: error.message });
+    return { ...entry, source: 'stale' };
+  }
+}
+
+/**
+ * Checks property values against the entity type of an entity set:
+ * unknown property names and strings longer than MaxLength
+ * If the metadata cannot be loaded at all, nothing is reported (S/4HANA still validates).
+ * @param {string} entitySet - e.g. 'C_RFM_MaSaDoEditSlsOrdItm'
+ * @param {Object} values - { property: value }
+ * @returns {Promise<string[]>} Problems, empty when valid
+ */
+async function validateProperties(entitySet, values) {
+  let model;
+  try {
+    ({ model } = await getMetadata());
+  } catch (error) {
+    LOG.warn('Metadata unavailable, skipping property validation', { message: error.message });
+    return [];
+  }
+
+  const entityType = model.entityTypes[model.entitySets[entitySet]];
+  if (!entityType) return [`Entity set ${entitySet} not found in $metadata`];
+
+  const problems = [];
+  for (const [name, value] of Object.entries(values || {})) {
+    if (value === undefined || value === null) continue;
+    const property = entityType.properties[name];
+    if (!property) problems.push(`Unknown property ${name}`);
+    else if (property.maxLength && String(value).length > property.maxLength) {
+      problems.push(`${name} exceeds max length ${property.maxLength}`);
+    }
+  }
+  return problems;
+}
+
+module.exports = {
+  parseEdmx,
+  getMetadata,
+  validateProperties
+};
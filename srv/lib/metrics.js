@@ -0,0 +1,215 @@
+const cds = require('@sap/cds');
+const crypto = require('crypto');
+const { monitorEventLoopDelay } = require('perf_hooks');
+const { span, recordSpan } = require('./tracing');
+
+/**
+ * Process-local metrics in the Prometheus text exposition format
+ * - s4_stage_duration_seconds   : histogram per stage of an S/4HANA call
+ *   (destination_resolve, csrf_fetch, payload_build, batch_post, response_parse, ...)
+ * - s4_http_responses_total     : S/4HANA responses per stage and HTTP code ("none" = no response)
+ * - s4_action_duration_seconds  : histogram per service action
+ * - s4_action_results_total     : action outcomes per action and status
+ * - nodejs_eventloop_lag_seconds, nodejs_heap_*_bytes, process_resident_memory_bytes
+ * Served by srv/server.js. Scrapers authenticate with the bearer token from
+ * cds.s4.metrics.token (set it in the environment, cds_s4_metrics_token);
+ * without a token the endpoint is only served outside the production profile.
+ *
+ * Configured via cds.s4.metrics:
+ * - enabled : serve the endpoint
+ * - path    : URL path of the endpoint
+ * - token   : bearer token required from scrapers
+ * - buckets : histogram bucket bounds in seconds
+ */
+
+const DEFAULTS = {
+  enabled: true,
+  path: '/metrics',
+  buckets: [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+};
+
+function config() {
+  return { ...DEFAULTS, ...cds.env.s4?.metrics };
+}
+
+function escapeLabel(value) {
+  return String(value).replace(/\\/g, '\\\\').replace(/"/g, '\\"').replace(/\n/g, '\\n');
+}
+
+function labelString(labels) {
+  const pairs = Object.entries(labels).map(([name, value]) => `${name}="${escapeLabel(value)}"`);
+  return pairs.length ? `{${pairs.join(',')}}` : '';
+}
+
+class Counter {
+  constructor(name, help) {
+    this.name = name;
+    this.help = help;
+    this.series = new Map(); // label string -> value
+  }
+
+  inc(labels, value = 1) {
+    const key = labelString(labels);
+    this.series.set(key, (this.series.get(key) || 0) + value);
+  }
+
+  render() {
+    const lines = [`# HELP ${this.name} ${this.help}`, `# TYPE ${this.name} counter`];
+    for (const [key, value] of this.series) lines.push(`${this.name}${key} ${value}`);
+    return lines;
+  }
+}
+
+class Histogram {
+  constructor(name, help) {
+    this.name = name;
+    this.help = help;
+    this.series = new Map(); // label string -> { labels, counts, sum, count }
+  }
+
+  observe(labels, seconds) {
+    const key = labelString(labels);
+    let series = this.series.get(key);
+    if (!series) {
+      series = { labels, buckets: config().buckets, counts: new Array(config().buckets.length).fill(0), sum: 0, count: 0 };
+      this.series.set(key, series);
+    }
+    const index = series.buckets.findIndex(bound => seconds <= bound);
+    if (index >= 0) series.counts[index]++;
+    series.sum += seconds;
+    series.count++;
+  }
+
+  render() {
+    const lines = [`# HELP ${this.name} ${this.help}`, `# TYPE ${this.name} histogram`];
+    for (const [key, { labels, buckets, counts, sum, count }] of this.series) {
+      let cumulative = 0;
+      buckets.forEach((bound, i) => {
+        cumulative += counts[i];
+        lines.push(`${this.name}_bucket${labelString({ ...labels, le: bound })} ${cumulative}`);
+      });
+      lines.push(`${this.name}_bucket${labelString({ ...labels, le: '+Inf' })} ${count}`);
+      lines.push(`${this.name}_sum${key} ${sum}`);
+      lines.push(`${this.name}_count${key} ${count}`);
+    }
+    return lines;
+  }
+}
+
+const stageDuration = new Histogram('s4_stage_duration_seconds', 'Duration of the stages of S/4HANA calls');
+const httpResponses = new Counter('s4_http_responses_total', 'S/4HANA responses by stage and HTTP status code');
+const actionDuration = new Histogram('s4_action_duration_seconds', 'Duration of service actions');
+const actionResults = new Counter('s4_action_results_total', 'Service action outcomes by status');
+
+let eventLoop;
+
+function eventLoopMonitor() {
+  if (!eventLoop) {
+    eventLoop = monitorEventLoopDelay({ resolution: 20 });
+    eventLoop.enable();
+  }
+  return eventLoop;
+}
+
+function elapsedSince(start) {
+  return Number(process.hrtime.bigint() - start) / 1e9;
+}
+
+/**
+ * Runs fn and records its duration under the stage, and as a span of the
+ * current trace; when the result or the error carries an HTTP status
+ * (response.status / status), it is counted too
+ * @param {string} stage - e.g. 'batch_post'
+ * @param {Function} fn - async () => result
+ * @returns {Promise<*>} Result of fn
+ */
+async function timeStage(stage, fn) {
+  const start = process.hrtime.bigint();
+  try {
+    const result = await span(stage, fn);
+    stageDuration.observe({ stage, outcome: 'ok' }, elapsedSince(start));
+    if (result?.status) httpResponses.inc({ stage, code: result.status });
+    return result;
+  } catch (error) {
+    stageDuration.observe({ stage, outcome: 'error' }, elapsedSince(start));
+    httpResponses.inc({ stage, code: error?.response?.status || 'none' });
+    throw error;
+  }
+}
+
+/**
+ * Records a stage duration measured by the caller, also as a span
+ * @param {string} stage - e.g. 'response_parse'
+ * @param {bigint} start - process.hrtime.bigint() at the start of the stage
+ * @param {string} outcome - 'ok' or 'error'
+ */
+function observeStage(stage, start, outcome = 'ok') {
+  stageDuration.observe({ stage, outcome }, elapsedSince(start));
+  recordSpan(stage, start, outcome);
+}
+
+/**
+ * Records an action's duration and outcome
+ * @param {string} action - e.g. 'scheduleMassChange'
+ * @param {bigint} start - process.hrtime.bigint() when the action started
+ * @param {string} status - e.g. 'QUEUED', 'ERROR', 'SUCCESS'
+ */
+function observeAction(action, start, status) {
+  actionDuration.observe({ action }, elapsedSince(start));
+  actionResults.inc({ action, status });
+}
+
+/**
+ * All metrics in the Prometheus text format
+ * @returns {string}
+ */
+function renderMetrics() {
+  const lag = eventLoopMonitor();
+  const memory = process.memoryUsage();
+  const lines = [
+    ...stageDuration.render(),
+    ...httpResponses.render(),
+    ...actionDuration.render(),
+    ...actionResults.render(),
+    '# HELP nodejs_eventloop_lag_seconds Event loop delay since the previous scrape',
+    '# TYPE nodejs_eventloop_lag_seconds gauge',
+    ...[0.5, 0.9, 0.99].map(q => `nodejs_eventloop_lag_seconds{quantile="${q}"} ${(lag.percentile(q * 100) || 0) / 1e9}`),
+    `nodejs_eventloop_lag_seconds{quantile="1"} ${(lag.max || 0) / 1e9}`,
+    '# HELP nodejs_heap_used_bytes V8 heap in use',
+    '# TYPE nodejs_heap_used_bytes gauge',
+    `nodejs_heap_used_bytes ${memory.heapUsed}`,
+    '# HELP nodejs_heap_total_bytes V8 heap allocated',
+    '# TYPE nodejs_heap_total_bytes gauge',
+    `nodejs_heap_total_bytes ${memory.heapTotal}`,
+    '# HELP process_resident_memory_bytes Resident set size',
+    '# TYPE process_resident_memory_bytes gauge',
+    `process_resident_memory_bytes ${memory.rss}`
+  ];
+  lag.reset();
+  return `${lines.join('\n')}\n`;
+}
+
+/**
+ * Whether a scrape request carries the configured bearer token
+ * @param {string} authorization - Authorization header of the request
+ * @returns {boolean} true as well when no token is configured
+ */
+function isAuthorizedScrape(authorization) {
+  const { token } = config();
+  if (!token) return true;
+  const match = /^Bearer\s+(.+)$/i.exec(authorization || '');
+  if (!match) return false;
+  // Compare digests, timingSafeEqual needs equal lengths
+  const digest = value => crypto.createHash('sha256').update(String(value)).digest();
+  return crypto.timingSafeEqual(digest(match[1]), digest(token));
+}
+
+module.exports = {
+  config,
+  isAuthorizedScrape,
+  eventLoopMonitor,
+  timeStage,
+  observeStage,
+  observeAction,
+  renderMetrics
+};
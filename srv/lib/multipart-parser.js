@@ -0,0 +1,218 @@
+const { observeStage } = require('./metrics');
+
+/**
+ * Incremental parser for OData $batch responses (multipart/mixed)
+ * Parts are emitted as soon as their closing boundary has arrived, so a
+ * large response never has to be held in memory as a whole, and a failed
+ * part can abort the read before the rest is downloaded.
+ *
+ * Each emitted part looks like:
+ *   { status, statusText, headers, body, data, changeset }
+ * where data is the parsed JSON body (or undefined) and changeset is the
+ * boundary of the enclosing changeset (or null for top-level parts).
+ */
+
+const CRLF = Buffer.from('\r\n');
+
+/**
+ * Error raised for a batch part that S/4HANA answered with an HTTP error
+ */
+class BatchPartError extends Error {
+  constructor(part) {
+    const detail = part.data?.error?.message?.value || part.body.substring(0, 200);
+    super(`S/4HANA batch part failed with HTTP ${part.status}: ${detail}`);
+    this.name = 'BatchPartError';
+    this.status = part.status;
+    this.part = part;
+  }
+}
+
+/**
+ * Reads the boundary parameter of a multipart Content-Type header
+ * @param {string} contentType - e.g. 'multipart/mixed; boundary=abc'
+ * @returns {string|undefined} Boundary
+ */
+function boundaryOf(contentType) {
+  const match = /boundary=(?:"([^"]+)"|([^;\s]+))/i.exec(contentType || '');
+  return match ? match[1] || match[2] : undefined;
+}
+
+/**
+ * Splits a multipart body into its raw parts, fed chunk by chunk
+ * Only the bytes of the part currently being received are buffered.
+ */
+class PartSplitter {
+  constructor(boundary) {
+    this.delimiter = Buffer.from(`--${boundary}`);
+    this.buffer = Buffer.alloc(0);
+    this.searchFrom = 0;
+    this.started = false; // preamble before the first delimiter is skipped
+    this.done = false;
+  }
+
+  /**
+   * @param {Buffer} chunk - Next slice of the body
+   * @returns {Buffer[]} Parts completed by this chunk
+   */
+  push(chunk) {
+    if (this.done) return [];
+    this.buffer = this.buffer.length ? Buffer.concat([this.buffer, chunk]) : chunk;
+    const parts = [];
+
+    for (;;) {
+      const index = this.findDelimiter();
+      if (index === -1) {
+        // Resume the search where a delimiter could still start
+        this.searchFrom = Math.max(this.buffer.length - this.delimiter.length - 2, 0);
+        break;
+      }
+
+      const next = index + this.delimiter.length;
+      if (this.buffer.length < next + 2) {
+        this.searchFrom = index;
+        break; // need to see what follows the delimiter
+      }
+
+      const closing = this.buffer[next] === 0x2d && this.buffer[next + 1] === 0x2d; // '--'
+      const lineEnd = closing ? next + 2 : this.buffer.indexOf(0x0a, next);
+      if (lineEnd === -1) {
+        this.searchFrom = index;
+        break; // delimiter line not complete yet
+      }
+
+      if (this.started) parts.push(stripTrailingNewline(this.buffer.subarray(0, index)));
+      this.started = true;
+
+      if (closing) {
+        this.done = true;
+        this.buffer = Buffer.alloc(0);
+        break;
+      }
+      this.buffer = this.buffer.subarray(lineEnd + 1);
+      this.searchFrom = 0;
+    }
+    return parts;
+  }
+
+  /** Delimiters only count at the start of a line */
+  findDelimiter() {
+    let index = this.buffer.indexOf(this.delimiter, this.searchFrom);
+    while (index > 0 && this.buffer[index - 1] !== 0x0a) {
+      index = this.buffer.indexOf(this.delimiter, index + 1);
+    }
+    return index;
+  }
+}
+
+function stripTrailingNewline(buffer) {
+  if (buffer.length >= 2 && buffer.subarray(-2).equals(CRLF)) return buffer.subarray(0, -2);
+  if (buffer.length >= 1 && buffer[buffer.length - 1] === 0x0a) return buffer.subarray(0, -1);
+  return buffer;
+}
+
+/**
+ * Splits a header block from the content that follows the blank line
+ * @param {string} text - Header lines, blank line, content
+ * @returns {{ lines: string[], content: string }}
+ */
+function splitHead(text) {
+  const match = /\r?\n\r?\n/.exec(text);
+  if (!match) return { lines: text.split(/\r?\n/), content: '' };
+  return {
+    lines: text.substring(0, match.index).split(/\r?\n/),
+    content: text.substring(match.index + match[0].length)
+  };
+}
+
+function parseHeaders(lines) {
+  const headers = {};
+  for (const line of lines) {
+    const colon = line.indexOf(':');
+    if (colon > 0) headers[line.substring(0, colon).trim().toLowerCase()] = line.substring(colon + 1).trim();
+  }
+  return headers;
+}
+
+/**
+ * Parses the embedded HTTP response of an application/http part
+ * @param {string} text - Status line, headers, blank line, body
+ * @param {string|null} changeset - Enclosing changeset boundary
+ * @returns {Object} Parsed part
+ */
+function parseHttpMessage(text, changeset) {
+  const { lines, content } = splitHead(text);
+  const statusLine = /^HTTP\/\d\.\d\s+(\d{3})\s*(.*)$/.exec(lines[0] || '');
+  const headers = parseHeaders(lines.slice(1));
+  const body = content.replace(/\r?\n$/, '');
+
+  let data;
+  if (body && /json/i.test(headers['content-type'] || '')) {
+    try {
+      data = JSON.parse(body);
+    } catch {
+      data = undefined;
+    }
+  }
+
+  return {
+    status: statusLine ? Number(statusLine[1]) : 0,
+    statusText: statusLine ? statusLine[2] : '',
+    headers,
+    body,
+    data,
+    changeset
+  };
+}
+
+/**
+ * Turns one raw MIME part into parsed HTTP parts (a changeset yields several)
+ * @param {Buffer} raw - Raw part incl. MIME headers
+ * @returns {Object[]} Parsed parts
+ */
+function parseRawPart(raw) {
+  const { lines, content } = splitHead(raw.toString('utf8'));
+  const mimeHeaders = parseHeaders(lines);
+  const contentType = mimeHeaders['content-type'] || '';
+
+  if (/^multipart\/mixed/i.test(contentType)) {
+    const changeset = boundaryOf(contentType);
+    const splitter = new PartSplitter(changeset);
+    return splitter.push(Buffer.from(content, 'utf8'))
+      .map(inner => parseHttpMessage(splitHead(inner.toString('utf8')).content, changeset));
+  }
+  return [parseHttpMessage(content, null)];
+}
+
+/**
+ * Parses a $batch response incrementally
+ * The time until the last part is recorded as the response_parse stage; for
+ * streamed responses it includes receiving the body.
+ * @param {AsyncIterable<Buffer>|Buffer|string} source - Response stream or complete body
+ * @param {string} contentType - Content-Type header of the batch response
+ * @yields {Object} Parsed parts in response order
+ */
+async function* parseBatchResponse(source, contentType) {
+  const boundary = boundaryOf(contentType);
+  if (!boundary) throw new Error(`Batch response is not multipart: ${contentType}`);
+
+  const splitter = new PartSplitter(boundary);
+  const chunks = typeof source === 'string' || Buffer.isBuffer(source) ? [source] : source;
+  const start = process.hrtime.bigint();
+  let outcome = 'error';
+  try {
+    for await (const chunk of chunks) {
+      const raws = splitter.push(Buffer.isBuffer(chunk) ? chunk : Buffer.from(chunk, 'utf8'));
+      for (const raw of raws) yield* parseRawPart(raw);
+      if (splitter.done) break;
+    }
+    outcome = 'ok';
+  } finally {
+    observeStage('response_parse', start, outcome);
+  }
+}
+
+module.exports = {
+  BatchPartError,
+  boundaryOf,
+  parseBatchResponse
+};
@@ -0,0 +1,163 @@
+const cds = require('@sap/cds');
+const { postBatch } = require('./s4-client');
+const { buildBatchPayload } = require('./batch-payload');
+const { parseBatchResponse, BatchPartError } = require('./multipart-parser');
+const { routeBackend } = require('./backends');
+
+/**
+ * Paged reads of C_RFM_MaSaDoEditSlsOrdItm through the $batch endpoint
+ * Pages follow the server's __next link ($skiptoken) when S/4HANA sends one,
+ * otherwise a $skip cursor. The cursor is handed to callers as an opaque
+ * continuation token.
+ * The first page is routed to a read backend (or the caller's target); the
+ * token pins the following pages to the same backend, whose skiptokens they carry.
+ *
+ * Configured via cds.s4.read:
+ * - pageSize       : default page size
+ * - maxPageSize    : upper bound for caller-provided page sizes
+ * - sampleSize     : default sample size of countOrders
+ * - maxSampleSize  : upper bound for caller-provided sample sizes
+ */
+
+const DEFAULTS = {
+  pageSize: 100,
+  maxPageSize: 1000,
+  sampleSize: 5,
+  maxSampleSize: 50
+};
+
+function config() {
+  return { ...DEFAULTS, ...cds.env.s4?.read };
+}
+
+function clampPageSize(pageSize) {
+  const { pageSize: defaultSize, maxPageSize } = config();
+  const size = Number(pageSize) || defaultSize;
+  return Math.min(Math.max(Math.trunc(size), 1), maxPageSize);
+}
+
+function encodeToken(cursor) {
+  return Buffer.from(JSON.stringify(cursor)).toString('base64url');
+}
+
+/**
+ * Reads a caller-provided continuation token
+ * Its values end up in the GET request line of the $batch body, so only a
+ * non-negative integer skip, a string skiptoken and a string backend are accepted.
+ * @param {string} token - Token from a previous readOrderPage
+ * @returns {Object} Cursor { skip, skiptoken, backend }
+ * @throws {Error} status 400 for a malformed token
+ */
+function decodeToken(token) {
+  if (!token) return {};
+  let cursor;
+  try {
+    cursor = JSON.parse(Buffer.from(token, 'base64url').toString('utf8'));
+  } catch {
+    cursor = undefined;
+  }
+  const valid = cursor && typeof cursor === 'object' && !Array.isArray(cursor)
+    && (cursor.skip === undefined || (Number.isSafeInteger(cursor.skip) && cursor.skip >= 0))
+    && (cursor.skiptoken === undefined || typeof cursor.skiptoken === 'string')
+    && (cursor.backend === undefined || typeof cursor.backend === 'string');
+  if (!valid) throw Object.assign(new Error('Invalid continuation token'), { status: 400 });
+  return cursor;
+}
+
+/**
+ * Reads the $skiptoken of an OData V2 __next link
+ * @param {string} next - e.g. 'https://host/...C_RFM_MaSaDoEditSlsOrdItm?$skiptoken=100'
+ * @returns {string|undefined} Skiptoken
+ */
+function skiptokenOf(next) {
+  const match = /[?&]\$skiptoken=([^&]*)/.exec(next || '');
+  return match ? decodeURIComponent(match[1]) : undefined;
+}
+
+/**
+ * Reads one page of orders matching the filters
+ * @param {Object} filters - Selection criteria for orders
+ * @param {Object} options - { pageSize, continuationToken, select, target }, select = properties to fetch,
+ *                           target = backend name, routed when omitted
+ * @returns {Promise<{results: Object[], nextToken: string|null, backend: string}>}
+ * @throws {Error} status 400 for an invalid continuation token or unknown target
+ */
+async function readOrderPage(filters, { pageSize, continuationToken, select, target } = {}) {
+  const top = clampPageSize(pageSize);
+  const cursor = decodeToken(continuationToken);
+  const skip = cursor.skip || 0;
+  const backend = routeBackend({ target: target || cursor.backend, role: 'read' });
+
+  const batchPayload = buildBatchPayload(filters, null, { top, skip, skiptoken: cursor.skiptoken, select }, { host: backend.host });
+  const batchResponse = await postBatch(batchPayload, { responseType: 'stream', callType: 'read', backend });
+
+  let results = [];
+  let next;
+  for await (const part of parseBatchResponse(batchResponse.data, batchResponse.headers['content-type'])) {
+    if (part.status >= 400) {
+      batchResponse.data.destroy?.(); // stop downloading the remaining parts
+      throw new BatchPartError(part);
+    }
+    results = results.concat(part.data?.d?.results || []);
+    next = part.data?.d?.__next || next;
+  }
+
+  let nextToken = null;
+  const skiptoken = skiptokenOf(next);
+  if (skiptoken) nextToken = encodeToken({ skiptoken, backend: backend.name });
+  else if (results.length === top) nextToken = encodeToken({ skip: skip + top, backend: backend.name });
+
+  return { results, nextToken, backend: backend.name };
+}
+
+/**
+ * Counts the orders matching the filters and reads the first few of them
+ * One GET with $inlinecount=allpages, so S/4HANA returns the total next to the sample
+ * @param {Object} filters - Selection criteria for orders
+ * @param {Object} options - { sampleSize, select, target }, target = backend name, routed when omitted
+ * @returns {Promise<{count: number|null, sample: Object[], backend: string}>} count is null if S/4HANA sent no __count
+ */
+async function countOrders(filters, { sampleSize, select, target } = {}) {
+  const { sampleSize: defaultSize, maxSampleSize } = config();
+  const top = Math.min(Math.max(Math.trunc(Number(sampleSize ?? defaultSize) || 0), 0), maxSampleSize);
+
+  const backend = routeBackend({ target, role: 'read' });
+  const batchPayload = buildBatchPayload(filters, null, { top, select, inlinecount: true }, { host: backend.host });
+  const batchResponse = await postBatch(batchPayload, { responseType: 'stream', callType: 'read', backend });
+
+  let count = null;
+  let sample = [];
+  for await (const part of parseBatchResponse(batchResponse.data, batchResponse.headers['content-type'])) {
+    if (part.status >= 400) {
+      batchResponse.data.destroy?.();
+      throw new BatchPartError(part);
+    }
+    // OData V2 sends the inline count as a string
+    if (part.data?.d?.__count !== undefined) count = Number(part.data.d.__count);
+    sample = sample.concat(part.data?.d?.results || []);
+  }
+  return { count, sample, backend: backend.name };
+}
+
+/**
+ * Reads all orders matching the filters, one page at a time
+ * Pages are only requested as the consumer asks for them, so breaking out of
+ * the loop stops reading (used by job-watcher.js to check a selection).
+ * @param {Object} filters - Selection criteria for orders
+ * @param {Object} options - { pageSize, select, target }
+ * @yields {Object[]} Orders of each page
+ */
+async function* readOrderPages(filters, { pageSize, select, target } = {}) {
+  let continuationToken;
+  do {
+    const page = await readOrderPage(filters, { pageSize, continuationToken, select, target });
+    yield page.results;
+    continuationToken = page.nextToken;
+  } while (continuationToken);
+}
+
+module.exports = {
+  countOrders,
+  readOrderPage,
+  readOrderPages
+};
@@ -0,0 +1,112 @@
+const cds = require('@sap/cds');
+const fs = require('fs/promises');
+const path = require('path');
+const zlib = require('zlib');
+const { promisify } = require('util');
+const { logger } = require('./logger');
+
+const LOG = logger('capture');
+
+const gzip = promisify(zlib.gzip);
+
+/**
+ * Opt-in, sampled capture of $batch request/response pairs for debugging
+ * The last N captures are kept in an in-memory ring; optionally they are
+ * spilled to disk gzip-compressed, asynchronously, with rotation.
+ *
+ * Configured via cds.s4.capture (off by default):
+ * - enabled       : turn capturing on
+ * - sampleRate    : fraction of requests captured (0..1)
+ * - size          : captures kept in memory
+ * - maxBodyLength : request/response bodies are truncated to this many characters
+ * - spill         : { enabled, dir, maxFiles } for the on-disk copies
+ */
+
+const DEFAULTS = {
+  enabled: false,
+  sampleRate: 1,
+  size: 20,
+  maxBodyLength: 65536,
+  spill: {
+    enabled: false,
+    dir: '/tmp/batch-captures',
+    maxFiles: 50
+  }
+};
+
+const ring = [];
+let spilledFiles; // file names on disk, oldest first; loaded on first spill
+let spilling = Promise.resolve();
+
+function config() {
+  const capture = cds.env.s4?.capture || {};
+  return { ...DEFAULTS, ...capture, spill: { ...DEFAULTS.spill, ...capture.spill } };
+}
+
+function truncate(body, maxBodyLength) {
+  const text = typeof body === 'string' ? body
+    : Buffer.isBuffer(body) ? body.toString('utf8')
+    : JSON.stringify(body ?? '');
+  return text.length > maxBodyLength ? `${text.substring(0, maxBodyLength)}...[truncated ${text.length - maxBodyLength} chars]` : text;
+}
+
+async function spill(entry, { dir, maxFiles }) {
+  if (!spilledFiles) {
+    await fs.mkdir(dir, { recursive: true });
+    spilledFiles = (await fs.readdir(dir)).filter(name => name.endsWith('.json.gz')).sort();
+  }
+
+  const name = `${entry.timestamp.replace(/[:.]/g, '-')}_${entry.id}.json.gz`;
+  await fs.writeFile(path.join(dir, name), await gzip(JSON.stringify(entry)));
+  spilledFiles.push(name);
+
+  while (spilledFiles.length > maxFiles) {
+    await fs.rm(path.join(dir, spilledFiles.shift()), { force: true });
+  }
+}
+
+/**
+ * Records a request/response pair if capturing is enabled and the request is sampled
+ * Never blocks the caller: disk writes are chained in the background.
+ * @param {string} action - Action name, e.g. 'scheduleMassChange'
+ * @param {string|Buffer} requestBody - $batch payload sent to S/4HANA
+ * @param {Object} response - { status, headers, data } or an error response
+ */
+function capture(action, requestBody, response) {
+  const { enabled, sampleRate, size, maxBodyLength, spill: spillConfig } = config();
+  if (!enabled || Math.random() >= sampleRate) return;
+
+  const entry = {
+    id: cds.utils.uuid(),
+    action,
+    timestamp: new Date().toISOString(),
+    request: truncate(requestBody, maxBodyLength),
+    response: response && {
+      status: response.status,
+      headers: response.headers,
+      body: truncate(response.data, maxBodyLength)
+    }
+  };
+
+  ring.push(entry);
+  while (ring.length > size) ring.shift();
+
+  if (spillConfig.enabled) {
+    spilling = spilling
+      .then(() => spill(entry, spillConfig))
+      .catch(err => LOG.warn('Could not write capture to disk', { message: err.message }));
+  }
+}
+
+/**
+ * Captures currently held in memory, newest first
+ * @returns {Object[]}
+ */
+function getCaptures() {
+  return [...ring].reverse();
+}
+
+module.exports = {
+  capture,
+  getCaptures
+};
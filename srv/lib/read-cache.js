@@ -0,0 +1,292 @@
+const cds = require('@sap/cds');
+const { logger } = require('./logger');
+const { getStore, isShared } = require('./shared-store');
+
+const LOG = logger('read-cache');
+
+/**
+ * LRU + TTL cache for readOrders results, keyed on the normalized filters
+ * Entries are dropped when a mass change runs with overlapping filters. As
+ * S/4HANA applies the change in a background job, overlapping selections then
+ * bypass the cache for pendingHold, or until waitForMassChange has seen the
+ * change complete, and are dropped again at that point.
+ * With a shared store (cds.s4.store) the process-local LRU is backed by the
+ * store's 'read' namespace, so instances fill and invalidate each other's
+ * entries; the store copy expires after ttl + staleWhileRevalidate.
+ *
+ * Configured via cds.s4.readCache:
+ * - enabled              : false to always read from S/4HANA
+ * - max                  : max number of cached pages
+ * - ttl                  : time an entry is served as fresh
+ * - staleWhileRevalidate : extra time an expired entry is still served while
+ *                          it is refreshed in the background (0 = off)
+ * - pendingHold          : time overlapping reads bypass the cache after a mass
+ *                          change was accepted, unless it was seen completing
+ */
+
+const DEFAULTS = {
+  enabled: true,
+  max: 500,
+  ttl: 30000,
+  staleWhileRevalidate: 0,
+  pendingHold: 120000
+};
+
+const stats = { hits: 0, staleHits: 0, sharedHits: 0, misses: 0, evictions: 0, invalidations: 0 };
+
+function config() {
+  return { ...DEFAULTS, ...cds.env.s4?.readCache };
+}
+
+/**
+ * Minimal LRU map with per-entry expiry; Map iteration order is the recency order
+ */
+class LruCache {
+  constructor() {
+    this.entries = new Map();
+  }
+
+  /**
+   * @param {string} key
+   * @returns {Object|undefined} Entry { value, filters, expires, staleUntil }
+   */
+  get(key) {
+    const entry = this.entries.get(key);
+    if (!entry) return undefined;
+    if (entry.staleUntil <= Date.now()) {
+      this.entries.delete(key);
+      return undefined;
+    }
+    // Move to the most recently used position
+    this.entries.delete(key);
+    this.entries.set(key, entry);
+    return entry;
+  }
+
+  set(key, entry, max) {
+    this.entries.delete(key);
+    this.entries.set(key, entry);
+    while (this.entries.size > max) {
+      this.entries.delete(this.entries.keys().next().value);
+      stats.evictions++;
+    }
+  }
+
+  delete(key) {
+    return this.entries.delete(key);
+  }
+}
+
+const cache = new LruCache();
+let generation = 0; // bumped on invalidation, so loads started before a mass change are not stored
+let holds = [];     // { filters, until } of mass changes S/4HANA may still be applying
+
+/**
+ * Normalizes filters for matching mass changes against cached reads
+ * Coarser than the selection S/4HANA evaluates (trimmed, case-insensitive),
+ * so overlap checks err on the side of invalidating; not used for keys.
+ * @param {Object} filters - Selection criteria for orders
+ * @returns {Object} Normalized filters
+ */
+function normalizeFilters(filters = {}) {
+  const normalize = value => (value === undefined || value === null ? null : String(value).trim().toUpperCase());
+  return {
+    materialStartsWith: normalize(filters.materialStartsWith),
+    plant: normalize(filters.plant),
+    salesOrg: normalize(filters.salesOrg),
+    creationDate: filters.creationDate ? String(filters.creationDate).substring(0, 10) : null
+  };
+}
+
+/**
+ * Filter values exactly as buildFilter sends them in the $filter
+ * S/4HANA compares these CHAR fields case-sensitively, so '142a' and '142A'
+ * are different selections and must not share a key.
+ * @param {Object} filters - Selection criteria for orders
+ * @returns {string[]} Values in $filter order
+ */
+function selectionOf(filters = {}) {
+  return [filters.materialStartsWith, filters.plant, filters.creationDate, filters.salesOrg].map(String);
+}
+
+/**
+ * Identity of a read: the exact selection plus the options that change the result
+ * Routed reads share entries, as the backends of the read role hold the same data
+ * @param {Object} filters - Selection criteria for orders
+ * @param {Object} options - { pageSize, continuationToken, select, target }
+ * @returns {string} Key
+ */
+function readKey(filters, { pageSize, continuationToken, select, target } = {}) {
+  return JSON.stringify([
+    selectionOf(filters),
+    pageSize || null,
+    continuationToken || null,
+    select ? [...select].sort() : null,
+    target || null
+  ]);
+}
+
+/**
+ * Whether a mass change with writeFilters can touch orders read with readFilters
+ * Plant is ignored on purpose: a mass change moves orders between plants, so
+ * reads of both the source and the target plant are affected.
+ * @param {Object} writeFilters - Normalized filters of the mass change
+ * @param {Object} readFilters - Normalized filters of the cached read
+ * @returns {boolean}
+ */
+function overlaps(writeFilters, readFilters) {
+  const same = (a, b) => a === null || b === null || a === b;
+  const prefixesOverlap = (a, b) => a === null || b === null || a.startsWith(b) || b.startsWith(a);
+  return same(writeFilters.salesOrg, readFilters.salesOrg)
+    && same(writeFilters.creationDate, readFilters.creationDate)
+    && prefixesOverlap(writeFilters.materialStartsWith, readFilters.materialStartsWith);
+}
+
+function store(key, filters, value, loadedAt) {
+  if (loadedAt !== generation) return;
+  const { ttl, staleWhileRevalidate, max } = config();
+  const now = Date.now();
+  const entry = {
+    value,
+    filters: normalizeFilters(filters),
+    expires: now + ttl,
+    staleUntil: now + ttl + staleWhileRevalidate
+  };
+  cache.set(key, entry, max);
+  if (isShared()) {
+    getStore().set('read', key, entry, ttl + staleWhileRevalidate)
+      .catch(err => LOG.warn('Could not write to the shared store', { message: err.message }));
+  }
+}
+
+/**
+ * Entry written by another instance, copied into the local LRU
+ * @param {string} key
+ * @returns {Promise<Object|undefined>} Entry { value, filters, expires, staleUntil }
+ */
+async function sharedEntry(key) {
+  if (!isShared()) return undefined;
+  try {
+    const entry = await getStore().get('read', key);
+    if (!entry || entry.staleUntil <= Date.now()) return undefined;
+    cache.set(key, entry, config().max);
+    return entry;
+  } catch (err) {
+    LOG.warn('Could not read from the shared store', { message: err.message });
+    return undefined;
+  }
+}
+
+function revalidate(key, filters, entry, load) {
+  if (entry.revalidating) return;
+  entry.revalidating = true;
+  const loadedAt = generation;
+  load()
+    .then(value => store(key, filters, value, loadedAt))
+    .catch(err => {
+      entry.revalidating = false;
+      LOG.warn('Background revalidation failed', { message: err.message });
+    });
+}
+
+/**
+ * Whether a mass change over an overlapping selection may still be running
+ * @param {Object} filters - Selection criteria of the read
+ * @returns {boolean}
+ */
+function held(filters) {
+  if (!holds.length) return false;
+  const now = Date.now();
+  holds = holds.filter(hold => hold.until > now);
+  const readFilters = normalizeFilters(filters);
+  return holds.some(hold => overlaps(hold.filters, readFilters));
+}
+
+/**
+ * Returns a cached read result or loads and caches it
+ * @param {Object} filters - Selection criteria for orders
+ * @param {Object} options - Read options that are part of the key { pageSize, continuationToken, select }
+ * @param {Function} load - async () => result, called on a miss
+ * @returns {Promise<*>} Read result
+ */
+async function cachedRead(filters, options, load) {
+  if (!config().enabled || held(filters)) return load();
+
+  const key = readKey(filters, options);
+  let entry = cache.get(key);
+  if (!entry) {
+    entry = await sharedEntry(key);
+    if (entry) stats.sharedHits++;
+  }
+  if (entry && entry.expires > Date.now()) {
+    stats.hits++;
+    return entry.value;
+  }
+  if (entry) {
+    stats.staleHits++;
+    revalidate(key, filters, entry, load);
+    return entry.value;
+  }
+
+  stats.misses++;
+  const loadedAt = generation;
+  const value = await load();
+  store(key, filters, value, loadedAt);
+  return value;
+}
+
+/**
+ * Drops all cached reads that a mass change with these filters may have affected
+ * Called when S/4HANA accepted the mass change, which starts a hold on the
+ * selection, and with settled once it was seen complete, which ends the hold.
+ * Entries in the shared store are dropped in the background.
+ * @param {Object} filters - Filters of the mass change
+ * @param {Object} options - { settled } the change is known to be applied
+ * @returns {number} Number of dropped local entries
+ */
+function invalidateOverlapping(filters, { settled = false } = {}) {
+  const writeFilters = normalizeFilters(filters);
+  const same = JSON.stringify(writeFilters);
+  holds = holds.filter(hold => JSON.stringify(hold.filters) !== same);
+  if (!settled) holds.push({ filters: writeFilters, until: Date.now() + config().pendingHold });
+  generation++;
+  let dropped = 0;
+  for (const [key, entry] of cache.entries) {
+    if (overlaps(writeFilters, entry.filters) && cache.delete(key)) dropped++;
+  }
+  stats.invalidations += dropped;
+  if (isShared()) {
+    invalidateShared(writeFilters)
+      .catch(err => LOG.warn('Could not invalidate the shared store', { message: err.message }));
+  }
+  return dropped;
+}
+
+async function invalidateShared(writeFilters) {
+  const entries = await getStore().entries('read');
+  await Promise.all(entries
+    .filter(([, entry]) => overlaps(writeFilters, entry.filters))
+    .map(([key]) => getStore().delete('read', key)));
+}
+
+/**
+ * Cache counters and current size
+ * @returns {Object}
+ */
+function getReadCacheStats() {
+  const { enabled, max, ttl, staleWhileRevalidate, pendingHold } = config();
+  return {
+    enabled, max, ttl, staleWhileRevalidate, pendingHold, shared: isShared(),
+    size: cache.entries.size, holds: holds.filter(hold => hold.until > Date.now()).length, ...stats
+  };
+}
+
+module.exports = {
+  normalizeFilters,
+  selectionOf,
+  overlaps,
+  readKey,
+  cachedRead,
+  invalidateOverlapping,
+  getReadCacheStats
+};
@@ -0,0 +1,257 @@
+const cds = require('@sap/cds');
+const { timeout } = require('@sap-cloud-sdk/resilience');
+const { OverloadError } = require('./admission');
+const { logger } = require('./logger');
+
+const LOG = logger('resilience');
+
+/**
+ * Timeouts, jittered retries and a circuit breaker for S/4HANA calls
+ * resilienceFor() returns executeHttpRequest options carrying one SDK
+ * middleware. Per attempt it applies the SDK timeout; attempts pass through
+ * the destination's circuit breaker and are retried with full-jitter
+ * exponential backoff when the call type allows it.
+ *
+ * Call types:
+ * - read  : GETs and read-only $batch requests, retried on network errors, timeouts, 429 and 502-504
+ * - csrf  : CSRF token fetches, same rules as read
+ * - write : $batch change sets, not idempotent, only retried when the connection was never established
+ *
+ * Configured via cds.s4.resilience:
+ * - read / csrf / write : { timeout, retries, backoff: { base, max } }
+ * - circuitBreaker      : { enabled, errorThresholdPercentage, volumeThreshold, rollingWindow, resetTimeout }
+ *   The breaker opens when at least volumeThreshold calls in the rolling window
+ *   failed at errorThresholdPercentage; after resetTimeout a single half-open
+ *   probe decides whether it closes again.
+ */
+
+const DEFAULTS = {
+  read: { timeout: 15000, retries: 2, backoff: { base: 200, max: 2000 } },
+  csrf: { timeout: 10000, retries: 2, backoff: { base: 200, max: 2000 } },
+  write: { timeout: 60000, retries: 1, backoff: { base: 500, max: 2000 } },
+  circuitBreaker: {
+    enabled: true,
+    errorThresholdPercentage: 50,
+    volumeThreshold: 10,
+    rollingWindow: 10000,
+    resetTimeout: 30000
+  }
+};
+
+// Errors raised before a request reached S/4HANA, safe to retry for writes
+const CONNECT_ERRORS = new Set(['ECONNREFUSED', 'ENOTFOUND', 'EAI_AGAIN', 'EHOSTUNREACH', 'ENETUNREACH']);
+const RETRY_STATUS = new Set([429, 502, 503, 504]);
+
+function config() {
+  const resilience = cds.env.s4?.resilience || {};
+  const callConfig = type => ({
+    ...DEFAULTS[type],
+    ...resilience[type],
+    backoff: { ...DEFAULTS[type].backoff, ...resilience[type]?.backoff }
+  });
+  return {
+    read: callConfig('read'),
+    csrf: callConfig('csrf'),
+    write: callConfig('write'),
+    circuitBreaker: { ...DEFAULTS.circuitBreaker, ...resilience.circuitBreaker }
+  };
+}
+
+/**
+ * Call rejected because the destination's circuit breaker is open
+ */
+class CircuitOpenError extends OverloadError {
+  constructor(destinationName, retryAfter) {
+    super(destinationName, 'circuit open', 503);
+    this.name = 'CircuitOpenError';
+    this.retryAfter = retryAfter;
+    this.message = `S/4HANA destination ${destinationName} is unavailable (circuit open), retry after ${retryAfter}s`;
+  }
+}
+
+/**
+ * Failures that count against the circuit breaker: no response at all or a 5xx
+ * @param {Error} error - Error thrown by executeHttpRequest
+ * @returns {boolean}
+ */
+function isBackendFailure(error) {
+  const status = error?.response?.status;
+  return !status || status >= 500;
+}
+
+function isRetryable(error, type) {
+  if (error instanceof CircuitOpenError) return false;
+  const status = error?.response?.status;
+  if (type === 'write') return !status && CONNECT_ERRORS.has(error?.code || error?.cause?.code);
+  return !status || RETRY_STATUS.has(status);
+}
+
+class CircuitBreaker {
+  constructor(name) {
+    this.name = name;
+    this.state = 'CLOSED';
+    this.outcomes = []; // [{ at, failed }] within the rolling window
+    this.openedAt = 0;
+    this.probing = false;
+    this.stats = { calls: 0, failures: 0, rejected: 0, opened: 0, probes: 0 };
+  }
+
+  /**
+   * Admits a call or throws CircuitOpenError; returns true for a half-open probe
+   */
+  admit() {
+    const { resetTimeout } = config().circuitBreaker;
+    if (this.state === 'OPEN') {
+      const remaining = this.openedAt + resetTimeout - Date.now();
+      if (remaining > 0) {
+        this.stats.rejected++;
+        throw new CircuitOpenError(this.name, Math.ceil(remaining / 1000));
+      }
+      this.transition('HALF_OPEN');
+    }
+    if (this.state === 'HALF_OPEN') {
+      if (this.probing) {
+        this.stats.rejected++;
+        throw new CircuitOpenError(this.name, 1);
+      }
+      this.probing = true;
+      this.stats.probes++;
+      return true;
+    }
+    return false;
+  }
+
+  record(failed, probe) {
+    const { errorThresholdPercentage, volumeThreshold, rollingWindow } = config().circuitBreaker;
+    const now = Date.now();
+    this.stats.calls++;
+    if (failed) this.stats.failures++;
+
+    if (probe) {
+      this.probing = false;
+      this.transition(failed ? 'OPEN' : 'CLOSED');
+      return;
+    }
+
+    this.outcomes.push({ at: now, failed });
+    while (this.outcomes.length && this.outcomes[0].at < now - rollingWindow) this.outcomes.shift();
+
+    const failures = this.outcomes.filter(o => o.failed).length;
+    if (this.state === 'CLOSED' && this.outcomes.length >= volumeThreshold &&
+        failures * 100 >= errorThresholdPercentage * this.outcomes.length) {
+      this.transition('OPEN');
+    }
+  }
+
+  transition(state) {
+    if (state === this.state) {
+      if (state === 'OPEN') this.openedAt = Date.now();
+      return;
+    }
+    const from = this.state;
+    this.state = state;
+    if (state === 'OPEN') {
+      this.openedAt = Date.now();
+      this.stats.opened++;
+      LOG.warn('Circuit opened', { destination: this.name, from });
+    } else if (state === 'HALF_OPEN') {
+      LOG.info('Circuit half-open, sending probe', { destination: this.name });
+    } else {
+      this.outcomes = [];
+      LOG.info('Circuit closed', { destination: this.name, from });
+    }
+  }
+
+  async run(fn) {
+    const probe = this.admit();
+    try {
+      const result = await fn();
+      this.record(false, probe);
+      return result;
+    } catch (error) {
+      this.record(isBackendFailure(error), probe);
+      throw error;
+    }
+  }
+}
+
+const breakers = new Map(); // destinationName -> CircuitBreaker
+
+function breakerFor(destinationName) {
+  if (!breakers.has(destinationName)) breakers.set(destinationName, new CircuitBreaker(destinationName));
+  return breakers.get(destinationName);
+}
+
+function backoffDelay(attempt, { base, max }) {
+  // Full jitter: uniform in [0, min(max, base * 2^attempt)]
+  return Math.round(Math.random() * Math.min(max, base * 2 ** attempt));
+}
+
+/**
+ * executeHttpRequest options applying the call type's resilience policy
+ * @param {string} destinationName - BTP destination name, one circuit breaker per destination
+ * @param {string} type - 'read', 'csrf' or 'write'
+ * @returns {Object} { middleware } for the options argument of executeHttpRequest
+ */
+function resilienceFor(destinationName, type) {
+  const settings = config();
+  const policy = settings[type];
+  const breaker = settings.circuitBreaker.enabled ? breakerFor(destinationName) : undefined;
+
+  const middleware = options => {
+    const attempt = policy.timeout ? timeout(policy.timeout)(options) : options.fn;
+    const guarded = breaker ? arg => breaker.run(() => attempt(arg)) : attempt;
+
+    return async arg => {
+      for (let retry = 0; ; retry++) {
+        try {
+          return await guarded(arg);
+        } catch (error) {
+          if (retry >= policy.retries || !isRetryable(error, type)) throw error;
+          const delay = backoffDelay(retry, policy.backoff);
+          LOG.debug('Retrying S/4HANA call', () => ({
+            destination: destinationName, type, retry: retry + 1, delay, status: error.response?.status, message: error.message
+          }));
+          await new Promise(resolve => setTimeout(resolve, delay));
+        }
+      }
+    };
+  };
+
+  return { middleware: [middleware] };
+}
+
+/**
+ * Whether calls to the destination currently fail fast (open and not yet due for a probe)
+ * @param {string} destinationName - Name the breaker was created with
+ * @returns {boolean}
+ */
+function isCircuitOpen(destinationName) {
+  const breaker = breakers.get(destinationName);
+  if (!breaker || !config().circuitBreaker.enabled) return false;
+  if (breaker.state === 'HALF_OPEN') return breaker.probing;
+  return breaker.state === 'OPEN' && breaker.openedAt + config().circuitBreaker.resetTimeout > Date.now();
+}
+
+/**
+ * Circuit breaker state per destination
+ * @returns {Object[]}
+ */
+function getCircuitBreakerStats() {
+  const { resetTimeout } = config().circuitBreaker;
+  return [...breakers.values()].map(breaker => ({
+    destination: breaker.name,
+    state: breaker.state,
+    openUntil: breaker.state === 'OPEN' ? new Date(breaker.openedAt + resetTimeout).toISOString() : null,
+    windowCalls: breaker.outcomes.length,
+    windowFailures: breaker.outcomes.filter(o => o.failed).length,
+    ...breaker.stats
+  }));
+}
+
+module.exports = {
+  CircuitOpenError,
+  resilienceFor,
+  isCircuitOpen,
+  getCircuitBreakerStats
+};
@@ -0,0 +1,71 @@
+const { withCsrfToken } = require('./csrf-cache');
+const { withAdmission } = require('./admission');
+const { resilienceFor } = require('./resilience');
+const { timeStage } = require('./metrics');
+const { traceHeaders } = require('./tracing');
+const { defaultBackend, executeOn } = require('./backends');
+
+/**
+ * Shared S/4HANA client for RFM_MANAGE_SALES_ORDERS_SRV
+ * All handlers in service.js go through here so that CSRF state is shared
+ * Calls go to the backend passed by the caller (see backends.js), by default
+ * to cds.s4.routing.default; CSRF session, admission limiter, circuit
+ * breaker and connection pool are the backend's own.
+ */
+
+/**
+ * Sends a $batch request using the cached CSRF token and session cookies
+ * Admission control bounds the number of concurrent $batch requests per backend
+ * @param {BatchPayload} batchPayload - Encoded body from buildBatchPayload / encodeBatch, built with the backend's host
+ * @param {Object} options - { responseType: 'stream' } to consume the response incrementally,
+ *                           { callType: 'read' } for batches without change sets (default 'write'),
+ *                           { backend } from routeBackend (default backend otherwise)
+ * @returns {Promise<Object>} HTTP response from S/4HANA
+ */
+function postBatch(batchPayload, options = {}) {
+  const backend = options.backend || defaultBackend();
+  return withAdmission(backend.name, () => withCsrfToken(backend.name, csrf => timeStage('batch_post', () => executeOn(
+    backend,
+    {
+      method: 'post',
+      url: `${backend.servicePath}/$batch?sap-client=200`,
+      headers: {
+        'Content-Type': batchPayload.contentType,
+        'Accept': 'application/json',
+        'X-CSRF-Token': csrf.token,
+        'Cookie': csrf.cookie,
+        ...traceHeaders()
+      },
+      data: batchPayload.body,
+      ...(options.responseType && { responseType: options.responseType })
+    },
+    {
+      fetchCsrf: false, // token is managed by csrf-cache, skip the SDK's own fetch
+      ...resilienceFor(backend.name, options.callType || 'write')
+    }
+  ))));
+}
+
+/**
+ * Sends a GET request to the service (e.g. $metadata or the service document)
+ * @param {string} path - Path relative to the service root, e.g. '/$metadata?sap-client=200'
+ * @param {Object} headers - Additional request headers
+ * @param {Object} backend - Backend from the registry, defaults to the default backend
+ * @returns {Promise<Object>} HTTP response from S/4HANA
+ */
+function getFromService(path, headers = {}, backend = defaultBackend()) {
+  return timeStage('service_get', () => executeOn(
+    backend,
+    {
+      method: 'get',
+      url: `${backend.servicePath}${path}`,
+      headers: { ...headers, ...traceHeaders() }
+    },
+    resilienceFor(backend.name, 'read')
+  ));
+}
+
+module.exports = {
+  postBatch,
+  getFromService
+};
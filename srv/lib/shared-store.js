@@ -0,0 +1,242 @@
+const cds = require('@sap/cds');
+const crypto = require('crypto');
+const fs = require('fs/promises');
+const path = require('path');
+const { logger } = require('./logger');
+
+const LOG = logger('shared-store');
+
+/**
+ * Pluggable key/value store for warm state that several processes can share:
+ * CSRF tokens and session cookies, readOrders results, idempotency records.
+ * All methods are async so a networked backend fits behind the same interface.
+ *
+ * Backends (cds.s4.store.kind):
+ * - memory : per process (default)
+ * - file   : one JSON file per entry under dir; shared by processes on the
+ *            same file system, e.g. Node cluster workers of one CF instance
+ * - db     : entity masschange.SharedState in the CAP database; shared by all
+ *            instances that use the same database (HANA, or a SQLite file)
+ * A networked KV store (e.g. Redis) is added by implementing get / set / add /
+ * delete / entries and registering it in BACKENDS.
+ *
+ * Configured via cds.s4.store:
+ * - kind : memory, file or db
+ * - dir  : directory of the file backend
+ */
+
+const DEFAULTS = {
+  kind: 'memory',
+  dir: '/tmp/s4-shared-store'
+};
+
+const SharedState = 'masschange.SharedState';
+
+function config() {
+  return { ...DEFAULTS, ...cds.env.s4?.store };
+}
+
+function expiryOf(ttl) {
+  return ttl ? Date.now() + ttl : null;
+}
+
+function isLive(expires) {
+  return !expires || expires > Date.now();
+}
+
+function hashKey(key) {
+  return crypto.createHash('sha1').update(key).digest('hex');
+}
+
+class MemoryStore {
+  constructor() {
+    this.namespaces = new Map(); // namespace -> Map(key -> { value, expires })
+  }
+
+  space(namespace) {
+    if (!this.namespaces.has(namespace)) this.namespaces.set(namespace, new Map());
+    return this.namespaces.get(namespace);
+  }
+
+  async get(namespace, key) {
+    const entry = this.space(namespace).get(key);
+    if (!entry) return undefined;
+    if (isLive(entry.expires)) return entry.value;
+    this.space(namespace).delete(key);
+    return undefined;
+  }
+
+  async set(namespace, key, value, ttl) {
+    this.space(namespace).set(key, { value, expires: expiryOf(ttl) });
+  }
+
+  async add(namespace, key, value, ttl) {
+    if (await this.get(namespace, key) !== undefined) return false;
+    await this.set(namespace, key, value, ttl);
+    return true;
+  }
+
+  async delete(namespace, key) {
+    this.space(namespace).delete(key);
+  }
+
+  async entries(namespace) {
+    return [...this.space(namespace)]
+      .filter(([, entry]) => isLive(entry.expires))
+      .map(([key, entry]) => [key, entry.value]);
+  }
+}
+
+class FileStore {
+  constructor(dir) {
+    this.dir = dir;
+  }
+
+  file(namespace, key) {
+    return path.join(this.dir, namespace, `${hashKey(key)}.json`);
+  }
+
+  async read(file) {
+    try {
+      const entry = JSON.parse(await fs.readFile(file, 'utf8'));
+      if (isLive(entry.expires)) return entry;
+      await fs.rm(file, { force: true });
+    } catch (err) {
+      if (err.code !== 'ENOENT') LOG.warn('Could not read entry', { file, message: err.message });
+    }
+    return undefined;
+  }
+
+  async get(namespace, key) {
+    return (await this.read(this.file(namespace, key)))?.value;
+  }
+
+  async set(namespace, key, value, ttl) {
+    const file = this.file(namespace, key);
+    await fs.mkdir(path.dirname(file), { recursive: true });
+    // Write and rename, so readers in other processes never see a partial file
+    const tmp = `${file}.${process.pid}.${crypto.randomUUID()}.tmp`;
+    await fs.writeFile(tmp, JSON.stringify({ key, value, expires: expiryOf(ttl) }));
+    await fs.rename(tmp, file);
+  }
+
+  async add(namespace, key, value, ttl) {
+    const file = this.file(namespace, key);
+    await fs.mkdir(path.dirname(file), { recursive: true });
+    await this.read(file); // drops an expired entry
+    try {
+      // 'wx' fails if the file exists, which makes add atomic across processes
+      await fs.writeFile(file, JSON.stringify({ key, value, expires: expiryOf(ttl) }), { flag: 'wx' });
+      return true;
+    } catch (err) {
+      if (err.code === 'EEXIST') return false;
+      throw err;
+    }
+  }
+
+  async delete(namespace, key) {
+    await fs.rm(this.file(namespace, key), { force: true });
+  }
+
+  async entries(namespace) {
+    const dir = path.join(this.dir, namespace);
+    const names = await fs.readdir(dir).catch(err => (err.code === 'ENOENT' ? [] : Promise.reject(err)));
+    const entries = await Promise.all(names
+      .filter(name => name.endsWith('.json'))
+      .map(name => this.read(path.join(dir, name))));
+    return entries.filter(Boolean).map(entry => [entry.key, entry.value]);
+  }
+}
+
+class DbStore {
+  /**
+   * Runs a query in its own short transaction
+   * Never joins the current request's transaction: writes must be visible to
+   * other instances right away, must not hold the request's connection (a
+   * single one for in-memory SQLite), and background jobs run after the
+   * request that queued them has ended.
+   */
+  run(query) {
+    return cds.tx(tx => tx.run(query));
+  }
+
+  async get(namespace, key) {
+    const { SELECT, DELETE } = cds.ql;
+    const row = await this.run(SELECT.one.from(SharedState).where({ namespace, id: hashKey(key) }));
+    if (!row) return undefined;
+    if (isLive(row.expires)) return JSON.parse(row.value).value;
+    await this.run(DELETE.from(SharedState).where({ namespace, id: hashKey(key) }));
+    return undefined;
+  }
+
+  async set(namespace, key, value, ttl) {
+    const { UPSERT } = cds.ql;
+    await this.run(UPSERT.into(SharedState).entries({
+      namespace, id: hashKey(key), value: JSON.stringify({ key, value }), expires: expiryOf(ttl)
+    }));
+  }
+
+  async add(namespace, key, value, ttl) {
+    const { INSERT, DELETE } = cds.ql;
+    const id = hashKey(key);
+    await this.run(DELETE.from(SharedState).where({ namespace, id, expires: { '<=': Date.now() } }));
+    try {
+      // The primary key makes the insert fail if another process added the key first
+      await this.run(INSERT.into(SharedState).entries({ namespace, id, value: JSON.stringify({ key, value }), expires: expiryOf(ttl) }));
+      return true;
+    } catch (err) {
+      if (/unique|constraint|duplicate|already_exists/i.test(`${err.code} ${err.message}`)) return false;
+      throw err;
+    }
+  }
+
+  async delete(namespace, key) {
+    const { DELETE } = cds.ql;
+    await this.run(DELETE.from(SharedState).where({ namespace, id: hashKey(key) }));
+  }
+
+  async entries(namespace) {
+    const { SELECT } = cds.ql;
+    const rows = await this.run(SELECT.from(SharedState).columns('value', 'expires').where({ namespace }));
+    return rows
+      .filter(row => isLive(row.expires))
+      .map(row => JSON.parse(row.value))
+      .map(({ key, value }) => [key, value]);
+  }
+}
+
+const BACKENDS = {
+  memory: () => new MemoryStore(),
+  file: ({ dir }) => new FileStore(dir),
+  db: () => new DbStore()
+};
+
+let store;
+
+/**
+ * The configured store, created on first use
+ * @returns {Object} Store with async get / set / add / delete / entries
+ */
+function getStore() {
+  if (!store) {
+    const settings = config();
+    const create = BACKENDS[settings.kind];
+    if (!create) throw new Error(`Unknown cds.s4.store.kind: ${settings.kind}`);
+    store = create(settings);
+    LOG.info('Shared store initialized', { kind: settings.kind });
+  }
+  return store;
+}
+
+/**
+ * Whether state in the store is visible to other processes
+ * @returns {boolean}
+ */
+function isShared() {
+  return config().kind !== 'memory';
+}
+
+module.exports = {
+  getStore,
+  isShared
+};
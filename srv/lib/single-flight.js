@@ -0,0 +1,43 @@
+/**
+ * Single-flight coalescing of identical concurrent calls
+ * While a call for a key is in flight, further calls with the same key get
+ * its promise instead of starting their own upstream request.
+ */
+
+const inFlight = new Map(); // key -> Promise of the leading call
+const stats = { calls: 0, leaders: 0, coalesced: 0 };
+
+/**
+ * Runs fn once per key at a time and shares its outcome with concurrent callers
+ * @param {string} key - Identity of the call, e.g. readKey(); calls that would send
+ *                       different requests (even differing only in case) need different keys
+ * @param {Function} fn - async () => result
+ * @returns {Promise<*>} Result of the leading call
+ */
+function coalesce(key, fn) {
+  stats.calls++;
+  if (inFlight.has(key)) {
+    stats.coalesced++;
+    return inFlight.get(key);
+  }
+
+  stats.leaders++;
+  const pending = Promise.resolve()
+    .then(fn)
+    .finally(() => inFlight.delete(key));
+  inFlight.set(key, pending);
+  return pending;
+}
+
+/**
+ * Coalescing counters
+ * @returns {Object} { calls, leaders, coalesced, inFlight }
+ */
+function getCoalescingStats() {
+  return { ...stats, inFlight: inFlight.size };
+}
+
+module.exports = {
+  coalesce,
+  getCoalescingStats
+};
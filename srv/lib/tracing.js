@@ -0,0 +1,208 @@
+const cds = require('@sap/cds');
+const { AsyncLocalStorage } = require('async_hooks');
+const { logger } = require('./logger');
+
+const LOG = logger('tracing');
+
+/**
+ * Correlation IDs and per-request span trees
+ * Each traced action runs in a Trace carrying the request's correlation ID
+ * (CAP's cds.context.id, taken from X-Correlation-ID when the caller sends
+ * one). Stages of S/4HANA calls are recorded as nested spans, the ID is
+ * forwarded to S/4HANA as X-CorrelationID, and the response gets
+ * X-Correlation-ID and a Server-Timing breakdown. Background work queued by
+ * the action keeps adding spans to the same trace.
+ *
+ * The last traces are kept in memory (getTraces); traces slower than
+ * slowThreshold are logged with their span tree.
+ *
+ * Configured via cds.s4.tracing:
+ * - enabled       : record spans and send the headers
+ * - size          : traces kept in memory
+ * - slowThreshold : ms after which a trace is logged as slow
+ */
+
+const DEFAULTS = {
+  enabled: true,
+  size: 100,
+  slowThreshold: 2000
+};
+
+const storage = new AsyncLocalStorage(); // { trace, parent }
+const recent = [];
+
+function config() {
+  return { ...DEFAULTS, ...cds.env.s4?.tracing };
+}
+
+function sinceMs(start) {
+  return Math.round(Number(process.hrtime.bigint() - start) / 1e4) / 100;
+}
+
+class Trace {
+  constructor(correlationId, action) {
+    this.correlationId = correlationId || cds.utils.uuid();
+    this.action = action;
+    this.startedAt = new Date().toISOString();
+    this.start = process.hrtime.bigint();
+    this.durationMs = null;
+    this.spans = []; // { id, parentId, name, startMs, durationMs, outcome }
+  }
+
+  /**
+   * Adds a finished span
+   * @param {string} name - Stage name
+   * @param {bigint} start - process.hrtime.bigint() at the start of the span
+   * @param {string} outcome - 'ok' or 'error'
+   * @param {number} parentId - Enclosing span
+   * @returns {Object} Span
+   */
+  record(name, start, outcome, parentId = null) {
+    const span = {
+      id: this.spans.length + 1,
+      parentId,
+      name,
+      startMs: Math.round(Number(start - this.start) / 1e4) / 100,
+      durationMs: sinceMs(start),
+      outcome
+    };
+    this.spans.push(span);
+    return span;
+  }
+
+  end() {
+    this.durationMs = sinceMs(this.start);
+  }
+
+  /**
+   * Server-Timing header value: time per stage (summed), plus the total
+   * @returns {string} e.g. 'csrf_fetch;dur=41.2, batch_post;dur=812.5, total;dur=870.1'
+   */
+  serverTiming() {
+    const totals = new Map();
+    for (const { name, durationMs } of this.spans) totals.set(name, (totals.get(name) || 0) + durationMs);
+    const entries = [...totals].map(([name, dur]) => `${name};dur=${Math.round(dur * 100) / 100}`);
+    entries.push(`total;dur=${this.durationMs ?? sinceMs(this.start)}`);
+    return entries.join(', ');
+  }
+}
+
+/**
+ * Trace of the current async context
+ * @returns {Trace|undefined}
+ */
+function currentTrace() {
+  return storage.getStore()?.trace;
+}
+
+/**
+ * Runs fn inside a trace (also used to continue a trace in background work)
+ * @param {Trace} trace - Trace to continue, undefined runs fn untraced
+ * @param {Function} fn - async () => result
+ * @returns {Promise<*>} Result of fn
+ */
+function runInTrace(trace, fn) {
+  return trace ? storage.run({ trace, parent: null }, fn) : fn();
+}
+
+/**
+ * Records fn as a span of the current trace; spans started inside fn become its children
+ * @param {string} name - Stage name
+ * @param {Function} fn - async () => result
+ * @returns {Promise<*>} Result of fn
+ */
+async function span(name, fn) {
+  const store = storage.getStore();
+  if (!store) return fn();
+
+  const start = process.hrtime.bigint();
+  const placeholder = store.trace.record(name, start, 'running', store.parent?.id ?? null);
+  try {
+    const result = await storage.run({ trace: store.trace, parent: placeholder }, fn);
+    placeholder.outcome = 'ok';
+    return result;
+  } catch (error) {
+    placeholder.outcome = 'error';
+    throw error;
+  } finally {
+    placeholder.durationMs = sinceMs(start);
+  }
+}
+
+/**
+ * Records a span measured by the caller, e.g. for stages that are not a single async call
+ * @param {string} name - Stage name
+ * @param {bigint} start - process.hrtime.bigint() at the start of the stage
+ * @param {string} outcome - 'ok' or 'error'
+ */
+function recordSpan(name, start, outcome = 'ok') {
+  const store = storage.getStore();
+  if (store) store.trace.record(name, start, outcome, store.parent?.id ?? null);
+}
+
+/**
+ * Headers forwarding the correlation ID to S/4HANA
+ * @returns {Object} { 'X-CorrelationID': id } or {}
+ */
+function traceHeaders() {
+  const trace = currentTrace();
+  return trace ? { 'X-CorrelationID': trace.correlationId } : {};
+}
+
+/**
+ * Runs an action handler in a new trace and decorates the HTTP response
+ * @param {Object} req - CAP request
+ * @param {Function} next - Remaining handlers
+ * @returns {Promise<*>} Result of next
+ */
+async function traceRequest(req, next) {
+  const { enabled, size, slowThreshold } = config();
+  if (!enabled) return next();
+
+  const trace = new Trace(req.context?.id ?? cds.context?.id, req.event);
+  recent.push(trace);
+  while (recent.length > size) recent.shift();
+
+  try {
+    return await runInTrace(trace, next);
+  } finally {
+    trace.end();
+    const res = req.http?.res;
+    if (res && !res.headersSent) {
+      res.set('X-Correlation-ID', trace.correlationId);
+      res.set('Server-Timing', trace.serverTiming());
+    }
+    if (trace.durationMs >= slowThreshold) {
+      LOG.warn('Slow request', () => ({
+        action: trace.action,
+        correlationId: trace.correlationId,
+        durationMs: trace.durationMs,
+        spans: trace.spans
+      }));
+    }
+  }
+}
+
+/**
+ * Recent traces, newest first
+ * @param {string} correlationId - Optional filter
+ * @returns {Object[]}
+ */
+function getTraces(correlationId) {
+  return recent
+    .filter(trace => !correlationId || trace.correlationId === correlationId)
+    .reverse()
+    .map(({ correlationId, action, startedAt, durationMs, spans }) => ({
+      correlationId, action, startedAt, durationMs, spans: spans.map(s => ({ ...s }))
+    }));
+}
+
+module.exports = {
+  currentTrace,
+  runInTrace,
+  span,
+  recordSpan,
+  traceHeaders,
+  traceRequest,
+  getTraces
+};
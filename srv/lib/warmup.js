@@ -0,0 +1,122 @@
+const cds = require('@sap/cds');
+const { getFromService } = require('./s4-client');
+const { listBackends } = require('./backends');
+const { resolveDestination } = require('./destination-cache');
+const { getCsrfToken } = require('./csrf-cache');
+const { getMetadata } = require('./metadata');
+const { logger, errorFields } = require('./logger');
+
+const LOG = logger('warmup');
+
+/**
+ * Boot-time warm-up of the S/4HANA connectivity
+ * Started when CAP has served its services, so the first Joule call after a
+ * restart or scale-out does not pay for the destination lookup,
+ * the TLS handshakes and the CSRF fetch. Every backend that takes routed
+ * traffic (cds.s4.backends with roles) is warmed. Steps run one after the other; a
+ * failed step is reported and the remaining ones still run, the request
+ * path falls back to doing the same lazily.
+ * The app reports ready (see srv/server.js) once the warm-up has finished.
+ *
+ * Configured via cds.s4.warmup:
+ * - enabled       : run the warm-up at all (otherwise ready immediately)
+ * - connections   : pooled connections opened toward each backend
+ * - timeout       : upper bound for the whole warm-up, ready afterwards regardless
+ * - readinessPath : URL path of the readiness endpoint
+ */
+
+const DEFAULTS = {
+  enabled: true,
+  connections: 2,
+  timeout: 30000,
+  readinessPath: '/ready'
+};
+
+const state = {
+  status: 'PENDING', // PENDING, RUNNING, READY, DEGRADED (a step failed), TIMEOUT, DISABLED
+  startedAt: null,
+  finishedAt: null,
+  steps: []          // { name, status, durationMs, error }
+};
+
+function config() {
+  return { ...DEFAULTS, ...cds.env.s4?.warmup };
+}
+
+async function step(name, fn) {
+  const start = Date.now();
+  try {
+    await fn();
+    state.steps.push({ name, status: 'OK', durationMs: Date.now() - start });
+  } catch (error) {
+    LOG.warn(`Warm-up step ${name} failed`, () => errorFields(error));
+    state.steps.push({ name, status: 'FAILED', durationMs: Date.now() - start, error: error.message });
+  }
+}
+
+async function runSteps({ connections }) {
+  for (const backend of listBackends().filter(b => b.roles.length)) {
+    if (backend.destination) await step(`destination:${backend.name}`, () => resolveDestination(backend.destination));
+    // The CSRF fetch also opens the first pooled connection of the backend
+    await step(`csrf:${backend.name}`, () => getCsrfToken(backend.name));
+    if (connections > 1) {
+      // Concurrent requests force additional sockets, which stay open in the backend's pool
+      await step(`connections:${backend.name}`, () => Promise.all(
+        Array.from({ length: connections - 1 }, () => getFromService('/?sap-client=200', { 'Accept': 'application/json' }, backend))
+      ));
+    }
+  }
+  await step('metadata', () => getMetadata());
+}
+
+/**
+ * Runs the warm-up once; resolves when it finished or timed out, never rejects
+ * @returns {Promise<Object>} Warm-up state
+ */
+async function warmUp() {
+  const settings = config();
+  if (!settings.enabled) {
+    state.status = 'DISABLED';
+    return state;
+  }
+  if (state.status !== 'PENDING') return state;
+
+  state.status = 'RUNNING';
+  state.startedAt = new Date().toISOString();
+  LOG.info('Warm-up started');
+
+  let timer;
+  const timedOut = new Promise(resolve => {
+    timer = setTimeout(() => resolve(true), settings.timeout);
+    timer.unref();
+  });
+  const timeout = await Promise.race([runSteps(settings).then(() => false), timedOut]);
+  clearTimeout(timer);
+
+  state.status = timeout ? 'TIMEOUT' : state.steps.some(s => s.status === 'FAILED') ? 'DEGRADED' : 'READY';
+  state.finishedAt = new Date().toISOString();
+  LOG.info('Warm-up finished', () => ({ status: state.status, steps: state.steps }));
+  return state;
+}
+
+/**
+ * Whether the app should receive traffic: the warm-up has finished (or is disabled)
+ * @returns {boolean}
+ */
+function isReady() {
+  return !['PENDING', 'RUNNING'].includes(state.status) || !config().enabled;
+}
+
+/**
+ * @returns {Object} { ready, status, startedAt, finishedAt, steps }
+ */
+function getWarmUpState() {
+  return { ready: isReady(), ...state, steps: state.steps.map(s => ({ ...s })) };
+}
+
+module.exports = {
+  config,
+  warmUp,
+  isReady,
+  getWarmUpState
+};
@@ -0,0 +1,44 @@
+const cds = require('@sap/cds');
+const metrics = require('./lib/metrics');
+const warmup = require('./lib/warmup');
+const { destroyAgents } = require('./lib/connection-pool');
+const { logger } = require('./lib/logger');
+
+const LOG = logger('server');
+
+/**
+ * Custom server: adds the Prometheus /metrics endpoint, the readiness
+ * endpoint and the boot-time warm-up of the S/4HANA connectivity; closes the
+ * pooled sockets on shutdown
+ */
+cds.on('bootstrap', (app) => {
+  // 503 until the warm-up has finished, used as the CF health check
+  app.get(warmup.config().readinessPath, (req, res) => {
+    res.status(warmup.isReady() ? 200 : 503).json(warmup.getWarmUpState());
+  });
+
+  // Outside the CAP services, so protected by its own scraper token
+  const { enabled, path, token } = metrics.config();
+  if (enabled && !token && cds.env.profiles?.includes('production')) {
+    LOG.warn('Metrics endpoint not served: set cds.s4.metrics.token (cds_s4_metrics_token)', { path });
+  } else if (enabled) {
+    metrics.eventLoopMonitor(); // start measuring before the first scrape
+    app.get(path, (req, res) => {
+      if (!metrics.isAuthorizedScrape(req.headers.authorization)) {
+        return res.status(401).set('WWW-Authenticate', 'Bearer').send('Unauthorized');
+      }
+      res.type('text/plain; version=0.0.4; charset=utf-8').send(metrics.renderMetrics());
+    });
+  }
+});
+
+// Not awaited: the server starts listening while the warm-up runs
+cds.on('served', () => {
+  warmup.warmUp();
+});
+
+cds.on('shutdown', () => {
+  destroyAgents();
+});
+
+module.exports = cds.server;
@@ -1,4 +1,33 @@
 const cds = require('@sap/cds');
+const { postBatch } = require('./lib/s4-client');
+const { getPoolStats } = require('./lib/connection-pool');
+const { ENTITY_SET, buildBatchPayload } = require('./lib/batch-payload');
+const { countOrders, readOrderPage } = require('./lib/order-reader');
+const { cachedRead, readKey, invalidateOverlapping, getReadCacheStats } = require('./lib/read-cache');
+const { coalesce, getCoalescingStats } = require('./lib/single-flight');
+const { runBulkMassChange, summarizeBatchResponse } = require('./lib/mass-change');
+const { enqueueJob } = require('./lib/job-queue');
+const { waitForMassChange } = require('./lib/job-watcher');
+const { capture, getCaptures } = require('./lib/payload-capture');
+const { logger, preview, errorFields } = require('./lib/logger');
+const { OverloadError, getAdmissionStats } = require('./lib/admission');
+const { getCircuitBreakerStats } = require('./lib/resilience');
+const { probeBackends } = require('./lib/latency-probe');
+const { getMetadata, validateProperties } = require('./lib/metadata');
+const { observeAction } = require('./lib/metrics');
+const { traceRequest, getTraces } = require('./lib/tracing');
+const { idempotentRequest } = require('./lib/idempotency');
+const { getBackend, defaultBackend, routeBackend, probeTargets, getBackendStats } = require('./lib/backends');
+
+const LOG = {
+  test: logger('connectivity-test'),
+  massChange: logger('mass-change'),
+  bulk: logger('bulk'),
+  ritorno: logger('ritorno'),
+  wait: logger('wait'),
+  read: logger('read'),
+  preview: logger('preview')
+};
 
 /**
  * Implementation of MassChangeService
@@ -6,33 +35,58 @@ const cds = require('@sap/cds');
  */
 module.exports = cds.service.impl(async function () {
 
-  // Lazy loading approach (like boss's project)
-  let OnPremService = undefined;
+  /**
+   * Fails the request with the admission / circuit breaker status and a Retry-After header
+   */
+  const rejectOverloaded = (req, error) => {
+    req.http?.res?.set('Retry-After', String(error.retryAfter));
+    return req.reject(error.status, error.message);
+  };
+
+  // Correlation ID, spans and Server-Timing header for every action calling S/4HANA
+  // Registered first, so it wraps the action handlers below
+  this.on([
+    'testS4Endpoints', 'scheduleMassChange', 'previewMassChange', 'scheduleMassChangeBulk',
+    'reverseMassChange', 'waitForMassChange', 'readOrders'
+  ], traceRequest);
+
+  // Retries of a mass change return the first call's job instead of queueing another one
+  this.on(['scheduleMassChange', 'reverseMassChange'], idempotentRequest);
+
+  // Duration and outcome of the S/4HANA actions for /metrics
+  const MEASURED_ACTIONS = ['scheduleMassChange', 'previewMassChange', 'reverseMassChange', 'readOrders'];
+  const actionStarts = new WeakMap(); // req -> process.hrtime.bigint()
+  this.before(MEASURED_ACTIONS, req => { actionStarts.set(req, process.hrtime.bigint()); });
+  this.after(MEASURED_ACTIONS, (result, req) => {
+    observeAction(req.event, actionStarts.get(req), result?.status || (result?.error ? 'ERROR' : 'SUCCESS'));
+  });
+  this.on('error', (error, req) => {
+    if (actionStarts.has(req)) observeAction(req.event, actionStarts.get(req), 'REJECTED');
+  });
+
+  // Order properties returned by readOrders, taken from its CDS return type and pushed down as $select
+  const ORDER_FIELDS = Object.keys(this.actions.readOrders.returns.elements.orders.items.elements)
+    .filter(name => name !== 'extraFields');
 
   /**
    * READ handler for ConnectivityTest entity
    * Simple test to verify S/4HANA connectivity
    */
   this.on(['READ'], 'ConnectivityTest', async (req) => {
-    // Initialize connection on first use
-    if (!OnPremService) {
-      OnPremService = await cds.connect.to('OnPremService');
-      console.log('[ConnectivityTest] Connected to S4HANA via OnPremService');
-    }
-
     try {
-      // Test: call service root with metadata request
-      console.log('[ConnectivityTest] Testing S/4HANA connectivity...');
-      const res = await OnPremService.get('/sap/opu/odata/sap/RFM_MANAGE_SALES_ORDERS_SRV/$metadata?sap-client=200');
+      // Test: revalidate the cached metadata, an unchanged document costs a 304
+      LOG.test.info('Testing S/4HANA connectivity');
+      const metadata = await getMetadata({ revalidate: true });
+      if (metadata.source === 'stale') throw new Error('S/4HANA not reachable, only the cached $metadata is available');
       
       return [{
         id: 1,
         status: 'SUCCESS',
-        message: `Connected to S/4HANA successfully! Metadata size: ${String(res).length} bytes`,
+        message: `Connected to S/4HANA successfully! Metadata size: ${metadata.bytes} bytes (${metadata.source})`,
         timestamp: new Date().toISOString()
       }];
     } catch (err) {
-      console.error('[ConnectivityTest] Error:', err);
+      LOG.test.error('Connectivity test failed', () => errorFields(err));
       return [{
         id: 1,
         status: 'ERROR',
@@ -47,114 +101,84 @@ module.exports = cds.service.impl(async function () {
    * Tests both internal (OnPremise) and RISE endpoints
    */
   this.on('testS4Endpoints', async (req) => {
-    // Initialize connection on first use (lazy loading)
-    if (!OnPremService) {
-      OnPremService = await cds.connect.to('OnPremService');
-      console.log('[Test] Connected to S4HANA via OnPremService');
-    }
-    
-    const results = [];
-    
-    // Test 1: Internal S/4HANA via Cloud Connector (destination S4HANA_PCE_SSO)
-    try {
-      console.log('[Test] Testing internal S4 via destination S4HANA_PCE_SSO...');
-      const internalResponse = await OnPremService.send({
-        method: 'GET',
-        path: '/sap/opu/odata/sap/RFM_MANAGE_SALES_ORDERS_SRV/$metadata?sap-client=200',
-        headers: { 'Accept': 'application/xml' }
-      });
-      
-      results.push({
-        endpoint: 'S4HANA_PCE_SSO (s4-sb4:44380 via Cloud Connector)',
-        status: 'SUCCESS',
-        statusCode: 200,
-        contentLength: String(internalResponse).length,
-        preview: String(internalResponse).substring(0, 200)
-      });
-    } catch (error) {
-      results.push({
-        endpoint: 'S4HANA_PCE_SSO (s4-sb4:44380 via Cloud Connector)',
-        status: 'FAILED',
-        error: error.message
-      });
-    }
-    
-    // Test 2: RISE S/4HANA via direct HTTP call (no destination)
-    try {
-      console.log('[Test] Testing RISE S4 via direct HTTP call...');
-      const https = require('https');
-      
-      const riseResponse = await new Promise((resolve, reject) => {
-        const options = {
-          hostname: 'vhotbsb4ci.rise.otb.net',
-          port: 44300,
-          path: '/sap/opu/odata/sap/RFM_MANAGE_SALES_ORDERS_SRV/$metadata?sap-client=200',
-          method: 'GET',
-          headers: {
-            'Authorization': 'Basic ' + Buffer.from('JOULE_ADMIN:Diesel_2025_978625!').toString('base64'),
-            'Accept': 'application/xml'
-          },
-          rejectUnauthorized: false // Accept self-signed certs
-        };
-        
-        const req = https.request(options, (res) => {
-          let data = '';
-          res.on('data', chunk => data += chunk);
-          res.on('end', () => {
-            if (res.statusCode === 200) {
-              resolve({ statusCode: res.statusCode, data });
-            } else {
-              reject(new Error(`HTTP ${res.statusCode}: ${data.substring(0, 200)}`));
-            }
-          });
-        });
-        
-        req.on('error', reject);
-        req.setTimeout(10000, () => {
-          req.destroy();
-          reject(new Error('Request timeout after 10s'));
-        });
-        req.end();
-      });
-      
-      results.push({
-        endpoint: 'RISE (vhotbsb4ci.rise.otb.net:44300 direct HTTP)',
-        status: 'SUCCESS',
-        statusCode: riseResponse.statusCode,
-        contentLength: riseResponse.data.length,
-        preview: riseResponse.data.substring(0, 200)
-      });
-    } catch (error) {
-      results.push({
-        endpoint: 'RISE (vhotbsb4ci.rise.otb.net:44300 direct HTTP)',
-        status: 'FAILED',
-        error: error.message
-      });
-    }
+    // All registered backends (cds.s4.backends) are probed concurrently, each with N cheap service document GETs
+    const results = await probeBackends(probeTargets(), { samples: req.data.samples });
+    LOG.test.info('Latency probe finished', () => ({
+      results: results.map(({ endpoint, status, ttfbP50Ms, totalP95Ms }) => ({ endpoint, status, ttfbP50Ms, totalP95Ms }))
+    }));
     
     return {
       timestamp: new Date().toISOString(),
       results: results,
       recommendation: results.some(r => r.status === 'SUCCESS') 
         ? 'At least one endpoint is working!' 
-        : 'Both endpoints failed - check configuration'
+        : results.some(r => r.status === 'DEGRADED')
+          ? 'Endpoints answer intermittently - check failures per endpoint'
+          : 'Both endpoints failed - check configuration'
     };
   });
 
+  /**
+   * Connection pool usage of a backend (default backend if omitted), used to size cds.s4.pool
+   */
+  this.on('getConnectionPoolStats', (req) => {
+    const { backend } = req.data;
+    return getPoolStats(backend ? getBackend(backend) : defaultBackend());
+  });
+
+  /**
+   * Registered S/4HANA backends with their health and latency EWMA
+   */
+  this.on('getBackends', () => getBackendStats());
+
+  /**
+   * readOrders cache counters
+   */
+  this.on('getReadCacheStats', () => getReadCacheStats());
+
+  /**
+   * Counters of identical concurrent readOrders calls sharing one upstream request
+   */
+  this.on('getReadCoalescingStats', () => getCoalescingStats());
+
+  /**
+   * Admission control counters per S/4HANA backend
+   */
+  this.on('getAdmissionStats', () => getAdmissionStats());
+
+  /**
+   * Circuit breaker state per S/4HANA destination
+   */
+  this.on('getCircuitBreakerStats', () => getCircuitBreakerStats());
+
+  /**
+   * Recent request traces with their spans, optionally for one correlation ID
+   */
+  this.on('getTraces', (req) => getTraces(req.data.correlationId));
+
+  /**
+   * Captured $batch request/response pairs (only filled when cds.s4.capture.enabled)
+   */
+  this.on('getPayloadCaptures', () => getCaptures().map(entry => ({
+    ...entry,
+    response: entry.response && {
+      status: entry.response.status,
+      headers: JSON.stringify(entry.response.headers),
+      body: entry.response.body
+    }
+  })));
+
   /**
    * Handler for scheduleMassChange action
-   * Receives filters and fields from Joule, builds batch payload, sends to S/4HANA
+   * Receives filters and fields from Joule and queues the S/4HANA batch as a background job;
+   * the returned ID is the job ID to poll in Jobs
    */
   this.on('scheduleMassChange', async (req) => {
-    // Initialize connection on first use (lazy loading)
-    if (!OnPremService) {
-      OnPremService = await cds.connect.to('OnPremService');
-      console.log('[Mass Change] Connected to S4HANA via OnPremService');
-    }
-    
-    const { filters, fieldsToUpdate } = req.data;
+    const log = LOG.massChange.forAction('scheduleMassChange');
+
+    const { filters, fieldsToUpdate, target } = req.data;
     
-    console.log('[Mass Change] Request received from Joule:', JSON.stringify(req.data, null, 2));
+    log.info('Request received from Joule', () => ({ filters, fieldsToUpdate, target }));
 
     // Validate required fields
     if (!filters || !fieldsToUpdate) {
@@ -168,89 +192,71 @@ module.exports = cds.service.impl(async function () {
       };
     }
 
+    // Check property names and lengths against the cached $metadata before queueing
+    const problems = await validateProperties(ENTITY_SET, fieldsToUpdate);
+    if (problems.length) {
+      log.warn('Invalid fieldsToUpdate', { problems });
+      return {
+        ID: cds.utils.uuid(),
+        status: 'ERROR',
+        jobName: 'Mass Field Update from Joule',
+        timestamp: new Date().toISOString(),
+        message: `Invalid fieldsToUpdate: ${problems.join('; ')}`,
+        fioriAppLink: ''
+      };
+    }
+
+    const jobName = 'Mass Field Update from Joule';
     try {
-      // 1. Fetch CSRF token from S/4HANA (required for POST operations)
-      console.log('[Mass Change] Fetching CSRF token from S/4HANA...');
-      
-      // Use SAP Cloud SDK to get access to response headers
-      const { executeHttpRequest } = require('@sap-cloud-sdk/http-client');
-      const csrfResponse = await executeHttpRequest(
-        { destinationName: 'S4HANA_PCE_SSO' },
-        {
-          method: 'get',
-          url: '/sap/opu/odata/sap/RFM_MANAGE_SALES_ORDERS_SRV/',
-          headers: {
-            'X-CSRF-Token': 'Fetch',
-            'Accept': 'application/json'
-          }
-        }
-      );
-      
-      console.log('[Mass Change] CSRF response headers:', csrfResponse.headers);
-      const csrfToken = csrfResponse.headers['x-csrf-token'];
-      const cookies = csrfResponse.headers['set-cookie']; // Extract session cookies!
-      if (!csrfToken) {
-        console.error('[Mass Change] No CSRF token in headers:', Object.keys(csrfResponse.headers));
-        throw new Error('CSRF token not returned by S/4HANA');
-      }
-      console.log('[Mass Change] CSRF token obtained:', csrfToken);
-      console.log('[Mass Change] Session cookies:', cookies);
-
-      // 2. Build batch multipart payload following Postman template
-      const batchPayload = buildBatchPayload(filters, fieldsToUpdate);
-      
-      console.log('[Mass Change] Batch payload length:', batchPayload.length, 'bytes');
-      console.log('[Mass Change] Payload has CRLF:', batchPayload.includes('\r\n') ? 'YES' : 'NO');
-      // Write payload to temp file for debugging (will log file path)
-      const fs = require('fs');
-      const tmpFile = `/tmp/batch_payload_${Date.now()}.txt`;
-      fs.writeFileSync(tmpFile, batchPayload, 'utf8');
-      console.log('[Mass Change] Payload written to:', tmpFile);
-      console.log('[Mass Change] Sending batch with CSRF token:', csrfToken);
-
-      // 3. Send batch request to S/4HANA with CSRF token AND session cookies using SAP Cloud SDK
-      const batchResponse = await executeHttpRequest(
-        { destinationName: 'S4HANA_PCE_SSO' },
-        {
-          method: 'post',
-          url: '/sap/opu/odata/sap/RFM_MANAGE_SALES_ORDERS_SRV/$batch?sap-client=200',
-          headers: {
-            'Content-Type': 'multipart/mixed; boundary=batch_Test01',
-            'Accept': 'application/json',
-            'X-CSRF-Token': csrfToken,
-            'Cookie': cookies ? cookies.join('; ') : '' // Send session cookies back!
-          },
-          data: batchPayload
-        }
-      );
+      // 1. Pick the backend (explicit target or by health and latency) and queue the job,
+      // S/4HANA is called in the background
+      const backend = routeBackend({ target, role: 'write' });
+      const jobID = await enqueueJob({ action: 'scheduleMassChange', jobName, filters, fieldsToUpdate, backend: backend.name }, async () => {
+        try {
+          // 2. Build batch multipart payload following Postman template
+          const batchPayload = buildBatchPayload(filters, fieldsToUpdate, undefined, { host: backend.host });
+          
+          log.debug('Batch payload built', () => ({ bytes: batchPayload.length, boundary: batchPayload.boundary, backend: backend.name }));
+
+          // 3. Send batch request with cached CSRF token and session cookies (refetched once if rejected)
+          const batchResponse = await postBatch(batchPayload, { backend }).catch(error => {
+            capture('scheduleMassChange', batchPayload.body, error.response);
+            throw error;
+          });
+          // Keep payload and response for debugging when capturing is enabled (cds.s4.capture)
+          capture('scheduleMassChange', batchPayload.body, batchResponse);
+          invalidateOverlapping(filters);
+
+          log.info('S/4HANA batch response', () => ({ status: batchResponse.status }));
+          log.debug('S/4HANA batch response details', () => ({ headers: batchResponse.headers, body: preview(batchResponse.data) }));
 
-      console.log('[Mass Change] S/4HANA batch response status:', batchResponse.status);
-      console.log('[Mass Change] S/4HANA batch response headers:', JSON.stringify(batchResponse.headers, null, 2));
-      console.log('[Mass Change] S/4HANA batch response data:', JSON.stringify(batchResponse.data, null, 2));
+          return summarizeBatchResponse(batchResponse);
+        } catch (error) {
+          log.error('Mass change failed', () => errorFields(error));
+          throw error;
+        }
+      });
 
-      // 3. Return success status to Joule
+      // 4. Return the job ID to Joule right away
       return {
-        ID: cds.utils.uuid(),
-        status: 'JOB_SCHEDULED',
-        jobName: 'Mass Field Update from Joule',
+        ID: jobID,
+        status: 'QUEUED',
+        jobName,
         timestamp: new Date().toISOString(),
-        message: 'Job scheduled successfully. Check status in Manage Sales Documents (F4546) app.',
-        fioriAppLink: '/sap/bc/ui5_ui5/sap/f4546/index.html' // Link to Fiori app
+        message: `Job queued for ${backend.name}. Track it in Jobs(${jobID}) and in Manage Sales Documents (F4546) app.`,
+        fioriAppLink: '/sap/bc/ui5_ui5/sap/f4546/index.html', // Link to Fiori app
+        backend: backend.name
       };
 
     } catch (error) {
-      console.error('[Mass Change] Error occurred:', error.message);
-      if (error.response) {
-        console.error('[Mass Change] Error status:', error.response.status);
-        console.error('[Mass Change] Error headers:', JSON.stringify(error.response.headers, null, 2));
-        console.error('[Mass Change] Error body:', JSON.stringify(error.response.data, null, 2)); // Pretty print with indentation
-      }
+      log.error('Could not queue job', () => errorFields(error));
+      if (error instanceof OverloadError) return rejectOverloaded(req, error);
       
       // Return error status to Joule
       return {
         ID: cds.utils.uuid(),
         status: 'ERROR',
-        jobName: 'Mass Field Update from Joule',
+        jobName,
         timestamp: new Date().toISOString(),
         message: `Failed to schedule job: ${error.message || 'Unknown error'}`,
         fioriAppLink: ''
@@ -258,20 +264,87 @@ module.exports = cds.service.impl(async function () {
     }
   });
 
+  /**
+   * Dry run of scheduleMassChange
+   * Runs only the selection ($inlinecount plus a small sample), so operators can
+   * reject or split huge selections before a background job is started
+   */
+  this.on('previewMassChange', async (req) => {
+    const log = LOG.preview.forAction('previewMassChange');
+
+    const { filters, fieldsToUpdate, sampleSize, target } = req.data;
+
+    log.info('Preview request received', () => ({ filters, fieldsToUpdate, sampleSize, target }));
+
+    if (!filters) {
+      return req.error(400, 'Missing required parameter: filters');
+    }
+
+    try {
+      const [problems, { count, sample, backend }] = await Promise.all([
+        fieldsToUpdate ? validateProperties(ENTITY_SET, fieldsToUpdate) : [],
+        countOrders(filters, { sampleSize, select: ORDER_FIELDS, target })
+      ]);
+      const largeSelection = count !== null && count > (cds.env.s4?.preview?.largeSelection ?? 1000);
+
+      log.info('Preview finished', () => ({ matchingItems: count, largeSelection, problems, backend }));
+
+      return {
+        timestamp: new Date().toISOString(),
+        backend,
+        matchingItems: count,
+        largeSelection,
+        problems,
+        sample: sample.map(order => Object.fromEntries(ORDER_FIELDS.map(name => [name, order[name]]))),
+        message: count === null
+          ? 'S/4HANA returned no count for the selection'
+          : `${count} order item(s) match the filters${largeSelection ? ', consider splitting the selection' : ''}`
+      };
+    } catch (error) {
+      log.error('Preview failed', () => errorFields(error));
+      if (error instanceof OverloadError) return rejectOverloaded(req, error);
+      return req.error(error.status === 400 ? 400 : 502, `Preview failed: ${error.message}`);
+    }
+  });
+
+  /**
+   * Bulk variant of scheduleMassChange
+   * Packs many filter/field pairs into as few $batch requests as configured
+   */
+  this.on('scheduleMassChangeBulk', async (req) => {
+    const log = LOG.bulk.forAction('scheduleMassChangeBulk');
+    const { entries, target } = req.data;
+
+    log.info('Request received', () => ({ entries: entries?.length || 0, target }));
+
+    if (!entries?.length) {
+      return req.error(400, 'Missing required parameter: entries');
+    }
+
+    const { batches, results } = await runBulkMassChange(entries, { target });
+    log.info('Bulk mass change sent', () => ({
+      batches,
+      scheduled: results.filter(r => r.status === 'JOB_SCHEDULED').length,
+      entries: results.length
+    }));
+
+    return {
+      timestamp: new Date().toISOString(),
+      batches,
+      results
+    };
+  });
+
   /**
    * RITORNO action - Reverses mass change to restore original values
    * Uses fixed RITORNO values from Postman documentation
    */
   this.on('reverseMassChange', async (req) => {
-    // Initialize connection on first use
-    if (!OnPremService) {
-      OnPremService = await cds.connect.to('OnPremService');
-      console.log('[RITORNO] Connected to S4HANA via OnPremService');
-    }
-    
-    const { filters, fieldsToUpdate } = req.data;
+    const log = LOG.ritorno.forAction('reverseMassChange');
+
+    const { filters, fieldsToUpdate, target } = req.data;
     
-    console.log('[RITORNO] Reversal request received:', JSON.stringify(req.data, null, 2));
+    log.info('Reversal request received', () => ({ filters, fieldsToUpdate, target }));
 
     if (!filters || !fieldsToUpdate) {
       return {
@@ -284,77 +357,71 @@ module.exports = cds.service.impl(async function () {
       };
     }
 
+    // Check property names and lengths against the cached $metadata before queueing
+    const problems = await validateProperties(ENTITY_SET, fieldsToUpdate);
+    if (problems.length) {
+      log.warn('Invalid fieldsToUpdate', { problems });
+      return {
+        ID: cds.utils.uuid(),
+        status: 'ERROR',
+        jobName: 'Mass Field Update RITORNO',
+        timestamp: new Date().toISOString(),
+        message: `Invalid fieldsToUpdate: ${problems.join('; ')}`,
+        fioriAppLink: ''
+      };
+    }
+
+    const jobName = 'Mass Field Update RITORNO';
     try {
       // Use fieldsToUpdate from request (now dynamic from Joule)
       const riturnoFields = fieldsToUpdate;
 
-      // 1. Fetch CSRF token
-      console.log('[RITORNO] Fetching CSRF token...');
-      const { executeHttpRequest } = require('@sap-cloud-sdk/http-client');
-      const csrfResponse = await executeHttpRequest(
-        { destinationName: 'S4HANA_PCE_SSO' },
-        {
-          method: 'get',
-          url: '/sap/opu/odata/sap/RFM_MANAGE_SALES_ORDERS_SRV/',
-          headers: {
-            'X-CSRF-Token': 'Fetch',
-            'Accept': 'application/json'
-          }
-        }
-      );
-      
-      const csrfToken = csrfResponse.headers['x-csrf-token'];
-      const cookies = csrfResponse.headers['set-cookie'];
-      if (!csrfToken) {
-        throw new Error('CSRF token not returned by S/4HANA');
-      }
-      console.log('[RITORNO] CSRF token obtained:', csrfToken);
-
-      // 2. Build batch payload with dynamic values from Joule
-      // Use filters as provided by user (no hard-coded plant override)
-      const batchPayload = buildBatchPayload(filters, riturnoFields);
-      
-      console.log('[RITORNO] Batch payload ready, length:', batchPayload.length, 'bytes');
-
-      // 3. Send batch request
-      const batchResponse = await executeHttpRequest(
-        { destinationName: 'S4HANA_PCE_SSO' },
-        {
-          method: 'post',
-          url: '/sap/opu/odata/sap/RFM_MANAGE_SALES_ORDERS_SRV/$batch?sap-client=200',
-          headers: {
-            'Content-Type': 'multipart/mixed; boundary=batch_Test01',
-            'Accept': 'application/json',
-            'X-CSRF-Token': csrfToken,
-            'Cookie': cookies ? cookies.join('; ') : ''
-          },
-          data: batchPayload
-        }
-      );
+      // 1. Queue the reversal job on the routed backend, S/4HANA is called in the background
+      const backend = routeBackend({ target, role: 'write' });
+      const jobID = await enqueueJob({ action: 'reverseMassChange', jobName, filters, fieldsToUpdate: riturnoFields, backend: backend.name }, async () => {
+        try {
+          // 2. Build batch payload with dynamic values from Joule
+          // Use filters as provided by user (no hard-coded plant override)
+          const batchPayload = buildBatchPayload(filters, riturnoFields, undefined, { host: backend.host });
+          
+          log.debug('Batch payload built', () => ({ bytes: batchPayload.length, boundary: batchPayload.boundary, backend: backend.name }));
+
+          // 3. Send batch request (CSRF token shared with the other actions on this backend)
+          const batchResponse = await postBatch(batchPayload, { backend }).catch(error => {
+            capture('reverseMassChange', batchPayload.body, error.response);
+            throw error;
+          });
+          capture('reverseMassChange', batchPayload.body, batchResponse);
+          invalidateOverlapping(filters);
+
+          log.info('S/4HANA batch response', () => ({ status: batchResponse.status }));
+          log.debug('S/4HANA batch response details', () => ({ body: preview(batchResponse.data) }));
 
-      console.log('[RITORNO] S/4HANA response status:', batchResponse.status);
-      console.log('[RITORNO] Response data:', JSON.stringify(batchResponse.data, null, 2));
+          return summarizeBatchResponse(batchResponse);
+        } catch (error) {
+          log.error('Reversal failed', () => errorFields(error));
+          throw error;
+        }
+      });
 
       return {
-        ID: cds.utils.uuid(),
-        status: 'JOB_SCHEDULED',
-        jobName: 'Mass Field Update RITORNO',
+        ID: jobID,
+        status: 'QUEUED',
+        jobName,
         timestamp: new Date().toISOString(),
-        message: 'Reversal job scheduled successfully. Orders restored to original values.',
-        fioriAppLink: '/sap/bc/ui5_ui5/sap/f4546/index.html'
+        message: `Reversal job queued for ${backend.name}. Track it in Jobs(${jobID}).`,
+        fioriAppLink: '/sap/bc/ui5_ui5/sap/f4546/index.html',
+        backend: backend.name
       };
 
     } catch (error) {
-      console.error('[RITORNO] Error occurred:', error.message);
-      if (error.response) {
-        console.error('[RITORNO] Error status:', error.response.status);
-        console.error('[RITORNO] Error body:', JSON.stringify(error.response.data, null, 2));
-      }
+      log.error('Could not queue job', () => errorFields(error));
+      if (error instanceof OverloadError) return rejectOverloaded(req, error);
       
       return {
         ID: cds.utils.uuid(),
         status: 'ERROR',
-        jobName: 'Mass Field Update RITORNO',
+        jobName,
         timestamp: new Date().toISOString(),
         message: `Failed to schedule reversal: ${error.message || 'Unknown error'}`,
         fioriAppLink: ''
@@ -362,20 +429,39 @@ module.exports = cds.service.impl(async function () {
     }
   });
 
+  /**
+   * Long-poll until a mass change has taken effect
+   * Replaces fixed sleeps after ANDATA/RITORNO in the test sequences
+   */
+  this.on('waitForMassChange', async (req) => {
+    const { jobID, filters, timeoutSeconds } = req.data;
+
+    if (!jobID && !filters) {
+      return req.error(400, 'Missing required parameters: jobID or filters');
+    }
+
+    try {
+      const outcome = await waitForMassChange({ jobID, filters, timeoutMs: timeoutSeconds ? timeoutSeconds * 1000 : undefined });
+      LOG.wait.info('Mass change wait finished', () => ({ jobID, ...outcome }));
+      return { timestamp: new Date().toISOString(), ...outcome };
+    } catch (error) {
+      LOG.wait.error('Wait failed', () => errorFields(error));
+      if (error instanceof OverloadError) return rejectOverloaded(req, error);
+      return req.error([400, 404].includes(error.status) ? error.status : 502, error.message);
+    }
+  });
+
   /**
    * READ action - Retrieves orders matching filters to verify changes
    * Uses BATCH request with fake MERGE + GET (same as scheduleMassChange/reverseMassChange)
    */
   this.on('readOrders', async (req) => {
-    // Initialize connection on first use
-    if (!OnPremService) {
-      OnPremService = await cds.connect.to('OnPremService');
-      console.log('[READ] Connected to S4HANA via OnPremService');
-    }
-    
-    const { filters } = req.data;
+    const log = LOG.read.forAction('readOrders');
+
+    const { filters, pageSize, continuationToken, target } = req.data;
+    const extraFields = req.data.extraFields || [];
     
-    console.log('[READ] Read request received:', JSON.stringify(req.data, null, 2));
+    log.info('Read request received', () => ({ filters, pageSize, continuationToken, extraFields, target }));
 
     if (!filters) {
       return {
@@ -385,92 +471,40 @@ module.exports = cds.service.impl(async function () {
       };
     }
 
-    try {
-      // 1. Fetch CSRF token (same as other actions)
-      console.log('[READ] Fetching CSRF token...');
-      const { executeHttpRequest } = require('@sap-cloud-sdk/http-client');
-      const csrfResponse = await executeHttpRequest(
-        { destinationName: 'S4HANA_PCE_SSO' },
-        {
-          method: 'get',
-          url: '/sap/opu/odata/sap/RFM_MANAGE_SALES_ORDERS_SRV/',
-          headers: {
-            'X-CSRF-Token': 'Fetch',
-            'Accept': 'application/json'
-          }
-        }
-      );
-      
-      const csrfToken = csrfResponse.headers['x-csrf-token'];
-      const cookies = csrfResponse.headers['set-cookie'];
-      if (!csrfToken) {
-        throw new Error('CSRF token not returned by S/4HANA');
-      }
-      console.log('[READ] CSRF token obtained:', csrfToken);
-
-      // 2. Build batch payload with fake MERGE + GET
-      // Pass null fields to skip MERGE, only GET will be included
-      const batchPayload = buildBatchPayload(filters, null); // null = no MERGE, only GET
-      
-      console.log('[READ] Batch payload ready, length:', batchPayload.length, 'bytes');
-
-      // 3. Send batch request
-      const batchResponse = await executeHttpRequest(
-        { destinationName: 'S4HANA_PCE_SSO' },
-        {
-          method: 'post',
-          url: '/sap/opu/odata/sap/RFM_MANAGE_SALES_ORDERS_SRV/$batch?sap-client=200',
-          headers: {
-            'Content-Type': 'multipart/mixed; boundary=batch_Test01',
-            'Accept': 'application/json',
-            'X-CSRF-Token': csrfToken,
-            'Cookie': cookies ? cookies.join('; ') : ''
-          },
-          data: batchPayload
-        }
-      );
-
-      console.log('[READ] S/4HANA batch response status:', batchResponse.status);
-      console.log('[READ] S/4HANA batch response data:', JSON.stringify(batchResponse.data).substring(0, 500));
+    const invalidField = extraFields.find(name => !/^[A-Za-z_][A-Za-z0-9_]*$/.test(name));
+    if (invalidField) {
+      return req.error(400, `Invalid field name in extraFields: ${invalidField}`);
+    }
 
-      // 4. Parse batch response to extract GET results
-      const responseData = batchResponse.data;
-      let results = [];
-      
-      // Extract JSON from batch response (look for {"d":{"results":[...]}} pattern)
-      if (typeof responseData === 'string') {
-        // Find the JSON response (format: {"d":{"results":[...]}})
-        const jsonMatch = responseData.match(/{\"d\":\{\"results\":\[(.*?)\]\}\}/s);
-        if (jsonMatch) {
-          const fullJson = `{"d":{"results":[${jsonMatch[1]}]}}`;
-          const jsonData = JSON.parse(fullJson);
-          results = jsonData.d?.results || [];
-        }
-      }
+    try {
+      // 1. Read one page via batch GET (no MERGE), fetching only the returned properties
+      // Identical reads are served from the read cache until a mass change touches them,
+      // identical concurrent reads that miss the cache share one upstream request
+      // (keyed on the exact filter values: S/4HANA filters case-sensitively)
+      const select = [...new Set([...ORDER_FIELDS, ...extraFields])];
+      const options = { pageSize, continuationToken, select, target };
+      const { results, nextToken, backend } = await cachedRead(filters, options,
+        () => coalesce(readKey(filters, options), () => readOrderPage(filters, options)));
       
-      console.log('[READ] Found', results.length, 'orders');
+      log.info('Orders read', () => ({ count: results.length, morePages: Boolean(nextToken), backend }));
 
       return {
         timestamp: new Date().toISOString(),
+        backend,
         count: results.length,
+        nextToken,
         orders: results.map(order => ({
-          SalesOrder: order.SalesOrder,
-          SalesOrderItem: order.SalesOrderItem,
-          Material: order.Material,
-          RequirementSegment: order.RequirementSegment,
-          Plant: order.Plant,
-          StorageLocation: order.StorageLocation,
-          SalesOrganization: order.SalesOrganization,
-          SalesDocumentDate: order.SalesDocumentDate
+          ...Object.fromEntries(ORDER_FIELDS.map(name => [name, order[name]])),
+          ...(extraFields.length ? {
+            extraFields: JSON.stringify(Object.fromEntries(extraFields.map(name => [name, order[name]])))
+          } : {})
         }))
       };
 
     } catch (error) {
-      console.error('[READ] Error occurred:', error.message);
-      if (error.response) {
-        console.error('[READ] Error status:', error.response.status);
-        console.error('[READ] Error body:', JSON.stringify(error.response.data, null, 2));
-      }
+      log.error('Read failed', () => errorFields(error));
+      if (error instanceof OverloadError) return rejectOverloaded(req, error);
+      if (error.status === 400) return req.error(400, error.message);
       
       return {
         timestamp: new Date().toISOString(),
@@ -481,80 +515,4 @@ module.exports = cds.service.impl(async function () {
     }
   });
 
-});
-
-/**
- * Builds batch OData multipart payload following exact Postman template
- * Based on working Python payload - includes Host and Content-Length headers
- * 
- * Architecture (from meeting):
- * - MERGE with "phantom order" (100001681) defines WHAT to change (fields)
- * - GET with dynamic filters defines WHICH orders to change
- * - S/4HANA combines both to execute mass update
- * 
- * @param {Object} filters - Selection criteria for orders
- * @param {Object} fields - Fields to update (null to skip MERGE, only GET)
- * @returns {string} Batch multipart payload
- */
-function buildBatchPayload(filters, fields) {
-  
-  // Build GET filter query
-  const material = filters.materialStartsWith;
-  const plant = filters.plant;
-  const salesOrg = filters.salesOrg;
-  const date = filters.creationDate;
-  const getFilter = `startswith(Material,%27${material}%27)%20and%20Plant%20eq%20%27${plant}%27%20and%20SalesDocumentDate%20eq%20datetime%27${date}T00%3a00%3a00%27%20and%20SalesOrganization%20eq%20%27${salesOrg}%27`;
-  
-  // Host header value (internal S/4HANA hostname from Destination)
-  const HOST = "s4-sb4:44380";
-  
-  const parts = [];
-  
-  // Add MERGE changeset only if fields are provided
-  if (fields) {
-    const mergeBody = JSON.stringify({
-      "RequirementSegment": fields.RequirementSegment,
-      "Plant": fields.Plant,
-      "StorageLocation": fields.StorageLocation,
-      "RFM_SD_ApplJobAction": "01",
-      "InternalComment": "Mass Field Update from Joule",
-      "SalesOrdItemIsSelected": "X",
-      "SalesOrdItemsAreSelected": "X"
-    });
-    
-    parts.push(
-      '--batch_Test01',
-      'Content-Type: multipart/mixed; boundary=changeset_Ugo1',
-      '',
-      '--changeset_Ugo1',
-      'Content-Type: application/http',
-      'Content-Transfer-Encoding: binary',
-      '',
-      'MERGE C_RFM_MaSaDoEditSlsOrdItm(SalesOrder=\'100001681\',SalesOrderItem=\'000010\')?sap-client=200 HTTP/1.1',
-      `Host: ${HOST}`,
-      'Content-Type: application/json',
-      `Content-Length: ${mergeBody.length}`,
-      'Accept: application/json',
-      '',
-      mergeBody,
-      '--changeset_Ugo1--',
-      ''
-    );
-  }
-  
-  // Always add GET part
-  parts.push(
-    '--batch_Test01',
-    'Content-Type: application/http',
-    'Content-Transfer-Encoding: binary',
-    '',
-    `GET C_RFM_MaSaDoEditSlsOrdItm?$top=1&sap-client=200&$filter=${getFilter} HTTP/1.1`,
-    `Host: ${HOST}`,
-    'Accept: application/json',
-    '',
-    '',
-    '--batch_Test01--'
-  );
-
-  return parts.join('\r\n');
-}
+});
\ No newline at end of file
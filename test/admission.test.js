@@ -0,0 +1,76 @@
+const { describe, it, before } = require('node:test');
+const assert = require('node:assert');
+const cds = require('@sap/cds');
+const { withAdmission, getAdmissionStats, OverloadError } = require('../srv/lib/admission');
+
+const QUEUE_TIMEOUT = 50;
+
+const tick = () => new Promise(resolve => setImmediate(resolve));
+
+// A call that runs until release() is called
+function blocked() {
+  let release;
+  const done = new Promise(resolve => { release = resolve; });
+  return { fn: () => done, release };
+}
+
+const stats = backend => getAdmissionStats().find(limiter => limiter.backend === backend);
+
+describe('admission control', () => {
+  before(() => {
+    cds.env.s4 = { ...cds.env.s4, admission: { maxConcurrent: 1, maxQueue: 1, queueTimeout: QUEUE_TIMEOUT, retryAfter: 3 } };
+  });
+
+  it('rejects with 503 when the queue is full', async () => {
+    const running = blocked();
+    const first = withAdmission('full', running.fn);
+    const queued = withAdmission('full', async () => 'queued');
+
+    const error = await withAdmission('full', async () => 'rejected').catch(err => err);
+    assert.ok(error instanceof OverloadError);
+    assert.strictEqual(error.status, 503);
+    assert.strictEqual(error.retryAfter, 3);
+    assert.match(error.message, /queue full/);
+
+    running.release();
+    await first;
+    assert.strictEqual(await queued, 'queued');
+    assert.strictEqual(stats('full').rejected, 1);
+  });
+
+  it('rejects waiters after queueTimeout', async () => {
+    const running = blocked();
+    const first = withAdmission('slow', running.fn);
+    let called = false;
+    await assert.rejects(withAdmission('slow', async () => { called = true; }), /queue timeout/);
+    assert.strictEqual(called, false);
+    assert.strictEqual(stats('slow').waiting, 0);
+    assert.strictEqual(stats('slow').timedOut, 1);
+
+    running.release();
+    await first;
+    assert.strictEqual(stats('slow').active, 0);
+  });
+
+  it('hands the slot over to the next waiter on release', async () => {
+    const running = blocked();
+    const first = withAdmission('handover', running.fn);
+    const order = [];
+    const queued = withAdmission('handover', async () => { order.push('waiter'); });
+    await tick();
+    assert.deepStrictEqual(order, []);
+    assert.strictEqual(stats('handover').active, 1);
+
+    running.release();
+    await Promise.all([first, queued]);
+    assert.deepStrictEqual(order, ['waiter']);
+    const { active, waiting, admitted, dequeued } = stats('handover');
+    assert.deepStrictEqual({ active, waiting, admitted, dequeued }, { active: 0, waiting: 0, admitted: 2, dequeued: 1 });
+  });
+
+  it('releases the slot when the call fails', async () => {
+    await assert.rejects(withAdmission('failing', async () => { throw new Error('boom'); }), /boom/);
+    assert.strictEqual(await withAdmission('failing', async () => 'ok'), 'ok');
+    assert.strictEqual(stats('failing').active, 0);
+  });
+});
@@ -0,0 +1,64 @@
+const { describe, it } = require('node:test');
+const assert = require('node:assert');
+const { buildBatchPayload, buildBulkBatchPayload } = require('../srv/lib/batch-payload');
+const { encodeBatch } = require('../srv/lib/batch-encoder');
+const { joinBatchPayload } = require('../scripts/bench/batch-baseline');
+
+const filters = { materialStartsWith: 'J01AA0119J35002001', plant: '142A', salesOrg: '142', creationDate: '2026-01-13' };
+const fields = { RequirementSegment: 'PPCOMFR', Plant: '140A', StorageLocation: 'ROD' };
+
+// Generated boundaries differ per call; replaced by fixed names before comparing
+function normalize(text, boundary) {
+  const id = boundary.replace(/^batch_/, '');
+  return text.split(`changeset_${id}_`).join('changeset_').split(boundary).join('batch_Test01');
+}
+
+function contentLengths(text) {
+  return [...text.matchAll(/Content-Length: (\d+)\r\n[^]*?\r\n\r\n(.*)\r\n/g)]
+    .map(([, length, body]) => ({ length: Number(length), chars: body.length, bytes: Buffer.byteLength(body) }));
+}
+
+describe('batch encoder', () => {
+  it('encodes a mass change like the line-join baseline', () => {
+    const payload = buildBatchPayload(filters, fields);
+    const expected = joinBatchPayload([{ filters, fieldsToUpdate: fields }], 'batch_Test01').toString();
+    assert.strictEqual(normalize(payload.toString(), payload.boundary), normalize(expected, 'batch_Test01'));
+  });
+
+  it('encodes a bulk payload like the line-join baseline', () => {
+    const entries = Array.from({ length: 3 }, (_, i) => ({
+      filters: { ...filters, plant: `14${i}A` },
+      fieldsToUpdate: { ...fields, Plant: `15${i}A` }
+    }));
+    const payload = buildBulkBatchPayload(entries);
+    assert.strictEqual(payload.toString(), joinBatchPayload(entries, payload.boundary).toString());
+  });
+
+  it('counts Content-Length in UTF-8 bytes for non-ASCII values', () => {
+    const nonAscii = { RequirementSegment: 'SEGMENTÄÖÜ', Plant: '140A', StorageLocation: '€01' };
+    const payload = buildBatchPayload(filters, nonAscii);
+    const text = payload.toString();
+    assert.strictEqual(text, joinBatchPayload([{ filters, fieldsToUpdate: nonAscii }], payload.boundary).toString());
+
+    const [merge] = contentLengths(text);
+    assert.ok(merge.bytes > merge.chars);
+    assert.strictEqual(merge.length, merge.bytes);
+  });
+
+  it('derives change set boundaries from the batch boundary', () => {
+    const changeset = { changeset: [{ method: 'MERGE', url: 'X', body: {} }] };
+    const payload = encodeBatch([changeset, { method: 'GET', url: 'Y' }, changeset], { boundary: 'batch_abc' });
+    const boundaries = [...payload.toString().matchAll(/boundary=(\S+)/g)].map(([, boundary]) => boundary);
+    assert.deepStrictEqual(boundaries, ['changeset_abc_1', 'changeset_abc_2']);
+  });
+
+  it('keeps an explicit change set boundary', () => {
+    const payload = encodeBatch([{ changeset: [{ method: 'MERGE', url: 'X', body: {} }], boundary: 'cs1' }], { boundary: 'batch_abc' });
+    assert.match(payload.toString(), /boundary=cs1\r\n\r\n--cs1\r\n/);
+  });
+
+  it('sets the Host header of the target backend', () => {
+    const payload = buildBatchPayload(filters, null, { top: 1 }, { host: 'example.com:44300' });
+    assert.match(payload.toString(), /HTTP\/1\.1\r\nHost: example\.com:44300\r\n/);
+  });
+});
@@ -0,0 +1,105 @@
+const { describe, it, before, beforeEach } = require('node:test');
+const assert = require('node:assert');
+const cds = require('@sap/cds');
+const { idempotentRequest, fingerprint } = require('../srv/lib/idempotency');
+const { getStore } = require('../srv/lib/shared-store');
+
+const WINDOW = 50;
+
+const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+
+const jobs = new Map(); // job ID -> status of the JobStatus row
+let queued = 0; // jobs queued by the current test
+
+// Action handler: queues a job and returns its OperationStatus
+async function next() {
+  queued++;
+  const ID = `job-${jobs.size + 1}`;
+  jobs.set(ID, 'QUEUED');
+  return { ID, status: 'QUEUED' };
+}
+
+function request(data, idempotencyKey) {
+  const headers = {};
+  return {
+    event: 'scheduleMassChange',
+    data: { ...data, idempotencyKey },
+    headers,
+    http: { req: { headers: {} }, res: { set: (name, value) => { headers[name] = value; } } },
+    reject: (status, message) => { throw Object.assign(new Error(message), { status }); }
+  };
+}
+
+const change = (plant, value = 'PPCOMFR') => ({
+  filters: { materialStartsWith: 'J01AA', plant, salesOrg: '142', creationDate: '2026-01-13' },
+  fieldsToUpdate: { RequirementSegment: value, Plant: '140A', StorageLocation: 'ROD' }
+});
+
+describe('idempotency', () => {
+  before(() => {
+    cds.env.s4 = { ...cds.env.s4, store: { kind: 'memory' }, idempotency: { window: WINDOW, waitTimeout: 100, pollInterval: 10 } };
+    // JobStatus lookups run in their own transaction, answered from the jobs map
+    cds.tx = async fn => fn({
+      run: async query => {
+        const ID = [...jobs.keys()].find(id => JSON.stringify(query).includes(`"${id}"`));
+        return ID && { status: jobs.get(ID) };
+      }
+    });
+  });
+
+  beforeEach(() => { queued = 0; });
+
+  it('replays the outcome for a repeated idempotency key', async () => {
+    const first = await idempotentRequest(request(change('140A'), 'key-1'), next);
+    const retry = request(change('140A'), 'key-1');
+    const replayed = await idempotentRequest(retry, next);
+    assert.strictEqual(replayed.ID, first.ID);
+    assert.strictEqual(replayed.replayed, true);
+    assert.strictEqual(retry.headers['Idempotent-Replayed'], 'true');
+    assert.strictEqual(queued, 1);
+  });
+
+  it('shares a running call with concurrent duplicates', async () => {
+    const results = await Promise.all([
+      idempotentRequest(request(change('141A'), 'key-2'), next),
+      idempotentRequest(request(change('141A'), 'key-2'), next)
+    ]);
+    assert.strictEqual(results[0].ID, results[1].ID);
+    assert.strictEqual(queued, 1);
+  });
+
+  it('rejects a key reused with different parameters with 422', async () => {
+    await idempotentRequest(request(change('142A'), 'key-3'), next);
+    await assert.rejects(idempotentRequest(request(change('142A', 'OTHER'), 'key-3'), next), error => error.status === 422);
+    assert.strictEqual(queued, 1);
+  });
+
+  it('deduplicates derived keys within the window and while the job is pending', async () => {
+    const first = await idempotentRequest(request(change('143A')), next);
+    assert.strictEqual((await idempotentRequest(request(change('143A')), next)).ID, first.ID);
+
+    await sleep(WINDOW + 10);
+    assert.strictEqual((await idempotentRequest(request(change('143A')), next)).ID, first.ID); // still QUEUED
+
+    jobs.set(first.ID, 'COMPLETED');
+    const again = await idempotentRequest(request(change('143A')), next);
+    assert.notStrictEqual(again.ID, first.ID);
+    assert.strictEqual(queued, 2);
+  });
+
+  it('runs the call again once its job failed', async () => {
+    const first = await idempotentRequest(request(change('144A'), 'key-4'), next);
+    jobs.set(first.ID, 'FAILED');
+    const again = await idempotentRequest(request(change('144A'), 'key-4'), next);
+    assert.notStrictEqual(again.ID, first.ID);
+    assert.strictEqual(again.replayed, undefined);
+  });
+
+  it('takes over a running claim whose lease expired', async () => {
+    const data = change('145A');
+    await getStore().add('idempotency', 'scheduleMassChange:key:key-5', { status: 'RUNNING', hash: fingerprint(data) }, 100);
+    const result = await idempotentRequest(request(data, 'key-5'), next);
+    assert.strictEqual(result.status, 'QUEUED');
+    assert.strictEqual(queued, 1);
+  });
+});
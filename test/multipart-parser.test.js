@@ -0,0 +1,103 @@
+const { describe, it } = require('node:test');
+const assert = require('node:assert');
+const { parseBatchResponse, boundaryOf, BatchPartError } = require('../srv/lib/multipart-parser');
+
+const CONTENT_TYPE = 'multipart/mixed; boundary=batchresp_1';
+
+// $batch response: change set with a 204 and a failed MERGE, then a GET whose
+// body contains the batch delimiter and non-ASCII characters
+const RESPONSE = [
+  '--batchresp_1',
+  'Content-Type: multipart/mixed; boundary=changesetresp_1',
+  '',
+  '--changesetresp_1',
+  'Content-Type: application/http',
+  'Content-Transfer-Encoding: binary',
+  '',
+  'HTTP/1.1 204 No Content',
+  'DataServiceVersion: 1.0',
+  '',
+  '',
+  '--changesetresp_1',
+  'Content-Type: application/http',
+  'Content-Transfer-Encoding: binary',
+  '',
+  'HTTP/1.1 400 Bad Request',
+  'Content-Type: application/json',
+  '',
+  '{"error":{"code":"V1/001","message":{"lang":"en","value":"Plant 999A does not exist"}}}',
+  '--changesetresp_1--',
+  '',
+  '--batchresp_1',
+  'Content-Type: application/http',
+  'Content-Transfer-Encoding: binary',
+  '',
+  'HTTP/1.1 200 OK',
+  'Content-Type: application/json',
+  '',
+  '{"d":{"results":[{"SalesOrder":"1","InternalComment":"moved --batchresp_1 to Größe €"}]}}',
+  '--batchresp_1--',
+  ''
+].join('\r\n');
+
+async function collect(source, contentType = CONTENT_TYPE) {
+  const parts = [];
+  for await (const part of parseBatchResponse(source, contentType)) parts.push(part);
+  return parts;
+}
+
+async function* chunked(text, size) {
+  const buffer = Buffer.from(text);
+  for (let i = 0; i < buffer.length; i += size) yield buffer.subarray(i, i + size);
+}
+
+const summary = parts => parts.map(({ status, data, changeset }) => ({ status, data, changeset }));
+
+describe('multipart parser', () => {
+  it('parses change set and request parts', async () => {
+    const parts = await collect(RESPONSE);
+    assert.deepStrictEqual(parts.map(part => [part.status, part.changeset]), [
+      [204, 'changesetresp_1'],
+      [400, 'changesetresp_1'],
+      [200, null]
+    ]);
+    assert.strictEqual(parts[1].data.error.message.value, 'Plant 999A does not exist');
+    assert.strictEqual(parts[2].data.d.results[0].InternalComment, 'moved --batchresp_1 to Größe €');
+  });
+
+  it('parses the same parts for any chunk size', async () => {
+    const expected = summary(await collect(RESPONSE));
+    for (let size = 1; size <= Buffer.byteLength(RESPONSE); size++) {
+      assert.deepStrictEqual(summary(await collect(chunked(RESPONSE, size))), expected, `chunk size ${size}`);
+    }
+  });
+
+  it('accepts LF-only line endings', async () => {
+    const lf = RESPONSE.replace(/\r\n/g, '\n');
+    const expected = summary(await collect(RESPONSE));
+    assert.deepStrictEqual(summary(await collect(lf)), expected);
+    assert.deepStrictEqual(summary(await collect(chunked(lf, 7))), expected);
+  });
+
+  it('ignores the preamble and anything after the closing delimiter', async () => {
+    const parts = await collect(`preamble\r\n${RESPONSE}epilogue --batchresp_1\r\n`);
+    assert.strictEqual(parts.length, 3);
+  });
+
+  it('describes failed parts with BatchPartError', async () => {
+    const [, failed] = await collect(RESPONSE);
+    const error = new BatchPartError(failed);
+    assert.strictEqual(error.status, 400);
+    assert.match(error.message, /HTTP 400: Plant 999A does not exist/);
+  });
+
+  it('rejects responses that are not multipart', async () => {
+    await assert.rejects(collect('{}', 'application/json'), /not multipart/);
+  });
+
+  it('reads quoted and unquoted boundaries', () => {
+    assert.strictEqual(boundaryOf('multipart/mixed; boundary="a b"'), 'a b');
+    assert.strictEqual(boundaryOf('multipart/mixed;boundary=abc; charset=utf-8'), 'abc');
+    assert.strictEqual(boundaryOf('application/json'), undefined);
+  });
+});
@@ -0,0 +1,81 @@
+const { describe, it, before } = require('node:test');
+const assert = require('node:assert');
+const cds = require('@sap/cds');
+const { resilienceFor, isCircuitOpen, getCircuitBreakerStats, CircuitOpenError } = require('../srv/lib/resilience');
+
+const RESET_TIMEOUT = 50;
+
+const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+const failure = status => Object.assign(new Error(`HTTP ${status}`), { response: { status } });
+
+// Runs fn through the destination's read policy (no timeout, no retries)
+function call(destination, fn) {
+  const [middleware] = resilienceFor(destination, 'read').middleware;
+  return middleware({ fn })();
+}
+
+async function open(destination) {
+  for (let i = 0; i < 3; i++) await assert.rejects(call(destination, () => Promise.reject(failure(503))));
+  assert.ok(isCircuitOpen(destination));
+}
+
+const stats = destination => getCircuitBreakerStats().find(breaker => breaker.destination === destination);
+
+describe('circuit breaker', () => {
+  before(() => {
+    cds.env.s4 = {
+      ...cds.env.s4,
+      resilience: {
+        read: { timeout: 0, retries: 0 },
+        circuitBreaker: { enabled: true, errorThresholdPercentage: 50, volumeThreshold: 3, rollingWindow: 10000, resetTimeout: RESET_TIMEOUT }
+      }
+    };
+  });
+
+  it('opens once the window reaches the volume and error thresholds', async () => {
+    await assert.rejects(call('open', () => Promise.reject(failure(500))));
+    await call('open', async () => 'ok');
+    assert.strictEqual(stats('open').state, 'CLOSED'); // 2 calls, below volumeThreshold
+    await assert.rejects(call('open', () => Promise.reject(failure(502))));
+    assert.strictEqual(stats('open').state, 'OPEN');
+
+    let called = false;
+    await assert.rejects(call('open', async () => { called = true; }), CircuitOpenError);
+    assert.strictEqual(called, false);
+    assert.strictEqual(stats('open').rejected, 1);
+  });
+
+  it('does not count 4xx responses as failures', async () => {
+    for (let i = 0; i < 3; i++) await assert.rejects(call('client', () => Promise.reject(failure(404))));
+    assert.strictEqual(stats('client').state, 'CLOSED');
+    assert.strictEqual(isCircuitOpen('client'), false);
+  });
+
+  it('admits a single half-open probe and closes when it succeeds', async () => {
+    await open('probe');
+    await sleep(RESET_TIMEOUT + 10);
+    assert.strictEqual(isCircuitOpen('probe'), false); // due for a probe
+
+    let finish;
+    const probe = call('probe', () => new Promise(resolve => { finish = resolve; }));
+    assert.strictEqual(stats('probe').state, 'HALF_OPEN');
+    assert.ok(isCircuitOpen('probe'));
+    await assert.rejects(call('probe', async () => 'second'), CircuitOpenError);
+
+    finish('probed');
+    assert.strictEqual(await probe, 'probed');
+    assert.strictEqual(stats('probe').state, 'CLOSED');
+    assert.strictEqual(stats('probe').windowCalls, 0);
+    assert.strictEqual(await call('probe', async () => 'ok'), 'ok');
+    assert.strictEqual(stats('probe').probes, 1);
+  });
+
+  it('opens again when the probe fails', async () => {
+    await open('reopen');
+    await sleep(RESET_TIMEOUT + 10);
+    await assert.rejects(call('reopen', () => Promise.reject(failure(504))), /HTTP 504/);
+    assert.strictEqual(stats('reopen').state, 'OPEN');
+    assert.strictEqual(stats('reopen').opened, 2);
+    await assert.rejects(call('reopen', async () => 'ok'), CircuitOpenError);
+  });
+});
@@ -0,0 +1,43 @@
+const { describe, it } = require('node:test');
+const assert = require('node:assert');
+const { coalesce, getCoalescingStats } = require('../srv/lib/single-flight');
+const { readKey } = require('../srv/lib/read-cache');
+
+const tick = () => new Promise(resolve => setImmediate(resolve));
+
+describe('single-flight', () => {
+  it('shares the leading call with concurrent callers', async () => {
+    let calls = 0;
+    const fn = async () => { calls++; await tick(); return calls; };
+    const results = await Promise.all([coalesce('k', fn), coalesce('k', fn), coalesce('k', fn)]);
+    assert.deepStrictEqual(results, [1, 1, 1]);
+    assert.strictEqual(getCoalescingStats().inFlight, 0);
+    assert.strictEqual(await coalesce('k', fn), 2); // finished calls are not reused
+  });
+
+  it('shares failures and releases the key', async () => {
+    const fn = async () => { await tick(); throw new Error('boom'); };
+    const results = await Promise.allSettled([coalesce('f', fn), coalesce('f', fn)]);
+    assert.deepStrictEqual(results.map(r => r.status), ['rejected', 'rejected']);
+    assert.strictEqual(await coalesce('f', async () => 'ok'), 'ok');
+  });
+
+  it('does not join reads whose filters differ only in case', async () => {
+    const options = { pageSize: 100, select: ['SalesOrder'] };
+    const lower = readKey({ plant: '142a', salesOrg: '142' }, options);
+    const upper = readKey({ plant: '142A', salesOrg: '142' }, options);
+    assert.notStrictEqual(lower, upper);
+
+    const read = plant => async () => { await tick(); return plant; };
+    const results = await Promise.all([coalesce(lower, read('142a')), coalesce(upper, read('142A'))]);
+    assert.deepStrictEqual(results, ['142a', '142A']);
+  });
+
+  it('joins identical reads regardless of select order', () => {
+    const filters = { plant: '142A', salesOrg: '142' };
+    assert.strictEqual(
+      readKey(filters, { select: ['Plant', 'SalesOrder'] }),
+      readKey({ ...filters }, { select: ['SalesOrder', 'Plant'] })
+    );
+  });
+});